@@ -29,6 +29,9 @@ const componentsRoutes = require('./src/routes/componentsRoutes');
 const { startPythonProcess } = require('./src/controllers/chatbotController');
 startPythonProcess();
 
+// 챗봇 월 단위 질문용 거래 월 집계 테이블 (준비가 끝난 뒤 요청을 받음)
+const { ensureMonthlyRollup } = require('./src/config/monthlyRollup');
+
 dotenv.config();
 
 // SSL 인증서 읽기 
@@ -276,6 +279,9 @@ app.use((err, req, res, next) => {
 });
 
 const PORT = process.env.PORT || 5000;
-server.listen(PORT, () => {
-  console.log(`Server running on port ${PORT}`);
+// 집계 테이블을 준비하는 동안 거래가 추가되지 않도록 준비가 끝난 뒤 요청을 받음 (실패해도 집계 없이 시작)
+ensureMonthlyRollup().then(() => {
+  server.listen(PORT, () => {
+    console.log(`Server running on port ${PORT}`);
+  });
 });
@@ -0,0 +1,17 @@
+"""
+unified_script.py 검증/성능 측정 모음
+
+추론 데몬이 불러오지 않도록 unified_script.py 밖에 두며, 스크립트 폴더(server/src/Algorithm/script)에서 실행합니다.
+
+    python -m checks                      # 기본 검증 전체 (CHECKS)
+    python -m checks classifier           # 이름을 지정한 항목만 (OPTIONAL의 성능 측정 등 포함)
+
+각 항목은 {"passed": bool, ...} 결과를 반환하며, 하나라도 실패하면 종료 코드 1로 끝납니다.
+"""
+import os
+import sys
+
+# 검증 모듈이 unified_script를 불러올 수 있도록 스크립트 폴더를 import 경로에 추가
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
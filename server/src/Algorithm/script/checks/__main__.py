@@ -0,0 +1,48 @@
+"""python -m checks [이름 ...]: 검증/성능 측정을 실행하고 결과를 JSON으로 출력합니다."""
+import argparse
+import json
+import sys
+
+from checks import answers, classifier, dates, matcher, queries, results, stores
+
+# 이름 -> 결과({"passed": bool, ...})를 반환하는 함수
+CHECKS = {
+    'classifier': classifier.check_classifier_parity,
+    'keyword_cascade': classifier.check_keyword_cascade,
+    'dates': dates.check_date_grammar,
+    'monthly_rollup': queries.check_monthly_rollup,
+    'query_plans': queries.check_query_plans,
+    'bound_queries': queries.check_bound_queries,
+    'result_dates': results.check_result_dates,
+    'transaction_store': stores.check_transaction_store,
+    'stock_index': stores.check_stock_index,
+    'stock_summary': answers.check_stock_summary,
+    'holdings_index': stores.check_holdings_index,
+}
+# 산출물(모델 파일 등)이 있어야 하거나 오래 걸려서 이름을 지정했을 때만 실행
+OPTIONAL = {
+    'onnx': classifier.check_onnx_parity,
+    'keyword_cascade_model': classifier.check_keyword_cascade_model,
+    'benchmark_matcher': matcher.benchmark_keyword_matcher,
+    'benchmark_dates': dates.benchmark_date_grammar,
+    'benchmark_result_dates': results.benchmark_result_dates,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m checks', description='unified_script.py 검증/성능 측정')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help=f"실행할 항목 (기본: {', '.join(CHECKS)} / 선택: {', '.join(OPTIONAL) or '-'})")
+    args = parser.parse_args(argv)
+    runners = {**CHECKS, **OPTIONAL}
+    unknown = [name for name in args.names if name not in runners]
+    if unknown:
+        parser.error(f"알 수 없는 항목: {', '.join(unknown)}")
+
+    reports = {name: runners[name]() for name in args.names or CHECKS}
+    print(json.dumps(reports, ensure_ascii=False, indent=2, default=str), flush=True)
+    return 0 if all(report.get('passed') for report in reports.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
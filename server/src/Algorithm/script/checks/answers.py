@@ -0,0 +1,47 @@
+"""답변 문장 생성 검증 (긴 기간 주가 요약)"""
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from unified_script import generate_stock_price_response, kst, stock_summary_granularity, summarize_stock_ohlc
+
+
+def check_stock_summary(seed=3):
+    """
+    주/월/연 요약의 시가/고가/저가/종가를 행 단위 반복 계산과 비교하고,
+    기간이 길어져도 요약 답변의 줄 수가 묶음 수 이내로 유지되는지 확인합니다.
+    """
+    generator = random.Random(seed)
+    today = datetime.now(kst).date()
+    results, passed = [], True
+    for span_days in (20, 90, 365, 3 * 365, 8 * 365):
+        days = [today - timedelta(days=i) for i in range(1, span_days + 1)]
+        days = [day for day in days if day.weekday() < 5 and generator.random() > 0.03]
+        rows = [{'fd_date': day.strftime('%Y-%m-%d'), 'sc_ss_stock': round(generator.uniform(50000, 90000))} for day in days]
+        # NULL 가격(휴장 등)도 섞어서 제외되는지 확인
+        rows += [{'fd_date': days[0].strftime('%Y-%m-%d'), 'sc_ss_stock': None}] if len(days) > 2 else []
+        answer = generate_stock_price_response(rows, '삼성전자')
+
+        granularity = stock_summary_granularity((days[0] - days[-1]).days + 1)
+        same = True
+        if granularity:
+            dates = np.array([row['fd_date'] for row in rows if row['sc_ss_stock'] is not None], dtype='datetime64[D]')
+            prices = np.array([row['sc_ss_stock'] for row in rows if row['sc_ss_stock'] is not None], dtype=np.float64)
+            ohlc = summarize_stock_ohlc(dates, prices, granularity)
+            # 기준: 날짜순으로 하나씩 묶음에 넣는 반복 계산
+            reference = {}
+            for day, price in sorted((datetime.strptime(row['fd_date'], '%Y-%m-%d').date(), row['sc_ss_stock']) for row in rows if row['sc_ss_stock'] is not None):
+                key = (day - timedelta(days=day.weekday()) if granularity == 'week'
+                       else day.replace(day=1) if granularity == 'month' else day.replace(month=1, day=1))
+                item = reference.setdefault(key, [price, price, price, price])
+                item[1], item[2], item[3] = max(item[1], price), min(item[2], price), price
+            same = [period.item() for period in ohlc['period']] == list(reference) and all(
+                np.array_equal(ohlc[name], [item[i] for item in reference.values()]) for i, name in enumerate(('open', 'high', 'low', 'close')))
+        lines = answer.count('\n') + 1
+        # 머리말 + 묶음 최대 27주/25개월 + 기간 전체 줄
+        bounded = granularity is None or lines <= 30
+        passed = passed and same and bounded
+        results.append({"span_days": span_days, "rows": len(rows), "granularity": granularity or 'day',
+                        "same_ohlc": same, "answer_lines": lines, "answer_chars": len(answer)})
+    return {"passed": passed, "results": results}
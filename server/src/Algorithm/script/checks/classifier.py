@@ -0,0 +1,142 @@
+"""의도 분류기 검증 (패딩 방식, ONNX 백엔드, 키워드 1단계 분류)"""
+import os
+import time
+
+import torch
+
+from unified_script import (
+    ONNX_INT8_MODEL_PATH, ONNX_MODEL_PATH, OnnxClassifier, classifier_logits, intent_cascade, keyword_classifier, label_map,
+    labeled_sample_questions, predict_label, processe_text, resources, sample_questions,
+)
+
+
+def check_classifier_parity(texts=None):
+    """
+    고정 512 토큰 패딩(기존 방식)과 길이 기반 패딩의 분류 결과가 같은지 확인합니다.
+
+    Returns:
+    - dict: 일치 여부, 불일치 문장, 로짓 최대 오차, 두 방식의 소요 시간(ms)
+    """
+    texts = texts or sample_questions
+    model, tokenizer = resources.get('classifier'), resources.get('tokenizer')
+
+    started = time.perf_counter()
+    fixed = torch.cat([classifier_logits([text], model, tokenizer, padding="max_length", max_length=512) for text in texts])
+    fixed_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    dynamic = torch.cat([classifier_logits([text], model, tokenizer) for text in texts])
+    dynamic_ms = (time.perf_counter() - started) * 1000
+
+    fixed_labels = [label_map[pred] for pred in torch.argmax(fixed, dim=-1).tolist()]
+    dynamic_labels = [label_map[pred] for pred in torch.argmax(dynamic, dim=-1).tolist()]
+    mismatches = [
+        {"text": text, "fixed": a, "dynamic": b}
+        for text, a, b in zip(texts, fixed_labels, dynamic_labels) if a != b
+    ]
+    return {
+        "passed": not mismatches,
+        "samples": len(texts),
+        "mismatches": mismatches,
+        "max_logit_diff": float((fixed - dynamic).abs().max()),
+        "fixed_ms": round(fixed_ms, 1),
+        "dynamic_ms": round(dynamic_ms, 1),
+    }
+
+
+def check_onnx_parity(texts=None):
+    """
+    고정 질문 목록에서 ONNX(및 int8 양자화) 모델의 라벨과 로짓을 PyTorch 결과와 비교합니다.
+    fp32 모델은 라벨 일치와 로짓 오차 1e-3 이하, int8 모델은 라벨 일치를 통과 기준으로 합니다.
+    """
+    texts = texts or sample_questions
+    model, tokenizer = resources.get('classifier'), resources.get('tokenizer')
+    reference = classifier_logits(texts, model, tokenizer)
+    reference_labels = torch.argmax(reference, dim=-1).tolist()
+
+    report = {"passed": True, "samples": len(texts), "backends": {}}
+    for name, path, tolerance in (("onnx", ONNX_MODEL_PATH, 1e-3), ("onnx_int8", ONNX_INT8_MODEL_PATH, None)):
+        if not os.path.exists(path):
+            continue
+        onnx_model = OnnxClassifier(path)
+        started = time.perf_counter()
+        logits = classifier_logits(texts, onnx_model, tokenizer)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        labels = torch.argmax(logits, dim=-1).tolist()
+        mismatches = [text for text, a, b in zip(texts, reference_labels, labels) if a != b]
+        max_diff = float((reference - logits).abs().max())
+        passed = not mismatches and (tolerance is None or max_diff <= tolerance)
+        report["passed"] = report["passed"] and passed
+        report["backends"][name] = {
+            "passed": passed,
+            "label_mismatches": mismatches,
+            "max_logit_diff": max_diff,
+            "elapsed_ms": round(elapsed_ms, 1),
+        }
+
+    if not report["backends"]:
+        report["passed"] = False
+        report["error"] = "비교할 ONNX 모델 파일이 없습니다. python unified_script.py --export-onnx로 먼저 생성하세요."
+    return report
+
+
+# 보유 수량/매매 질문: 종목 이름이 stock 키워드와 겹쳐도 finance(주식내역 쿼리)로 바로 결정되어야 함
+HOLDINGS_QUESTIONS = ["지금 삼성전자 몇 주 있어", "삼성전자 주식 몇 주 있어", "작년에 산 삼성전자", "보유 주식 내역"]
+
+
+def keyword_decisions(texts, threshold):
+    """1단계 키워드 분류기의 (문장, 라벨, 신뢰도, 바로 결정 여부) 목록"""
+    decisions = []
+    for text in texts:
+        label, confidence = keyword_classifier.predict(text)
+        decisions.append({"text": text, "keyword": label, "confidence": round(confidence, 4),
+                          "short_circuited": label is not None and confidence >= threshold})
+    return decisions
+
+
+def check_keyword_cascade(samples=None, threshold=None):
+    """
+    라벨별 예시 질문에서 1단계 키워드 분류기가 바로 결정한(2단계 모델을 건너뛴) 라벨이 모두 예시의 라벨과 같은지,
+    보유 수량/매매 질문이 finance로 바로 결정되는지 확인합니다. (키워드만 사용하므로 모델 가중치 없이 실행)
+    """
+    samples = samples or labeled_sample_questions
+    threshold = intent_cascade.threshold if threshold is None else threshold
+    results = [{**decision, "label": label}
+               for label, texts in samples.items() for decision in keyword_decisions(texts, threshold)]
+    decided = [result for result in results if result["short_circuited"]]
+    wrong = [result for result in decided if result["keyword"] != result["label"]]
+    holdings = keyword_decisions(HOLDINGS_QUESTIONS, threshold)
+    holdings_ok = all(result["short_circuited"] and result["keyword"] == 'finance' for result in holdings)
+    return {
+        "passed": not wrong and holdings_ok,
+        "threshold": threshold,
+        "samples": len(results),
+        "short_circuited": {label: sum(result["label"] == label for result in decided) for label in samples},
+        "wrong": wrong,
+        "holdings": holdings,
+    }
+
+
+def check_keyword_cascade_model(texts=None, threshold=None, min_agreement=0.95):
+    """
+    1단계 키워드 분류기가 바로 결정한 질문에서 그 라벨이 2단계 모델(predict_label)의 라벨과 얼마나 일치하는지 측정합니다.
+    (모델 가중치가 필요)
+    """
+    texts = texts or sample_questions
+    threshold = intent_cascade.threshold if threshold is None else threshold
+    model, tokenizer = resources.get('intent_model'), resources.get('tokenizer')
+
+    decided = [decision for decision in keyword_decisions([processe_text(text) for text in texts], threshold)
+               if decision["short_circuited"]]
+    for decision in decided:
+        decision["model"] = predict_label(decision["text"], model, tokenizer)
+    agreement = sum(decision["keyword"] == decision["model"] for decision in decided) / len(decided) if decided else 1.0
+    return {
+        "passed": agreement >= min_agreement,
+        "threshold": threshold,
+        "samples": len(texts),
+        "short_circuited": len(decided),
+        "agreement": round(agreement, 4),
+        "mismatches": [decision for decision in decided if decision["keyword"] != decision["model"]],
+    }
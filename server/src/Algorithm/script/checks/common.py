@@ -0,0 +1,101 @@
+"""SQLite에 대용 테이블을 두고 DB 조회 결과와 메모리 색인의 계산 결과를 비교하는 검증들이 함께 쓰는 도구"""
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from unified_script import KST_OFFSET_HOURS, MONTHLY_ROLLUP_TABLE, ResultRows, render_answers
+
+
+def build_sqlite(table_sql, insert_sql, rows):
+    """메모리 SQLite에 대용 테이블을 만들고 행을 넣은 뒤 (connection, fetch)를 반환합니다."""
+    connection = sqlite3.connect(':memory:')
+    # MariaDB의 GREATEST/LEAST와 같이 인자에 NULL이 있으면 NULL
+    connection.create_function('GREATEST', 2, lambda a, b: None if a is None or b is None else max(a, b), deterministic=True)
+    connection.create_function('LEAST', 2, lambda a, b: None if a is None or b is None else min(a, b), deterministic=True)
+    connection.execute(table_sql)
+    connection.executemany(insert_sql, rows)
+    return connection, sqlite_fetch(connection)
+
+
+def sqlite_fetch(connection):
+    """
+    바인딩 쿼리의 (sql, params)를 SQLite에서 실행하는 함수를 만듭니다.
+    SQLite 결과의 날짜는 이미 'YYYY-MM-DD'이므로 변환을 마친 결과(ResultRows)로 반환합니다.
+    """
+    def fetch(sql, params=()):
+        cursor = connection.execute(sql.rstrip().rstrip(';'), params)
+        names = [column[0] for column in cursor.description]
+        return ResultRows(dict(zip(names, row)) for row in cursor.fetchall())
+    return fetch
+
+
+def compare_with_db(cases, evaluate, fetch, same):
+    """
+    경우마다 메모리 보관 데이터로 계산한 결과와 DB 조회 결과를 비교하고, 걸린 시간과 불일치를 모읍니다.
+    evaluate가 None을 반환하면(메모리에서 계산할 수 없어 DB 조회로 대체) 비교하지 않고 fallbacks에 남깁니다.
+
+    Args:
+    - cases: (결과에 남길 정보 dict, 입력) 목록
+    - evaluate(입력), fetch(입력): 메모리 계산 결과 / DB 조회 결과
+    - same(정보, 메모리 결과, DB 결과): 두 결과가 같으면 True
+
+    Returns:
+    - dict: passed(비교한 경우가 있고 모두 같음), compared, fallbacks, db_ms, local_ms, mismatches(최대 20개)
+    """
+    compared, fallbacks, db_seconds, local_seconds = [], [], 0.0, 0.0
+    for info, value in cases:
+        started = time.perf_counter()
+        local = evaluate(value)
+        local_seconds += time.perf_counter() - started
+        if local is None:
+            fallbacks.append(info)
+            continue
+        started = time.perf_counter()
+        remote = fetch(value)
+        db_seconds += time.perf_counter() - started
+        compared.append({**info, "same": same(info, local, remote)})
+    return {
+        "passed": bool(compared) and all(result["same"] for result in compared),
+        "compared": len(compared),
+        "fallbacks": fallbacks[:20],
+        "db_ms": round(db_seconds * 1e3, 2),
+        "local_ms": round(local_seconds * 1e3, 2),
+        "mismatches": [result for result in compared if not result["same"]][:20],
+    }
+
+
+def node_columnar(rows, names, date_column):
+    """행 목록을 Node가 보내는 형태(열 단위, 날짜는 KST 자정의 UTC ISO 문자열)로 바꿉니다."""
+    def utc(day):
+        return (datetime.strptime(day, '%Y-%m-%d') - timedelta(hours=KST_OFFSET_HOURS)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    return {'columns': list(names), 'values': [[utc(row[name]) if name == date_column else row[name] for row in rows] for name in names]}
+
+
+def render_or_error(results, text):
+    """답변을 만듭니다. 기존 답변 생성에서 오류가 나는 키(예: 적금_sum)는 오류 종류까지 같아야 같은 답변으로 봅니다."""
+    try:
+        return render_answers(results, text)
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+
+
+def build_sqlite_monthly_rollup(connection):
+    """로컬 SQLite의 tb_received_paid로 월 집계 테이블을 만듭니다. (config/monthlyRollup.js의 rebuild와 같은 계산)"""
+    connection.execute(f"""
+        CREATE TABLE {MONTHLY_ROLLUP_TABLE} (
+            user_id INTEGER, rp_month DATE, rp_part INTEGER, rp_hold INTEGER, rp_detail TEXT,
+            rp_count INTEGER, rp_total REAL, rp_max INTEGER, rp_max_date DATE, rp_min INTEGER, rp_min_date DATE,
+            PRIMARY KEY (user_id, rp_month, rp_part, rp_hold, rp_detail))
+    """)
+    connection.execute(f"""
+        INSERT INTO {MONTHLY_ROLLUP_TABLE}
+        SELECT user_id, rp_month, rp_part, rp_hold, rp_detail, COUNT(*), SUM(rp_amount),
+               MAX(rp_amount), MIN(CASE WHEN max_rank = 1 THEN rp_date END),
+               MIN(rp_amount), MIN(CASE WHEN min_rank = 1 THEN rp_date END)
+        FROM (
+            SELECT *, strftime('%Y-%m-01', rp_date) AS rp_month,
+                   RANK() OVER (PARTITION BY user_id, strftime('%Y-%m', rp_date), rp_part, rp_hold, rp_detail ORDER BY rp_amount DESC) AS max_rank,
+                   RANK() OVER (PARTITION BY user_id, strftime('%Y-%m', rp_date), rp_part, rp_hold, rp_detail ORDER BY rp_amount ASC) AS min_rank
+            FROM tb_received_paid
+        ) GROUP BY user_id, rp_month, rp_part, rp_hold, rp_detail
+    """)
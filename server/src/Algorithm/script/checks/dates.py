@@ -0,0 +1,64 @@
+"""날짜 표현 스캐너(DateGrammar) 검증 및 성능 측정"""
+import re
+import time
+
+from unified_script import DATE_UNIT_GROUPS, date_grammar, date_unit_patterns, replace_with_pattern_keys, sample_questions
+
+
+def classify_date_units_reference(text):
+    """치환된 텍스트에 포함된 날짜 단위를 패턴마다 re.search로 확인합니다. (DateGrammar 검증용 기준 구현)"""
+    return {unit for unit in DATE_UNIT_GROUPS if any(re.search(pattern, text) for pattern in date_unit_patterns(unit))}
+
+
+def date_grammar_corpus():
+    """
+    DateGrammar 검증용 입력: 날짜 어휘와 숫자 표현을 단독/조사/접두어와 조합하고, 두 표현을 이어 붙인 문장과 샘플 질문을 포함합니다.
+    """
+    literals = sorted(date_grammar.vocabulary) + ['3월', '12월', '2024년', '24년', '3개월', '2분기', '15일', '1주차', '11주차', '3일 전', '2년 후']
+    prefixes = ['', '지난 ', '이번 ', '1', '올해 ']
+    suffixes = ['', '에', '부터', '까지', '의', '말', ' 지출', '달']
+    corpus = {prefix + literal + suffix for literal in literals for prefix in prefixes for suffix in suffixes}
+    corpus |= {first + joiner + second for first in literals for second in literals for joiner in ('', ' ', '부터 ')}
+    corpus |= set(sample_questions)
+    return sorted(corpus)
+
+
+def check_date_grammar(texts=None):
+    """
+    DateGrammar의 치환 결과와 날짜 단위 분류가 기존 구현(순차 re.sub + 패턴별 re.search)과 같은지 비교합니다.
+    extract_date_info의 나머지 처리는 이 두 값에만 의존하므로, 두 값이 같으면 날짜 추출 결과도 같습니다.
+    """
+    texts = texts or date_grammar_corpus()
+    mismatches = []
+    for text in texts:
+        expected_text = replace_with_pattern_keys(text)
+        expected = (expected_text, classify_date_units_reference(expected_text))
+        actual = date_grammar.scan(text)
+        if actual != expected:
+            mismatches.append({"text": text, "expected": [expected[0], sorted(expected[1])], "actual": [actual[0], sorted(actual[1])]})
+    return {"passed": not mismatches, "samples": len(texts), "mismatches": mismatches[:50]}
+
+
+def benchmark_date_grammar(repeat=200):
+    """기존 구현과 DateGrammar의 질문당 날짜 표현 치환+분류 시간(us)을 비교합니다."""
+    texts = sample_questions + [question.split(' ')[0] for question in sample_questions]
+
+    def reference(text):
+        text = replace_with_pattern_keys(text)
+        return text, classify_date_units_reference(text)
+
+    timings = {}
+    for name, func in (("reference", reference), ("grammar", date_grammar.scan)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                func(text)
+        timings[name] = (time.perf_counter() - started) / (repeat * len(texts)) * 1e6
+
+    report = check_date_grammar(texts)
+    report.update({
+        "reference_us_per_text": round(timings["reference"], 2),
+        "grammar_us_per_text": round(timings["grammar"], 2),
+        "speedup": round(timings["reference"] / timings["grammar"], 1),
+    })
+    return report
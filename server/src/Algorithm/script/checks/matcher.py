@@ -0,0 +1,61 @@
+"""키워드 매처(KeywordMatcher) 성능 측정"""
+import random
+import re
+import time
+
+from unified_script import KeywordMatcher, clean_finance_text, finance_matcher_entries, sample_questions
+
+
+def benchmark_keyword_matcher(vocab_sizes=(100, 1000, 5000, 20000), repeat=20, seed=0):
+    """
+    키워드 수를 늘려 가며 기존 방식(토큰마다 라벨별 re.search)과 KeywordMatcher의 토큰당 처리 시간을 비교합니다.
+    추가 키워드는 finance 패턴의 라벨에 무작위 한글 동의어를 덧붙여 만들며, 두 방식의 라벨 결과가 하나라도 다르면 실패로 보고합니다.
+
+    Returns:
+    - dict: 통과 여부, 키워드 수별 생성 시간(ms)과 토큰당 처리 시간(us)
+    """
+    rng = random.Random(seed)
+    base_entries = finance_matcher_entries()
+    base_tokens = [clean_finance_text(word) for question in sample_questions for word in question.split()]
+    report = {"passed": True, "mismatches": [], "results": []}
+
+    for size in vocab_sizes:
+        entries = [[label, pattern] for label, pattern in base_entries]
+        synonyms = []
+        for _ in range(max(0, size - len(KeywordMatcher(base_entries).keywords))):
+            synonym = ''.join(chr(rng.randint(0xAC00, 0xD7A3)) for _ in range(rng.randint(2, 4)))
+            entries[rng.randrange(len(entries))][1] += '|' + synonym
+            synonyms.append(synonym)
+        tokens = base_tokens + rng.sample(synonyms, min(len(synonyms), len(base_tokens)))
+
+        started = time.perf_counter()
+        matcher = KeywordMatcher(entries)
+        build_ms = (time.perf_counter() - started) * 1000
+        compiled = [re.compile(pattern) for _, pattern in entries]
+
+        def regex_label(token):
+            return next((index for index, regex in enumerate(compiled) if regex.search(token)), None)
+
+        def matcher_label(token):
+            return min(matcher.labels_in(token), default=None)
+
+        for token in tokens:
+            if regex_label(token) != matcher_label(token):
+                report["passed"] = False
+                report["mismatches"].append({"vocabulary": size, "token": token})
+
+        timings = {}
+        for name, func in (("regex", regex_label), ("matcher", matcher_label)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                for token in tokens:
+                    func(token)
+            timings[name] = (time.perf_counter() - started) / (repeat * len(tokens)) * 1e6
+
+        report["results"].append({
+            "vocabulary": len(matcher.keywords),
+            "build_ms": round(build_ms, 2),
+            "regex_us_per_token": round(timings["regex"], 2),
+            "matcher_us_per_token": round(timings["matcher"], 2),
+        })
+    return report
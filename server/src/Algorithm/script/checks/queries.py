@@ -0,0 +1,176 @@
+"""쿼리 빌더가 만드는 SQL 검증 (날짜 범위 조건, 바인딩, 월 집계 테이블)"""
+import random
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from checks.common import build_sqlite_monthly_rollup
+from unified_script import (
+    MONTHLY_ROLLUP_TABLE, NOT_FOUND_MESSAGE, DateRangeSet, bind_query, convert_relative_months, convert_relative_years,
+    create_query_message, date_range_condition, generate_query_expend, generate_query_rollup, get_all_dates_between, kst,
+    make_answer, process_date_format, process_month_format, sample_questions, sql_join,
+)
+
+
+def check_query_plans(users=20, years=3):
+    """
+    로컬 SQLite에 tb_received_paid / tb_stock 대용 테이블과 (user_id, rp_date), fd_date 인덱스를 만든 뒤,
+    기존 날짜 조건(LIKE OR 체인, IN 목록)과 범위 조건의 실행 계획(EXPLAIN QUERY PLAN)과 조회 결과를 비교합니다.
+    """
+    today = datetime.now(kst).date()
+    first_day = datetime(today.year - years + 1, 1, 1).date()
+    days = [(first_day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((today - first_day).days + 1)]
+
+    connection = sqlite3.connect(':memory:')
+    connection.executescript("""
+        CREATE TABLE tb_received_paid (user_id INTEGER, rp_date DATE, rp_detail TEXT, rp_amount INTEGER, rp_hold INTEGER, rp_part INTEGER);
+        CREATE INDEX idx_received_paid_user_date ON tb_received_paid (user_id, rp_date);
+        CREATE TABLE tb_stock (fd_date DATE PRIMARY KEY, sc_ss_stock REAL, sc_ap_stock REAL, sc_coin REAL);
+    """)
+    generator = random.Random(0)
+    connection.executemany("INSERT INTO tb_received_paid VALUES (?, ?, '카드', ?, 0, ?)", [
+        (user_id, day, generator.randint(1000, 100000), generator.randint(0, 1))
+        for user_id in range(1, users + 1) for day in days for _ in range(2)
+    ])
+    connection.executemany("INSERT INTO tb_stock VALUES (?, ?, ?, ?)", [
+        (day, generator.uniform(50000, 90000), generator.uniform(100, 250), generator.uniform(20000, 90000)) for day in days
+    ])
+    connection.execute("ANALYZE")
+
+    def legacy_condition(column, dates):
+        # 기존 process_date_format / stockpricequery가 만들던 형식
+        if len(dates[0]) == 10:
+            return f"{column} IN (" + ", ".join(f"'{date}'" for date in dates) + ")"
+        return "(" + " OR ".join(f"{column} LIKE '{date}%'" for date in dates) + ")"
+
+    def plan(sql, params=()):
+        return " / ".join(row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+    periods = {
+        "이번달": convert_relative_months('이번달'),
+        "작년": convert_relative_years('작년'),
+        "2분기": convert_relative_months('2분기', time=True, year=today.year - 1),
+        "작년부터 이번달까지": get_all_dates_between(str(today.year - 1), today.strftime('%Y-%m')),
+    }
+    templates = {
+        "tb_received_paid": ("rp_date", "SELECT COUNT(*), SUM(rp_amount) FROM tb_received_paid WHERE user_id = 3 AND rp_part = 1 AND {condition}"),
+        "tb_stock": ("fd_date", "SELECT COUNT(*), SUM(sc_ss_stock) FROM tb_stock WHERE {condition}"),
+    }
+
+    results, passed = [], True
+    for name, dates in periods.items():
+        for table, (column, template) in templates.items():
+            # tb_stock은 기존에도 일 단위 IN 목록만 만들었으므로 같은 날짜들을 일 단위로 펼쳐 비교
+            before_dates = DateRangeSet.covering(dates).expand() if table == "tb_stock" else list(dates)
+            before = template.format(condition=legacy_condition(column, before_dates))
+            condition, params = date_range_condition(column, dates)
+            after = template.format(condition=condition)
+            same_result = connection.execute(before).fetchall() == connection.execute(after, params).fetchall()
+            after_plan = plan(after, params)
+            range_scan = f"{column}>?" in after_plan and f"{column}<?" in after_plan
+            passed = passed and same_result and range_scan
+            results.append({
+                "period": name, "table": table, "same_result": same_result, "range_scan": range_scan,
+                "before_plan": plan(before), "after_plan": after_plan,
+                "before_sql_chars": len(before), "after_sql_chars": len(after),
+            })
+    connection.close()
+    return {"passed": passed, "results": results}
+
+
+def check_bound_queries(texts=None, user_ids=(7, 42)):
+    """
+    샘플 질문의 쿼리를 사용자별로 바인딩하여 자리표시자 수와 바인딩 값 수가 같은지,
+    문장에 리터럴/사용자 ID가 남지 않는지, 사용자가 달라도 같은 문장이 되는지 확인합니다.
+    """
+    texts = texts or sample_questions
+    problems, statements, bound = [], set(), 0
+    for text in texts:
+        per_user = []
+        for user_id in user_ids:
+            query, _ = create_query_message(text, user_id)
+            per_user.append({key: value for key, value in query.items() if isinstance(value, dict)})
+        for key, value in per_user[0].items():
+            bound += 1
+            statements.add(value["sql"])
+            if value["sql"].count('?') != len(value["params"]) or re.search(r"['\"{}]", value["sql"]):
+                problems.append({"text": text, "key": key, "sql": value["sql"]})
+            if any(other.get(key, {}).get("sql") != value["sql"] for other in per_user[1:]):
+                problems.append({"text": text, "key": key, "reason": "사용자별 문장이 다름"})
+    return {"passed": not problems, "queries": bound, "statements": len(statements), "problems": problems[:20]}
+
+
+def check_monthly_rollup(users=5, years=2):
+    """
+    로컬 SQLite에 거래 테이블과 같은 방식으로 만든 월 집계 테이블을 두고,
+    월 단위 기간의 합계/평균/최고/최저/자주 쿼리가 거래 테이블 쿼리와 같은 답변을 만드는지 비교합니다.
+    """
+    today = datetime.now(kst).date()
+    first_day = datetime(today.year - years + 1, 1, 1).date()
+    days = [(first_day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((today - first_day).days + 1)]
+
+    connection = sqlite3.connect(':memory:')
+    connection.execute("CREATE TABLE tb_received_paid (user_id INTEGER, rp_date DATE, rp_detail TEXT, rp_amount INTEGER, rp_hold INTEGER, rp_part INTEGER)")
+    generator = random.Random(0)
+    details = ['식비', '교통', '월세', '쇼핑', '통신', '입금', '출금']
+    rows = [
+        (user_id, day, generator.choice(details), generator.randint(0, 1), generator.randint(0, 1))
+        for user_id in range(1, users + 1) for day in days for _ in range(generator.randint(0, 3))
+    ]
+    # 최고/최저 거래가 하나로 정해지도록 금액은 서로 다르게 생성
+    amounts = generator.sample(range(1000, 10_000_000), len(rows))
+    connection.executemany("INSERT INTO tb_received_paid VALUES (?, ?, ?, ?, ?, ?)", [
+        (user_id, day, detail, amount, hold, part) for (user_id, day, detail, hold, part), amount in zip(rows, amounts)
+    ])
+    build_sqlite_monthly_rollup(connection)
+
+    def answer(query, backword_key, user_id):
+        bound = bind_query(query, user_id)
+        cursor = connection.execute(bound['sql'].rstrip(';'), bound['params'])
+        names = [column[0] for column in cursor.description]
+        data = [dict(zip(names, row)) for row in cursor.fetchall()]
+        if not data or (backword_key in ('sum', 'avg') and list(data[0].values())[0] is None):
+            return NOT_FOUND_MESSAGE
+        return make_answer(data, '지출', backword_key, '')
+
+    periods = {
+        "이번달": [today.strftime('%Y-%m')],
+        "작년": [str(today.year - 1)],
+        "2분기": convert_relative_months('2분기', time=True, year=today.year - 1),
+        "작년 1월부터 지난달까지": get_all_dates_between(f'{today.year - 1}-01', (today - relativedelta(months=1)).strftime('%Y-%m')),
+    }
+    base_queries = {
+        'sum': lambda part, add_query, date_query: sql_join(f'SELECT SUM(rp_amount) as Total_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = {part} {add_query} ', date_query),
+        'avg': lambda part, add_query, date_query: sql_join(f'SELECT AVG(rp_amount) as Average_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = {part} {add_query} ', date_query),
+    }
+
+    results, passed = [], True
+    for name, dates in periods.items():
+        date_query, month_query = process_date_format(dates), process_month_format(dates)
+        for query_type in ('sum', 'avg', 'highest', 'lowest', 'frequent'):
+            for add_query in ('', 'AND rp_hold = 0'):
+                if query_type in base_queries:
+                    before = base_queries[query_type](1, add_query, date_query)
+                    after = generate_query_rollup(1, add_query, month_query, query_type)
+                else:
+                    before = generate_query_expend(None, 1, add_query, date_query, query_type)
+                    after = generate_query_expend(None, 1, add_query, date_query, query_type, month_query)
+                same = all(answer(before, query_type, user_id) == answer(after, query_type, user_id) for user_id in range(1, users + 1))
+                uses_rollup = MONTHLY_ROLLUP_TABLE in after[0]
+                passed = passed and same and uses_rollup
+                results.append({"period": name, "query_type": query_type, "fixed": bool(add_query), "same_answer": same, "uses_rollup": uses_rollup})
+
+    # 월 단위로 나누어떨어지지 않는 기간(오늘, 작년부터 오늘까지)은 거래 테이블을 그대로 사용
+    partial_periods = [[today.strftime('%Y-%m-%d')], get_all_dates_between(str(today.year - 1), today.strftime('%Y-%m'))]
+    passed = passed and all(process_month_format(dates) is None for dates in partial_periods)
+
+    # Node가 집계 테이블을 준비하지 못해 monthly_rollup: false를 보내면 거래 테이블만 조회
+    switchable = all((MONTHLY_ROLLUP_TABLE in str(create_query_message('작년 지출 합계 알려줘', 1, monthly_rollup=enabled)[0])) == enabled
+                     for enabled in (True, False))
+    passed = passed and switchable
+
+    rollup_rows = connection.execute(f"SELECT COUNT(*) FROM {MONTHLY_ROLLUP_TABLE}").fetchone()[0]
+    connection.close()
+    return {"passed": passed, "transactions": len(rows), "rollup_rows": rollup_rows, "switchable": switchable, "results": results}
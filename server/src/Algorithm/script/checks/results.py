@@ -0,0 +1,91 @@
+"""쿼리 결과(행 객체/열 단위)의 날짜 변환 검증 및 성능 측정"""
+import copy
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from unified_script import RESULT_DATE_COLUMNS, decode_query_result, kst
+
+
+def convert_result_dates_reference(query_result):
+    """행마다 strptime과 pytz로 변환하던 기존 구현. check_result_dates의 비교 기준으로만 사용합니다."""
+    for entry in query_result:
+        if 'rp_date' in entry:
+            query_time = datetime.strptime(entry['rp_date'], "%Y-%m-%dT%H:%M:%S.%fZ")
+            korea_time = query_time.replace(tzinfo=pytz.utc).astimezone(kst)
+            entry['rp_date'] = korea_time.strftime("%Y-%m-%d")
+        elif 'fd_date' in entry:
+            query_time = datetime.strptime(entry['fd_date'], "%Y-%m-%dT%H:%M:%S.%fZ")
+            korea_time = query_time.replace(tzinfo=pytz.utc).astimezone(kst)
+            entry['fd_date'] = korea_time.strftime("%Y-%m-%d")
+    return query_result
+
+
+def result_date_corpus(size=5000, seed=0):
+    """자정 전후(UTC 15시 = KST 자정)와 연말을 포함한 임의의 거래 행을 만듭니다."""
+    rng = random.Random(seed)
+    start = datetime(2019, 1, 1)
+    rows = []
+    for i in range(size):
+        moment = start + timedelta(days=rng.randrange(2200), hours=rng.choice([0, 14, 15, 23, rng.randrange(24)]),
+                                   minutes=rng.randrange(60), milliseconds=rng.randrange(1000))
+        column = 'rp_date' if i % 4 else 'fd_date'
+        rows.append({column: moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z',
+                     'rp_amount': rng.randrange(100, 1000000), 'rp_detail': f'거래{i}'})
+    return rows
+
+
+def check_result_dates(rows=None):
+    """행 단위/열 단위 결과의 날짜 변환이 기존 구현과 같은지 확인합니다."""
+    rows = rows or result_date_corpus()
+    expected = convert_result_dates_reference(copy.deepcopy(rows))
+
+    def columnar(column):
+        subset = [row for row in rows if column in row]
+        names = list(subset[0])
+        return {'columns': names, 'values': [[row[name] for row in subset] for name in names]}
+
+    candidates = {
+        'rows': (expected, decode_query_result(copy.deepcopy(rows))),
+        'columnar': ([row for column in RESULT_DATE_COLUMNS for row in expected if column in row],
+                     [row for column in RESULT_DATE_COLUMNS for row in decode_query_result(columnar(column))]),
+    }
+    mismatches = {
+        name: sum(a != b for a, b in zip(reference, decoded)) + abs(len(reference) - len(decoded))
+        for name, (reference, decoded) in candidates.items()
+    }
+    return {"rows": len(rows), "mismatches": mismatches, "passed": not any(mismatches.values())}
+
+
+def benchmark_result_dates(size=20000, repeat=5):
+    """기존 행 단위 변환과 열 단위 변환의 결과 한 건당 시간(ms)을 비교합니다."""
+    rows = [{'rp_date': row.get('rp_date', row.get('fd_date')), 'rp_amount': row['rp_amount'], 'rp_detail': row['rp_detail']}
+            for row in result_date_corpus(size)]
+    names = list(rows[0])
+    payload = {'columns': names, 'values': [[row[name] for row in rows] for name in names]}
+
+    timings = {}
+    for name, func, make_input in (
+        ("reference", convert_result_dates_reference, lambda: [dict(row) for row in rows]),
+        ("rows", decode_query_result, lambda: [dict(row) for row in rows]),
+        ("columnar", decode_query_result, lambda: payload),
+    ):
+        elapsed = 0
+        for _ in range(repeat):
+            query_result = make_input()
+            started = time.perf_counter()
+            func(query_result)
+            elapsed += time.perf_counter() - started
+        timings[name] = elapsed / repeat * 1e3
+
+    report = check_result_dates()
+    report.update({
+        "size": size,
+        "reference_ms": round(timings["reference"], 2),
+        "rows_ms": round(timings["rows"], 2),
+        "columnar_ms": round(timings["columnar"], 2),
+        "speedup": round(timings["reference"] / timings["columnar"], 1),
+    })
+    return report
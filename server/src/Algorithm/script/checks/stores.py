@@ -0,0 +1,198 @@
+"""메모리 보관 데이터(TransactionStore, StockIndex, HoldingsIndex)의 계산 결과를 SQLite 조회 결과와 비교하는 검증"""
+import random
+from datetime import datetime, timedelta
+
+from checks.common import build_sqlite, build_sqlite_monthly_rollup, compare_with_db, node_columnar, render_or_error
+from unified_script import (
+    HOLDINGS_COLUMNS, HOLDINGS_INDEX_QUERY, STOCK_INDEX_COLUMNS, TRANSACTION_STORE_KEY,
+    TRANSACTION_STORE_QUERY, DateRangeSet, HoldingsIndex, StockIndex, TransactionStore, UserTransactions, bind_query,
+    finance_clean_query, is_sql_query, kst, pattern_stock, render_answer, stock_information_query, stockpricequery,
+)
+
+
+def check_transaction_store(users=3, years=2, texts=None):
+    """
+    로컬 SQLite에 거래 테이블과 월 집계 테이블을 두고, 재무 질문의 바인딩 쿼리를 DB에서 실행한 답변과
+    TransactionStore가 보관된 거래로 계산한 답변이 같은지 비교합니다. (NULL 내역/고정 여부, 같은 날 여러 건 포함)
+    """
+    texts = texts or [
+        "이번달 지출 내역", "지난달 지출 합계", "작년 소득 평균", "이번달 가장 큰 지출", "지난달 지출 큰 순서",
+        "지난달 가장 적은 지출", "지난달 자주 쓴 지출", "작년 자주 쓴 지출", "올해 적금 내역", "작년 적금 총액",
+        "이번달 입금 합계", "지난달 출금 내역", "고정 지출 합계", "작년 입금 가장 큰", "지난달 자주 출금",
+        "이번달 가계부", "작년 예적금 현황", "어제 지출 내역", "올해 대출 상환",
+    ]
+    today = datetime.now(kst).date()
+    first_day = datetime(today.year - years + 1, 1, 1).date()
+    days = [first_day + timedelta(days=i) for i in range((today - first_day).days + 1)]
+
+    generator = random.Random(1)
+    details = ['식비', '교통', '월세', '쇼핑', '입금', '출금', '적금', '정기 예금', None]
+    rows = [
+        (user_id, day.strftime('%Y-%m-%d'), generator.choice(details), generator.choice([0, 1, 1, None]), generator.randint(0, 1))
+        for user_id in range(1, users + 1) for day in days for _ in range(generator.randint(0, 3))
+    ]
+    amounts = generator.sample(range(1000, 10_000_000), len(rows))
+    connection, fetch = build_sqlite(
+        "CREATE TABLE tb_received_paid (rp_id INTEGER PRIMARY KEY, user_id INTEGER, rp_date DATE, rp_detail TEXT, rp_amount INTEGER, rp_hold INTEGER, rp_part INTEGER)",
+        "INSERT INTO tb_received_paid (user_id, rp_date, rp_detail, rp_amount, rp_hold, rp_part) VALUES (?, ?, ?, ?, ?, ?)",
+        [(user_id, day, detail, amount, hold, part) for (user_id, day, detail, hold, part), amount in zip(rows, amounts)],
+    )
+    build_sqlite_monthly_rollup(connection)
+
+    # Node가 보내는 형태로 사용자별 거래를 적재
+    store = TransactionStore(enabled=True)
+    for user_id in range(1, users + 1):
+        load = bind_query(TRANSACTION_STORE_QUERY, user_id)
+        loaded = fetch(load['sql'], load['params'])
+        store.put(user_id, node_columnar(loaded, loaded[0], 'rp_date'))
+
+    def evaluate(case):
+        user_id, bound = case
+        local = {key: value if isinstance(value, str) else store.evaluate(value, user_id) for key, value in bound.items()}
+        return None if any(result is None for result in local.values()) else local
+
+    cases = []
+    for text in texts:
+        query = finance_clean_query(text)
+        for user_id in range(1, users + 1):
+            bound = {key: bind_query(value, user_id) if is_sql_query(value) else value for key, value in query.items()}
+            cases.append(({"text": text, "user_id": user_id}, (user_id, bound)))
+    comparison = compare_with_db(
+        cases, evaluate,
+        lambda case: {key: value if isinstance(value, str) else fetch(value['sql'], value['params']) for key, value in case[1].items()},
+        lambda info, local, remote: render_or_error(remote, info["text"]) == render_or_error(local, info["text"]),
+    )
+
+    # 조회 결과를 변환하는 동안 invalidate가 들어오면(거래 추가) 무효화 전의 결과는 보관하지 않아야 함
+    class InvalidatedWhileLoading(TransactionStore):
+        class records:
+            @staticmethod
+            def from_result(query_result):
+                racing.invalidate(1)
+                return UserTransactions.from_result(query_result)
+
+    racing = InvalidatedWhileLoading(enabled=True)
+    load = racing.load_query({key: bind_query(value, 1) for key, value in finance_clean_query("지난달 지출 합계").items()}, 1, 'race')
+    loaded = fetch(load[TRANSACTION_STORE_KEY]['sql'], load[TRANSACTION_STORE_KEY]['params'])
+    racing.put(1, node_columnar(loaded, loaded[0], 'rp_date'), 'race')
+    discards_stale = racing.get(1) is None
+    connection.close()
+
+    return {
+        **comparison,
+        "passed": comparison["passed"] and discards_stale,
+        "discards_stale_load": discards_stale,
+        "transactions": len(rows),
+        "store": store.stats(),
+    }
+
+
+def check_stock_index(years=3, texts=None):
+    """
+    로컬 SQLite의 tb_stock 대용 테이블(주말/공휴일 없음, NULL 지표 포함)을 두 번에 나누어 색인에 적재(전체 + 마지막 날짜부터 갱신)한 뒤,
+    주가/지표 질문의 쿼리를 DB에서 실행한 결과와 색인으로 계산한 결과가 행 단위로 같은지 비교합니다.
+    """
+    texts = texts or [
+        "삼성전자", "어제 애플", "지난주 비트코인", "이번달 삼성전자", "지난달 애플", "작년 삼성전자", "올해 비트코인",
+        "2분기 애플", "1월 삼성전자", "작년 3월부터 5월까지 애플", "작년 1분기와 3분기 삼성전자",
+    ]
+    today = datetime.now(kst).date()
+    first_day = datetime(today.year - years + 1, 1, 1).date()
+    generator = random.Random(2)
+    days = [first_day + timedelta(days=i) for i in range((today - first_day).days)]  # 오늘 행은 아직 없음
+    days = [day for day in days if day.weekday() < 5 and generator.random() > 0.03]
+
+    connection, fetch = build_sqlite(
+        f"CREATE TABLE tb_stock (fd_date DATE PRIMARY KEY, {', '.join(f'{name} REAL' for name in STOCK_INDEX_COLUMNS)})",
+        f"INSERT INTO tb_stock VALUES (?{', ?' * len(STOCK_INDEX_COLUMNS)})",
+        [(day.strftime('%Y-%m-%d'), *(None if generator.random() < 0.05 else round(generator.uniform(1, 90000), 2) for _ in STOCK_INDEX_COLUMNS))
+         for day in days],
+    )
+
+    def load(index, until=None):
+        # Node가 보내는 형태로 적재
+        refresh_query = index.refresh_query()
+        rows = fetch(refresh_query['sql'], refresh_query['params'])
+        if until:
+            rows = [row for row in rows if row['fd_date'] < until]
+        index.merge(node_columnar(rows, ['fd_date', *STOCK_INDEX_COLUMNS], 'fd_date') if rows else [])
+        return refresh_query
+
+    # 전체 적재는 중간 날짜까지만 받은 것으로 하고, 갱신 조회(마지막 날짜부터)로 나머지를 이어 붙임
+    index = StockIndex(enabled=True, refresh=3600)
+    initial = load(index, until=days[len(days) // 2].strftime('%Y-%m-%d'))
+    refresh = load(index)
+    incremental = not initial['params'] and refresh['params'] == [days[len(days) // 2 - 1].strftime('%Y-%m-%d')]
+
+    cases = []
+    for text in texts:
+        queries = {**stockpricequery(text), **stock_information_query(f'{text} PER'), **stock_information_query(f'{text} 시가총액')}
+        cases += [({"text": text, "key": key}, bind_query(value, None)) for key, value in queries.items() if is_sql_query(value)]
+    comparison = compare_with_db(
+        cases, index.evaluate, lambda bound: fetch(bound['sql'], bound['params']),
+        lambda info, local, remote: local == remote and render_answer(info["key"], local, info["text"]) == render_answer(info["key"], remote, info["text"]),
+    )
+    connection.close()
+    return {
+        **comparison,
+        "passed": comparison["passed"] and not comparison["fallbacks"] and incremental,
+        "index_rows": len(index.snapshot()[0]),
+        "table_rows": len(days),
+        "incremental_refresh": incremental,
+    }
+
+
+def check_holdings_index(users=3, years=3):
+    """
+    로컬 SQLite의 tb_shares_held(같은 날 여러 건, 매도는 음수, NULL/소수 수량 포함)에 대해 보유/구매/판매 질문의 쿼리를
+    DB에서 실행한 결과와 HoldingsIndex가 누적 합으로 계산한 결과, 그리고 두 결과로 만든 답변이 같은지 비교합니다.
+    """
+    today = datetime.now(kst).date()
+    first_day = datetime(today.year - years + 1, 1, 1).date()
+    generator = random.Random(4)
+
+    rows = []
+    for user_id in range(1, users + 1):
+        for _ in range(generator.randint(50, 400)):
+            day = first_day + timedelta(days=generator.randint(0, (today - first_day).days))
+            rows.append((user_id, day.strftime('%Y-%m-%d'),
+                         None if generator.random() < 0.3 else generator.randint(-20, 40),
+                         None if generator.random() < 0.3 else generator.randint(-10, 20),
+                         None if generator.random() < 0.5 else round(generator.uniform(-0.5, 1.0), 3)))
+    connection, fetch = build_sqlite(
+        "CREATE TABLE tb_shares_held (sh_id INTEGER PRIMARY KEY, user_id INTEGER, sh_date DATE, sh_ss_count INTEGER, sh_ap_count INTEGER, sh_bit_count REAL)",
+        "INSERT INTO tb_shares_held (user_id, sh_date, sh_ss_count, sh_ap_count, sh_bit_count) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+
+    # Node가 보내는 형태로 사용자별 수량 거래를 적재
+    index = HoldingsIndex(enabled=True)
+    for user_id in range(1, users + 1):
+        load = bind_query(HOLDINGS_INDEX_QUERY, user_id)
+        index.put(user_id, node_columnar(fetch(load['sql'], load['params']), ['sh_date', *HOLDINGS_COLUMNS], 'sh_date'))
+
+    last_year, this_year = str(today.year - 1), today.strftime('%Y-%m')
+    cases = [
+        ([], "보유 주식", None), ([('삼성', 'STOCK')], "삼성 주식 몇 주", [this_year]), ([('애플', 'STOCK'), ('코인', 'STOCK')], "애플 코인 보유", [last_year]),
+        ([], "보유 주식", [f'{last_year}-06-15']), ([('삼성', 'STOCK')], "작년에 산 삼성", [last_year]), ([], "주식 판매", [f'{last_year}-03']),
+        ([('비트코인', 'STOCK')], "비트코인 구매하고 판매한", [last_year]), ([('애플', 'STOCK')], "애플 매도", [f'{last_year}-01', f'{last_year}-03']),
+        ([], "주식 매수", [f'{last_year}-02-30']), ([('삼전', 'STOCK'), ('apple', 'STOCK')], "삼전 apple 매수 매도", DateRangeSet.between(first_day, today)),
+    ]
+    def rounded(rows):
+        return [{name: None if value is None else round(value, 6) for name, value in row.items()} for row in rows]
+
+    comparison = compare_with_db(
+        [({"text": text, "key": key, "user_id": user_id}, (user_id, bind_query(value, user_id)))
+         for entity, text, input_date in cases for key, value in pattern_stock(entity, input_date, text=text).items()
+         for user_id in range(1, users + 1)],
+        lambda case: index.evaluate(case[1], case[0]), lambda case: fetch(case[1]['sql'], case[1]['params']),
+        lambda info, local, remote: rounded(local) == rounded(remote) and render_answer(info["key"], local, info["text"]) == render_answer(info["key"], remote, info["text"]),
+    )
+    connection.close()
+    return {
+        **comparison,
+        "passed": comparison["passed"] and not comparison["fallbacks"],
+        "table_rows": len(rows),
+        "index_days": sum(len(index.get(user_id)) for user_id in range(1, users + 1)),
+        "stats": index.stats(),
+    }
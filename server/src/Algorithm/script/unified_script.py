@@ -1,44 +1,153 @@
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from nltk import word_tokenize, pos_tag, ne_chunk
 from dateutil.relativedelta import relativedelta
 from typing import List, Dict, Optional, Union
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import OrderedDict
+from collections.abc import Sequence
 from soynlp.normalizer import repeat_normalize
 from datetime import datetime, timedelta
-from konlpy.tag import Okt, Kkma
-from konlpy.tag import Hannanum
+from konlpy.tag import Kkma
 from pykospacing import Spacing
 from konlpy.tag import Komoran
 from spacy.tokens import Span
+import contextvars
+import contextlib
+import threading
+import functools
+import itertools
 import warnings
+import argparse
 import calendar
+import bisect
+import atexit
 import logging
+import asyncio
+import inspect
+import copy
 import spacy
 import torch
+import numpy as np
+import math
+import queue
 import pytz
+import struct
+import time
 import json
-import nltk
 import sys
 import re
 import io
-
-nltk.download('punkt', )
-nltk.download('averaged_perceptron_tagger')
-nltk.download('maxent_ne_chunker')
-nltk.download('words')
+import os
 
 warnings.filterwarnings("ignore")
 
 # 한국 표준시(KST) 타임존 설정
 kst = pytz.timezone('Asia/Seoul')
 
-hannanum = Hannanum()
-komoran = Komoran()
-spacing = Spacing()
-kkma = Kkma()
-okt = Okt()
+# JVM 형태소 분석기와 KoSpacing 모델은 스레드 안전하지 않으므로 호출을 직렬화
+_tagger_lock = threading.Lock()
+_spacing_lock = threading.Lock()
+
+def tagger_pos(tagger, text):
+    """
+    형태소 분석기(Komoran, Kkma 등)의 pos 호출을 잠금 안에서 수행합니다.
+
+    Args:
+    - tagger: KoNLPy 형태소 분석기 인스턴스
+    - text (str): 분석할 텍스트
+
+    Returns:
+    - list: (형태소, 품사) 튜플 리스트
+    """
+    with _tagger_lock:
+        return tagger.pos(text)
+
+
+class AnalysisContext:
+    """
+    질문 하나를 처리하는 동안 형태소 분석, 띄어쓰기 교정, 엔티티 추출, 날짜 추출 결과를 한 번만 계산하여 공유합니다.
+    같은 (종류, 입력)에 대한 두 번째 요청부터는 분석기를 다시 호출하지 않고 저장된 결과를 반환합니다.
+    """
 
-# spaCy 모델 캐싱 (최초 한 번만 로드)
-_cached_nlp = None
+    def __init__(self):
+        self._results = {}
+        self.computed = {}
+        self.reused = {}
+
+    def get(self, kind, key, compute):
+        if (kind, key) in self._results:
+            self.reused[kind] = self.reused.get(kind, 0) + 1
+            return self._results[(kind, key)]
+        value = compute()
+        self._results[(kind, key)] = value
+        self.computed[kind] = self.computed.get(kind, 0) + 1
+        return value
+
+    def pos(self, tagger_name, text):
+        """등록된 형태소 분석기(resources의 'komoran', 'kkma')로 text를 분석합니다."""
+        return self.get(tagger_name, text, lambda: tagger_pos(resources.get(tagger_name), text))
+
+    def word_analyses(self, tagger_name, sentence):
+        """
+        문장의 어절별 분석 결과를 어절 시작 위치(문자 오프셋) 기준으로 반환합니다.
+
+        Returns:
+        - dict: {시작 위치: (어절, (형태소, 품사) 리스트)}
+        """
+        return self.get(f"{tagger_name}_words", sentence, lambda: {
+            match.start(): (match.group(), self.pos(tagger_name, match.group()))
+            for match in re.finditer(r'\S+', sentence)
+        })
+
+    def token_pos(self, tagger_name, token):
+        """spaCy 토큰의 분석 결과. 토큰이 어절과 일치하면 문장 단위로 저장된 결과를 사용합니다."""
+        word, morphemes = self.word_analyses(tagger_name, token.doc.text).get(token.idx, (None, None))
+        if word == token.text:
+            return morphemes
+        return self.pos(tagger_name, token.text)
+
+
+_analysis_context = contextvars.ContextVar('analysis_context', default=None)
+_analysis_stats = {"requests": 0, "computed": {}, "reused": {}}
+_analysis_stats_lock = threading.Lock()
+
+def current_analysis():
+    """현재 요청의 AnalysisContext. 요청 범위 밖에서는 결과를 공유하지 않는 새 컨텍스트를 반환합니다."""
+    return _analysis_context.get() or AnalysisContext()
+
+@contextlib.contextmanager
+def analysis_scope():
+    """with 블록 안의 처리(한 요청)가 하나의 AnalysisContext를 공유하도록 합니다."""
+    context = AnalysisContext()
+    token = _analysis_context.set(context)
+    try:
+        yield context
+    finally:
+        _analysis_context.reset(token)
+        with _analysis_stats_lock:
+            _analysis_stats["requests"] += 1
+            for field in ("computed", "reused"):
+                for kind, count in getattr(context, field).items():
+                    _analysis_stats[field][kind] = _analysis_stats[field].get(kind, 0) + count
+
+def analysis_stats():
+    with _analysis_stats_lock:
+        return copy.deepcopy(_analysis_stats)
+
+def request_memo(kind):
+    """
+    함수 결과를 현재 요청의 AnalysisContext에 저장하는 데코레이터입니다.
+    호출한 쪽에서 결과를 수정해도 저장된 값이 바뀌지 않도록 복사본을 반환합니다.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            context = _analysis_context.get()
+            if context is None:
+                return func(*args, **kwargs)
+            key = (args, tuple(sorted(kwargs.items())))
+            return copy.deepcopy(context.get(kind, key, lambda: func(*args, **kwargs)))
+        return wrapper
+    return decorator
 
 # 로그 설정 (파일로 기록하거나 콘솔로 출력)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -48,13 +157,229 @@ def log_print():
     logging.warning('경고성 메세지')
 log_print()
 
-# map_database 폴더 내의 stock_market.txt 파일을 읽어옴
-stock_market_file = open(r'C:\Users\dlavk\SEBIN\AICC_TEAM\aicc_contest\aicc_map\map_database\stock_market\stock_market.txt', 'r', encoding='utf-8')
-stock_market_news = stock_market_file.read()
-stock_market_file.close()
+# 모델 파일(config.json, tokenizer 등)이 있는 폴더. 기본값은 이 스크립트가 있는 폴더
+current_dir = os.environ.get('CHATBOT_MODEL_DIR') or os.path.dirname(os.path.abspath(__file__))
+
+# map_database 폴더 내의 stock_market.txt 파일 경로 (기본값: 저장소 루트의 map_database)
+STOCK_MARKET_PATH = os.environ.get('CHATBOT_STOCK_MARKET_PATH') or os.path.normpath(
+    os.path.join(current_dir, '..', '..', '..', '..', 'map_database', 'stock_market', 'stock_market.txt'))
+
+
+class ResourceRegistry:
+    """
+    형태소 분석기, KoSpacing, spaCy, 분류 모델 등 무거운 리소스를 처음 사용할 때 로드합니다.
+    모든 리소스는 로컬 파일에서만 읽으며(네트워크 접근 없음), 리소스별 로드 시간을 기록합니다.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._values = {}
+        self._locks = {}
+        self.load_seconds = {}
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    def get(self, name):
+        if name in self._values:
+            return self._values[name]
+        with self._locks[name]:
+            if name not in self._values:
+                started = time.perf_counter()
+                self._values[name] = self._loaders[name]()
+                self.load_seconds[name] = round(time.perf_counter() - started, 3)
+                logging.info('리소스 로드: %s (%.2fs)', name, self.load_seconds[name])
+        return self._values[name]
+
+    def is_loaded(self, name):
+        return name in self._values
+
+    def stats(self):
+        return {
+            "registered": list(self._loaders),
+            "loaded": [name for name in self._loaders if name in self._values],
+            "load_seconds": dict(self.load_seconds),
+        }
+
+
+def load_stock_market_news():
+    """stock_market.txt를 읽습니다. 파일이 없으면 빈 문자열을 반환합니다."""
+    try:
+        with open(STOCK_MARKET_PATH, 'r', encoding='utf-8') as stock_market_file:
+            return stock_market_file.read()
+    except OSError as e:
+        logging.warning('증시 정보 파일을 읽지 못했습니다: %s (%s)', STOCK_MARKET_PATH, e)
+        return ''
+
+
+# 엔티티 추출은 토크나이저 결과만 사용하므로 학습된 컴포넌트는 로드하지 않음
+SPACY_EXCLUDED_PIPES = ["tok2vec", "tagger", "morphologizer", "parser", "lemmatizer", "trainable_lemmatizer", "senter", "attribute_ruler", "ner"]
+
+def load_spacy_model():
+    nlp = spacy.load("ko_core_news_sm", exclude=SPACY_EXCLUDED_PIPES)
+    Span.set_extension("cleaned_text", default=None, force=True)
+    nlp.add_pipe("custom_finance_entity_adder")
+    nlp.add_pipe("custom_stock_entity_adder")
+    return nlp
+
+
+resources = ResourceRegistry()
+resources.register('komoran', Komoran)
+resources.register('kkma', Kkma)
+resources.register('spacing', Spacing)
+resources.register('spacy', load_spacy_model)
+resources.register('stock_market_news', load_stock_market_news)
 
 
 # ================================================================================ Chatbot Entity Date Function ================================================================================
+class DateRangeSet(Sequence):
+    """
+    날짜 집합을 정렬된 닫힌 구간 [start, end] 목록과 단위(granularity: day/month/year)로 표현합니다.
+
+    기존 날짜 함수들이 반환하던 'YYYY-MM-DD'/'YYYY-MM'/'YYYY' 문자열 리스트와 같은 순서의 시퀀스로 동작하지만
+    (인덱싱, 순회, len, 비교), 문자열은 접근할 때만 만들기 때문에 범위가 길어져도 구간 수만큼의 메모리만 사용합니다.
+    전체 문자열 리스트가 필요하면 expand()를 호출합니다.
+    """
+
+    FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}
+    GRANULARITY_BY_LENGTH = {10: 'day', 7: 'month', 4: 'year'}
+
+    def __init__(self, granularity='day', intervals=()):
+        self.granularity = granularity
+        # 단위 서수(일/월/연 번호)로 바꾼 뒤, 겹치거나 바로 이어지는 구간은 하나로 합침
+        spans = sorted((self._ordinal(start), self._ordinal(end)) for start, end in intervals)
+        merged = []
+        for start, end in spans:
+            if start > end:
+                continue
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self._spans = [tuple(span) for span in merged]
+        self._offsets = list(itertools.accumulate((end - start + 1 for start, end in self._spans), initial=0))
+
+    @classmethod
+    def between(cls, start, end, granularity='day'):
+        """start부터 end까지(양끝 포함)의 단일 구간"""
+        return cls(granularity, [(start, end)])
+
+    @classmethod
+    def from_dates(cls, dates, granularity='day'):
+        return cls(granularity, [(date, date) for date in dates])
+
+    @classmethod
+    def from_strings(cls, strings):
+        """같은 형식의 날짜 문자열 리스트를 변환합니다. 형식이 섞여 있으면 ValueError가 발생합니다."""
+        granularity = cls.GRANULARITY_BY_LENGTH.get(len(strings[0]), 'day') if strings else 'day'
+        return cls.from_dates([datetime.strptime(value, cls.FORMATS[granularity]).date() for value in strings], granularity)
+
+    @classmethod
+    def covering(cls, values):
+        """날짜 시퀀스(형식이 섞여 있어도 됨)가 덮는 모든 날짜를 일 단위 구간으로 반환합니다. 알 수 없는 형식은 건너뜁니다."""
+        if isinstance(values, cls):
+            return cls('day', values.intervals)
+        if isinstance(values, str):
+            values = [values]
+        intervals = []
+        for value in values:
+            granularity = cls.GRANULARITY_BY_LENGTH.get(len(str(value)))
+            try:
+                intervals += cls.from_dates([datetime.strptime(str(value), cls.FORMATS[granularity]).date()], granularity).intervals
+            except (KeyError, ValueError):
+                continue
+        return cls('day', intervals)
+
+    @classmethod
+    def merge(cls, *sequences):
+        """날짜 시퀀스들의 합집합. 단위가 서로 다르면 기존처럼 정렬된 문자열 리스트를 반환합니다."""
+        try:
+            parts = [sequence if isinstance(sequence, cls) else cls.from_strings(list(sequence)) for sequence in sequences if sequence]
+        except (TypeError, ValueError):
+            parts = None
+        granularities = {part.granularity for part in parts or []}
+        if parts is None or len(granularities) > 1:
+            return sorted(set().union(*(sequence for sequence in sequences if sequence)))
+        return cls(granularities.pop() if granularities else 'day', [interval for part in parts for interval in part.intervals])
+
+    def _ordinal(self, date):
+        if self.granularity == 'day':
+            return date.toordinal()
+        if self.granularity == 'month':
+            return date.year * 12 + date.month - 1
+        return date.year
+
+    def _bounds(self, ordinal):
+        """단위 서수 하나가 덮는 첫째 날과 마지막 날"""
+        if self.granularity == 'day':
+            day = datetime.fromordinal(ordinal).date()
+            return day, day
+        if self.granularity == 'month':
+            year, month = divmod(ordinal, 12)
+            return datetime(year, month + 1, 1).date(), datetime(year, month + 1, calendar.monthrange(year, month + 1)[1]).date()
+        return datetime(ordinal, 1, 1).date(), datetime(ordinal, 12, 31).date()
+
+    def _format(self, ordinal):
+        if self.granularity == 'day':
+            return datetime.fromordinal(ordinal).strftime('%Y-%m-%d')
+        if self.granularity == 'month':
+            year, month = divmod(ordinal, 12)
+            return f"{year:04d}-{month + 1:02d}"
+        return str(ordinal)
+
+    @property
+    def intervals(self):
+        """날짜(date) 기준의 닫힌 구간 목록 [(첫째 날, 마지막 날), ...]"""
+        return [(self._bounds(start)[0], self._bounds(end)[1]) for start, end in self._spans]
+
+    def half_open(self):
+        """[시작일, 종료일 다음 날) 형태의 반열린 구간 목록. SQL 범위 조건(>= / <)에 그대로 사용합니다."""
+        return [(start, end + timedelta(days=1)) for start, end in self.intervals]
+
+    def until(self, last_day):
+        """last_day 이후 날짜를 제외한 일 단위 집합"""
+        return DateRangeSet('day', [(start, min(end, last_day)) for start, end in self.intervals])
+
+    def expand(self):
+        return list(self)
+
+    def __len__(self):
+        return self._offsets[-1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('DateRangeSet index out of range')
+        span = bisect.bisect_right(self._offsets, index) - 1
+        return self._format(self._spans[span][0] + index - self._offsets[span])
+
+    def __iter__(self):
+        for start, end in self._spans:
+            for ordinal in range(start, end + 1):
+                yield self._format(ordinal)
+
+    def __eq__(self, other):
+        if isinstance(other, DateRangeSet):
+            return (self.granularity, self._spans) == (other.granularity, other._spans)
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __deepcopy__(self, memo):
+        # 생성 후 바뀌지 않으므로 복사할 필요가 없음 (request_memo)
+        return self
+
+    def __repr__(self):
+        spans = ', '.join(f"{self._format(start)}~{self._format(end)}" for start, end in self._spans)
+        return f"DateRangeSet({self.granularity}: {spans})"
+
+
 def convert_relative_years(match: str, time: bool = False) -> Optional[List[int]]:
     """
     입력된 문자열에서 상대적 또는 절대적 연도 표현이 포함되어 있을 때 해당 연도를 계산하여 반환
@@ -155,7 +480,7 @@ def convert_relative_months(match: str, time: bool = False, year: Optional[int]
             if not year and past_date > today and not time:
                 past_date = past_date.replace(year=today.year - 1)
             specified_months.append(f"{past_date.year}-{past_date.month:02}")
-        return sorted(specified_months)
+        return DateRangeSet.from_strings(specified_months)
 
     relative_months = {
         '다다음달': 2, '이번달': 0, '다음달': 1, '저저번달': -2, '저번달': -1,
@@ -186,16 +511,16 @@ def convert_relative_months(match: str, time: bool = False, year: Optional[int]
         if not year and not time:
             start_date, end_date = (start_date.replace(year=target_year - 1), end_date.replace(year=target_year - 1)) if today < start_date else (start_date, min(end_date, today))
 
-        return [(start_date + relativedelta(months=i)).strftime("%Y-%m") for i in range((end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1)]
+        return DateRangeSet.between(start_date, end_date, granularity='month')
 
     return None
 
-def convert_relative_weeks(match: str, time: bool = False, year: Optional[int] = None, month: Optional[int] = None) -> Union[List[str], None]:
+def convert_relative_weeks(match: str, time: bool = False, year: Optional[int] = None, month: Optional[int] = None) -> Optional[DateRangeSet]:
     today = datetime.now().date()
 
     process_year = year if year else today.year
     process_month = [month] if month else []
-    date_list = []
+    intervals = []
 
     for current_month in process_month or [today.month]:
         first_day_of_month = datetime(process_year, current_month, 1).date()
@@ -236,48 +561,29 @@ def convert_relative_weeks(match: str, time: bool = False, year: Optional[int] =
                     start_date = start_of_week + timedelta(weeks=2)
                     end_date = start_date + timedelta(days=6)
 
-                current_date = start_date
-
-                while current_date <= end_date:
-                    if time:
-                        date_list.append(current_date.strftime('%Y-%m-%d'))
-                    else:
-                        if week in ["다음 주", "다다음 주"]:
-                            return None
-
-                        if end_date <= today:
-                            date_list.append(current_date.strftime('%Y-%m-%d'))
-                        elif current_date > today:
-                            start_date -= relativedelta(months=1)
-                            end_date -= relativedelta(months=1)
-                            current_date = start_date
-
-                            while current_date <= end_date:
-                                if current_date <= today:
-                                    date_list.append(current_date.strftime('%Y-%m-%d'))
-                                current_date += timedelta(days=1)
-                            break
-                        elif current_date <= today and today <= end_date:
-                            while current_date <= today:
-                                date_list.append(current_date.strftime('%Y-%m-%d'))
-                                current_date += timedelta(days=1)
-                            break
-                    current_date += timedelta(days=1)
-
-    if date_list:
-        date_list = sorted(date_list)
-        first_date = datetime.strptime(date_list[0], '%Y-%m-%d').date()
-        last_date = datetime.strptime(date_list[-1], '%Y-%m-%d').date()
+                if time or end_date <= today:
+                    intervals.append((start_date, end_date))
+                elif week in ["다음 주", "다다음 주"]:
+                    return None
+                elif start_date > today:
+                    # 아직 시작하지 않은 주는 한 달 전의 같은 주로 대체 (오늘 이후 날짜 제외)
+                    intervals.append((start_date - relativedelta(months=1), min(end_date - relativedelta(months=1), today)))
+                else:
+                    intervals.append((start_date, today))
 
+    dates = DateRangeSet('day', intervals)
+    if dates:
+        first_date = dates.intervals[0][0]
         if (year is not None and first_date.year != year) or (month is not None and first_date.month != month):
             return None
 
-    return date_list
+    return dates
 
 
-def convert_relative_days(match: str, time: bool = False, year: Optional[int] = None, month: Optional[int] = None, week: Optional[List[str]] = None) -> Optional[List[str]]:
+def convert_relative_days(match: str, time: bool = False, year: Optional[int] = None, month: Optional[int] = None, week: Optional[DateRangeSet] = None) -> Union[List[str], DateRangeSet, None]:
     """
     입력된 날짜 표현을 분석하여 실제 날짜로 변환하는 함수.
+    단일 날짜는 리스트로, 여러 날짜(요일, 평일/주말, 월초/중순/월말 등)는 DateRangeSet으로 반환합니다.
     """
     today = datetime.now().date()
 
@@ -296,7 +602,7 @@ def convert_relative_days(match: str, time: bool = False, year: Optional[int] =
         dates = [datetime(target_year, m, 15).date() for m in target_months]
         dates = [d for d in dates if time or d <= today]
 
-        return [d.strftime('%Y-%m-%d') for d in dates] if dates else None
+        return DateRangeSet.from_dates(dates) if dates else None
 
 
     # 기존의 'N일 전', 'N일 후', 'N일' 형태의 날짜 처리
@@ -349,7 +655,7 @@ def convert_relative_days(match: str, time: bool = False, year: Optional[int] =
         def filter_dates(dates, is_weekday):
             # 평일 또는 주말 필터링, 미래 날짜는 time이 False일 때만 제거
             filtered = [date for date in dates if (date.weekday() < 5) == is_weekday and (time or date <= today)]
-            return [date.strftime('%Y-%m-%d') for date in filtered] or None
+            return DateRangeSet.from_dates(filtered) or None
 
         # 1. 주어진 주의 날짜들이 있는 경우 (week 인자가 주어짐)
         if week:
@@ -362,9 +668,9 @@ def convert_relative_days(match: str, time: bool = False, year: Optional[int] =
                     first = datetime(processed_year, 1, 1).date()
                     first += timedelta(days=(idx - first.weekday() + 7) % 7)
                     last = datetime(processed_year, 12, 31).date()
-                    return [first.strftime('%Y-%m-%d')] + [(first + timedelta(weeks=i)).strftime('%Y-%m-%d')
-                                                          for i in range(1, (last - first).days // 7 + 1)
-                                                            if time or first + timedelta(weeks=i) <= today]
+                    return DateRangeSet.from_dates([first] + [first + timedelta(weeks=i)
+                                                              for i in range(1, (last - first).days // 7 + 1)
+                                                              if time or first + timedelta(weeks=i) <= today])
 
         # 3. 연도와 월이 모두 주어진 경우 (year와 month가 모두 있음)
         elif year and month:
@@ -394,9 +700,9 @@ def convert_relative_days(match: str, time: bool = False, year: Optional[int] =
             for weekday in days_ahead:
                 if weekday in match:
                     weekday_index = days_ahead[weekday]
-                    matching_dates = [date.strftime('%Y-%m-%d') for date in dates if date.weekday() == weekday_index and (time or date <= today)]
+                    matching_dates = [date for date in dates if date.weekday() == weekday_index and (time or date <= today)]
                     matching_weekdays.extend(matching_dates)
-            result = matching_weekdays or None
+            result = DateRangeSet.from_dates(matching_weekdays) or None
 
         return result
 
@@ -425,9 +731,7 @@ def convert_relative_days(match: str, time: bool = False, year: Optional[int] =
         if not time and start_of_period <= today < end_of_period:
             end_of_period = min(end_of_period, today)
 
-        # 모든 날짜 생성
-        all_dates = [(start_of_period + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end_of_period - start_of_period).days + 1)]
-        return all_dates
+        return DateRangeSet.between(start_of_period, end_of_period)
 
     # 표현을 못 찾음
     return None
@@ -564,6 +868,94 @@ def replace_with_pattern_keys(text: str) -> str:
 
     return text
 
+# 날짜 단위별 패턴 그룹과, 그룹 외에 추가로 확인하는 숫자 표현 패턴
+DATE_UNIT_GROUPS = {"year": "상대적 연도", "month": "상대적 월", "week": "주 관련 상대적 날짜", "day": "요일"}
+DATE_UNIT_EXTRA_PATTERNS = {
+    "year": [r'\b(\d{2,4}년)\b'],
+    "month": [r'\b(\d{1,2})월(달|만)?\b', r'\b(\d{1,2}개월)\b', r'\b\d{1}분기\b'],
+    "week": [],
+    "day": [r'\b(\d{1,2})일\b'],
+}
+
+def date_unit_patterns(unit):
+    return [pattern for sublist in date_patterns[DATE_UNIT_GROUPS[unit]].values() for pattern in sublist] + DATE_UNIT_EXTRA_PATTERNS[unit]
+
+
+class DateGrammar:
+    """
+    date_patterns 어휘를 한 번만 컴파일한 날짜 표현 스캐너입니다.
+
+    - canonicalize(text): 어휘 전체를 하나의 alternation으로 한 번 훑으며, 매칭된 표현을 디스패치 테이블로 치환합니다.
+    - classify(text): 단위별로 묶은 패턴으로 치환된 텍스트에 포함된 날짜 단위(year/month/week/day)를 반환합니다.
+
+    replace_with_pattern_keys(패턴별 순차 re.sub)와 같은 결과가 나오도록 다음 규칙으로 컴파일합니다.
+    - alternation 순서는 기존 치환 순서(그룹 -> 키 -> 패턴 -> '|' 순서)를 따르고, 표현 양끝의 \\b는 그대로 유지합니다.
+    - 키와 같은 표현(예: '주말' -> '주말')은 치환해도 텍스트가 바뀌지 않으므로 제외하되, 같은 패턴 안에서 뒤에 오는
+      표현은 기존처럼 가로막도록 부정 전방탐색으로 남깁니다. (예: '주말에'는 앞에 '\\b주말'이 매칭되지 않을 때만 치환)
+    - 치환 값은 해당 키에 이후 패턴들의 치환을 미리 적용한 결과입니다.
+    - 한 문장 안에서 서로 다른 키의 치환 결과가 다시 이어져 새 표현이 되는 경우까지는 재현하지 않으며,
+      checks/dates.py(python -m checks dates)로 어휘 조합 코퍼스에서 기존 구현과의 일치를 확인합니다.
+    """
+
+    def __init__(self, patterns):
+        passes = [(key, regex) for group in patterns.values() for key, regex_list in group.items() for regex in regex_list]
+
+        self.replacements = []  # 캡처 그룹 번호 - 1 -> 치환 값
+        self.vocabulary = set()
+        alternatives, first_chars = [], set()
+        for index, (key, regex) in enumerate(passes):
+            parsed = []
+            for alternative in regex.split('|'):
+                lead, trail = alternative.startswith(r'\b'), alternative.endswith(r'\b')
+                literal = alternative[2 if lead else 0:len(alternative) - (2 if trail else 0)]
+                parsed.append((literal, r'\b' if lead else '', r'\b' if trail else ''))
+                self.vocabulary.add(literal)
+            identities = [item for item in parsed if item[0] == key]
+
+            for position, (literal, lead, trail) in enumerate(parsed):
+                if literal == key:
+                    continue
+                # 같은 위치에서는 앞선 동일 치환 표현이, 걸쳐 있는 위치에서는 먼저 시작한 동일 치환 표현이 우선함
+                guards = [
+                    f'(?!{b_lead}{re.escape(b_literal)}{b_trail})'
+                    for b_literal, b_lead, b_trail in parsed[:position] if b_literal == key
+                ]
+                for b_literal, b_lead, b_trail in identities:
+                    for offset in range(1, len(b_literal)):
+                        rest = b_literal[offset:]
+                        if literal.startswith(rest) or rest.startswith(literal):
+                            guards.append(f'(?!(?<={b_lead}{re.escape(b_literal[:offset])}){re.escape(rest)}{b_trail})')
+                alternatives.append(f"({''.join(guards)}{lead}{re.escape(literal)}{trail})")
+                first_chars.add(literal[0])
+                replacement = key
+                for later_key, later_regex in passes[index + 1:]:
+                    replacement = re.sub(later_regex, later_key, replacement)
+                self.replacements.append(replacement)
+
+        # 첫 글자 문자 클래스를 앞에 두어, 어휘가 시작될 수 없는 위치에서는 alternation 전체를 시도하지 않음
+        first_class = re.escape(''.join(sorted(first_chars)))
+        self._scanner = re.compile(f"(?=[{first_class}])(?:{'|'.join(alternatives)})")
+        # 단위마다 패턴 전체를 하나의 alternation으로 묶어, 단위당 search 한 번으로 확인
+        self._units = {
+            unit: re.compile('|'.join(f'(?:{pattern})' for pattern in date_unit_patterns(unit)))
+            for unit in DATE_UNIT_GROUPS
+        }
+
+    def canonicalize(self, text):
+        return self._scanner.sub(lambda match: self.replacements[match.lastindex - 1], text)
+
+    def classify(self, text):
+        return {unit for unit, pattern in self._units.items() if pattern.search(text)}
+
+    def scan(self, text):
+        """치환된 텍스트와 날짜 단위 집합을 함께 반환합니다."""
+        text = self.canonicalize(text)
+        return text, self.classify(text)
+
+
+date_grammar = DateGrammar(date_patterns)
+
+
 def extract_date_info(text, time=False):
     """
     주어진 텍스트에서 날짜 정보를 추출하여 실제 날짜로 변환합니다.
@@ -576,8 +968,8 @@ def extract_date_info(text, time=False):
     - list: 변환된 날짜 리스트 (문자열 형식 'YYYY-MM-DD')
     """
 
-    # 텍스트 패턴 치환 진행
-    text = replace_with_pattern_keys(text)
+    # 텍스트 패턴 치환 및 날짜 단위 분류 진행
+    text, units = date_grammar.scan(text)
 
     # convert_date_expression으로부터 변환된 날짜가 있으면 반환
     converted_dates = convert_date_expression(text, time=time)
@@ -592,44 +984,21 @@ def extract_date_info(text, time=False):
 
     year, month, month_result, week, result = None, None, None, None, None
 
-    # 상대적 연도, 월, 주, 요일 패턴 목록
-    year_patterns = [pattern for sublist in date_patterns['상대적 연도'].values() for pattern in sublist]
-    month_patterns = [pattern for sublist in date_patterns['상대적 월'].values() for pattern in sublist]
-    week_patterns = [pattern for sublist in date_patterns['주 관련 상대적 날짜'].values() for pattern in sublist]
-    day_patterns = [pattern for sublist in date_patterns['요일'].values() for pattern in sublist]
-
-    patterns_to_check = {
-        "year": (year_patterns + [r'\b(\d{2,4}년)\b'], convert_relative_years, {'time': time}),
-        "month": (month_patterns + [r'\b(\d{1,2})월(달|만)?\b', r'\b(\d{1,2}개월)\b', r'\b\d{1}분기\b'], convert_relative_months, {'time': time, 'year': year}),
-        "week": (week_patterns, convert_relative_weeks, {'time': time, 'year': year, 'month': month}),
-        "day": (day_patterns + [r'\b(\d{1,2})일\b'], convert_relative_days, {'time': time, 'year': year, 'month': month, 'week': week})
-    }
-
-    # 패턴을 순회하며 일치하는 것을 변환
-    for key, (patterns, convert_function, kwargs) in patterns_to_check.items():
-        for pattern in patterns:
-            if re.search(pattern, text):
-                if key == "year" and convert_function:
-                    year_result = convert_function(text, **kwargs)
-                    if year_result:
-                        year = int(year_result[0])
-                        patterns_to_check["month"][2]['year'] = year
-                elif key == "month" and convert_function:
-                    month_result = convert_function(text, **patterns_to_check["month"][2])
-                    if month_result:
-                        month = month_result
-                elif key == "week":
-                    # year와 month가 None일 때는 None으로 전달
-                    kwargs['year'] = year
-                    kwargs['month'] = int(month[0].split('-')[1]) if month else None
-                    week = convert_function(text, **kwargs)
-                    result = week
-                elif key == "day":
-                    kwargs['year'] = year
-                    kwargs['month'] = int(month[0].split('-')[1]) if month else None
-                    kwargs['week'] = week
-                    result = convert_function(text, **kwargs)
-                break
+    # 포함된 날짜 단위를 연도 -> 월 -> 주 -> 일 순서로 변환 (앞 단위의 결과를 뒤 단위에 전달)
+    if "year" in units:
+        year_result = convert_relative_years(text, time=time)
+        if year_result:
+            year = int(year_result[0])
+    if "month" in units:
+        month_result = convert_relative_months(text, time=time, year=year)
+        if month_result:
+            month = month_result
+    if "week" in units:
+        # year와 month가 None일 때는 None으로 전달
+        week = convert_relative_weeks(text, time=time, year=year, month=int(month[0].split('-')[1]) if month else None)
+        result = week
+    if "day" in units:
+        result = convert_relative_days(text, time=time, year=year, month=int(month[0].split('-')[1]) if month else None, week=week)
 
 
     final_result = result or week or month_result or ([str(year)] if year else None)
@@ -643,9 +1012,17 @@ def extract_date_info(text, time=False):
 
     return None if not time and final_date > datetime.now().date() else final_result
 
+# 날짜 범위/나열 표현에서 확인하는 조사 및 접속사와, 이를 인정하는 품사 태그
+PARTICLE_TARGET_WORDS = frozenset({'과', '이랑', '그리고', '에서', '부터', '까지', '와', '별', '마다'})
+PARTICLE_VALID_TAGS = frozenset({'XSN', 'VA', 'ECS', 'VV', 'MAC', 'JKS', 'JC', 'JKC', 'JKG', 'JKO', 'JKB', 'JKV', 'JKQ', 'JX', 'JKM', 'MAJ', 'NNB', 'NNG'})
+PARTICLE_CACHE_SIZE = int(os.environ.get('CHATBOT_PARTICLE_CACHE_SIZE', 1024))
+
+@functools.lru_cache(maxsize=PARTICLE_CACHE_SIZE)
 def check_conjunction_and_particle_with_kkma(text: str) -> bool:
     """
     텍스트에서 특정 조사나 접속사가 포함되어 있는지 확인합니다.
+    결과는 입력 문자열에만 의존하므로 크기 제한 메모 테이블(lru_cache)에 저장하며,
+    PARTICLE_TARGET_WORDS는 시작 시 preload_particle_decisions()로 미리 채웁니다.
 
     Args:
     - text (str): 입력 텍스트
@@ -654,35 +1031,33 @@ def check_conjunction_and_particle_with_kkma(text: str) -> bool:
     - bool: 조건에 맞는 조사나 접속사가 포함되어 있으면 True, 그렇지 않으면 False
     """
     # KKMA로 품사 태깅된 리스트
-    kkma_tagged = kkma.pos(text)
+    kkma_tagged = current_analysis().pos('kkma', text)
 
     # 형태소를 하나로 결합하여 원래의 단어를 복원
     combined_text = ''.join([word for word, pos in kkma_tagged])
 
-    # 타겟 조사 및 접속사 집합
-    target_words = {'과', '이랑', '그리고', '에서', '부터', '까지', '와', '별', '마다'}
-
     # 결합된 형태소들이 '와'로 해석될 수 있는지 확인
-    if combined_text in target_words:
+    if combined_text in PARTICLE_TARGET_WORDS:
         return True
 
     # 분리된 형태소가 '오'와 '아'로 나온 경우 '와'로 결합하여 처리
     if ('오', 'VA') in kkma_tagged and ('아', 'ECS') in kkma_tagged:
         return True
 
-    # 유효한 품사 태그 집합
-    valid_tags = {'XSN', 'VA', 'ECS', 'VV', 'MAC', 'JKS', 'JC', 'JKC', 'JKG', 'JKO', 'JKB', 'JKV', 'JKQ', 'JX', 'JKM', 'MAJ', 'NNB', 'NNG'}
-
     # 태그된 텍스트에서 조건 확인
     for word, pos in kkma_tagged:
-        if word in target_words and pos in valid_tags:
+        if word in PARTICLE_TARGET_WORDS and pos in PARTICLE_VALID_TAGS:
             return True
 
     return False
 
+def preload_particle_decisions():
+    """날짜 패턴이 캡처할 수 있는 조사/접속사의 판정 결과를 미리 계산하여, 요청 처리 중 Kkma 호출이 없도록 합니다."""
+    return {word: check_conjunction_and_particle_with_kkma(word) for word in sorted(PARTICLE_TARGET_WORDS)}
+
 def get_all_dates_between(start_date_str, end_date_str, time=False):
     """
-    주어진 두 날짜 사이의 모든 날짜를 반환합니다.
+    주어진 두 날짜 사이의 모든 날짜를 일 단위 구간(DateRangeSet)으로 반환합니다.
 
     Args:
     - start_date_str (str): 시작 날짜 문자열 (YYYY, YYYY-MM, YYYY-MM-DD 형식 가능)
@@ -690,7 +1065,7 @@ def get_all_dates_between(start_date_str, end_date_str, time=False):
     - time (bool): True면 미래 날짜 포함, False면 현재 날짜까지만 포함
 
     Returns:
-    - list: 두 날짜 사이의 모든 날짜 목록
+    - DateRangeSet: 두 날짜 사이의 모든 날짜 (개별 날짜 문자열은 접근할 때 생성)
     """
     today = datetime.now().date()
 
@@ -713,12 +1088,16 @@ def get_all_dates_between(start_date_str, end_date_str, time=False):
     if not start_date or not end_date:
         return None
 
-    # 시작 날짜와 종료 날짜 사이의 모든 날짜 생성
-    return [(start_date + timedelta(days=i)).strftime("%Y-%m-%d")
-            for i in range((end_date - start_date).days + 1)
-            if time or (start_date + timedelta(days=i)).date() <= today]
+    # 미래 날짜를 제외하면 오늘까지로 자름
+    end_date = end_date.date() if time else min(end_date.date(), today)
+    return DateRangeSet.between(start_date.date(), end_date)
 
-def split_and_return_periods(text: str, time: bool = False) -> List[str]:
+@request_memo('periods')
+def split_and_return_periods(text: str, time: bool = False) -> Union[List[str], DateRangeSet, None]:
+    """
+    텍스트의 기간 표현(범위, 나열, '까지', 빈도)을 날짜 목록으로 변환합니다.
+    연속된 기간은 DateRangeSet(구간 + 단위)으로 반환하므로, 기간 길이와 관계없이 크기가 일정합니다.
+    """
     today = datetime.now().date()
 
     weekday_map = {"월요일": 0, "화요일": 1, "수요일": 2, "목요일": 3, "금요일": 4, "토요일": 5, "일요일": 6}
@@ -745,15 +1124,15 @@ def split_and_return_periods(text: str, time: bool = False) -> List[str]:
                 for i in range(1, 30) if (today - timedelta(days=i)).weekday() == target_weekday
             ][:3])
         elif period_type in ["평일", "주말"]:
-            date_list, weeks = [], 0
+            intervals, weeks = [], 0
             while weeks < 3:
                 week_start = today - timedelta(days=today.weekday()) - timedelta(weeks=weeks)
                 if period_type == "평일":
-                    date_list += [(week_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(5)]
+                    intervals.append((week_start, week_start + timedelta(days=4)))
                 else:
-                    date_list += [(week_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(5, 7)]
+                    intervals.append((week_start + timedelta(days=5), week_start + timedelta(days=6)))
                 weeks += 1
-            return sorted(set(date_list))
+            return DateRangeSet('day', intervals)
         else:
             unit_match = re.search(patterns['unit'], text)
             unit = unit_match.group(1) if unit_match else None
@@ -761,13 +1140,13 @@ def split_and_return_periods(text: str, time: bool = False) -> List[str]:
             if unit == "일":
                 return [ (today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(7) ]
             elif unit == "주":
-                return sorted({ (today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(21) })
+                return DateRangeSet.between(today - timedelta(days=20), today)
             elif unit == "월":
-                return sorted({ f"{(today - relativedelta(months=i)).year}-{(today - relativedelta(months=i)).month:02d}" for i in range(3) })
+                return DateRangeSet.between(today - relativedelta(months=2), today, granularity='month')
             elif unit == "분기":
-                return sorted({ f"{(today - relativedelta(months=i)).year}-{(today - relativedelta(months=i)).month:02d}" for i in range(12) })
+                return DateRangeSet.between(today - relativedelta(months=11), today, granularity='month')
             elif unit in ["년", "연도"]:
-                return sorted({ f"{today.year - i}" for i in range(3) })
+                return DateRangeSet.between(today - relativedelta(years=2), today, granularity='year')
 
     # match_1: "에서", "부터"
     range_match = re.search(patterns['range'], text)
@@ -777,8 +1156,7 @@ def split_and_return_periods(text: str, time: bool = False) -> List[str]:
         end_dates = extract_date_info(range_match.group(3).strip(), time)
 
         if start_dates and end_dates:
-            all_dates = sorted(get_all_dates_between(start_dates[0], end_dates[-1], time))
-            return all_dates
+            return get_all_dates_between(start_dates[0], end_dates[-1], time)
         return start_dates or end_dates or None
 
     # match_2: "과", "이랑", "그리고", "와"
@@ -788,7 +1166,7 @@ def split_and_return_periods(text: str, time: bool = False) -> List[str]:
         before, _, after = conj_match.groups()
         start_dates = extract_date_info(before.strip(), time)
         end_dates = extract_date_info(after.strip(), time)
-        date = sorted(set(start_dates or []) | set(end_dates or []))
+        date = DateRangeSet.merge(start_dates, end_dates)
         return date if date else None
 
     # match_3: "까지"
@@ -819,64 +1197,29 @@ def split_and_return_periods(text: str, time: bool = False) -> List[str]:
                             else relativedelta(years=days_delta) if unit == '년'
                             else timedelta(days=days_delta))
 
-        return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(1, (final_dt - start).days + 1)]
+        return DateRangeSet.between(start + timedelta(days=1), final_dt)
 
 
     # 기본 날짜 추출
     try:
-        result = sorted(extract_date_info(text, time))
-        return result
+        result = extract_date_info(text, time)
+        return result if isinstance(result, DateRangeSet) else sorted(result)
     except Exception as e:
         return None
 
 
 # ================================================================================ Entity Stock Function ================================================================================
 def get_spacy_model():
-    global _cached_nlp
-    if _cached_nlp is None:
-        _cached_nlp = spacy.load("ko_core_news_sm", disable=["parser", "tagger", "textcat"])
-        Span.set_extension("cleaned_text", default=None, force=True)
-    return _cached_nlp
-
-def extract_stock_entities(text):
-    # 주식 관련 패턴 정의
-    patterns = {
-        "삼성전자": r"삼성전자|삼성|삼전|samsung",
-        "애플": r"애플|apple",
-        "비트코인": r"비트코인|bitcoin|비트|코인|coin",
-        "PER": r"PER|주가수익비율|Price Earning Ratio|per",
-        "PBR": r"PBR|주가순자산비율|Price Book-value Ratio|pbr",
-        "ROE": r"ROE|자기자본이익률|Return on Equity|roe",
-        "MC": r"시총|총액|MC|시가총액|Market Cap|mc"
-    }
-
-    # 조사 및 종결어미 제거
-    def clean_text(text):
-        return re.sub(r'(과|와|의|가|이|을|를|은|는|에서|으로|고|까지|부터|도|만|조차|뿐|에|와|에서|로|이다|입니다|해요|하겠습니다)$', '', text)
-
-    # 사용자 정의 spaCy 파이프라인 컴포넌트
-    @spacy.Language.component("custom_stock_entity_adder")
-    def custom_stock_entity_adder(doc):
-        new_ents = []
-        for token in doc:
-            noun_phrase = clean_text(token.text)
-            for label, pattern in patterns.items():
-                if re.search(pattern, noun_phrase):
-                    new_ent = Span(doc, token.i, token.i + 1, label=label)
-                    new_ent._.set("cleaned_text", noun_phrase)
-                    new_ents.append(new_ent)
-                    break
-        doc.ents = new_ents
-        return doc
+    """엔티티 추출에 사용하는 공유 spaCy 파이프라인(토크나이저 + 사용자 정의 엔티티 컴포넌트)을 반환합니다."""
+    return resources.get('spacy')
 
-    # spaCy 모델 로드 (캐싱된 모델 사용)
+def run_entity_adder(name, text):
+    """
+    공유 파이프라인의 토크나이저로 문서를 만든 뒤, 지정한 엔티티 컴포넌트 하나만 실행합니다.
+    두 컴포넌트 모두 doc.ents를 덮어쓰므로 파이프라인 전체(nlp(text))를 실행하지 않습니다.
+    """
     nlp = get_spacy_model()
-    if "custom_stock_entity_adder" not in nlp.pipe_names:
-        nlp.add_pipe("custom_stock_entity_adder", after="ner")
-
-    doc = nlp(text)
-    entities = [(ent._.get("cleaned_text"), ent.label_) for ent in doc.ents]
-    return entities
+    return nlp.get_pipe(name)(nlp.make_doc(text))
 
 def stock_information(text):
     entities = extract_stock_entities(text)
@@ -904,96 +1247,154 @@ def get_stock_column(stock, info):
     return stock_column_map.get(stock, {}).get(info, '')
 
 
+# ================================================================================ Make Query Function ================================================================================
+# 쿼리 조각은 (SQL, 바인딩 값 튜플) 형태입니다. 날짜, 항목명 같은 값은 SQL에 직접 넣지 않고 ? 자리에 바인딩합니다.
+EMPTY_SQL = ('', ())
 
 
-# ================================================================================ Make Query Function ================================================================================
+def sql_join(*parts):
+    """
+    SQL 문자열과 (SQL, 바인딩 값) 조각을 순서대로 이어 붙여 하나의 (SQL, 바인딩 값)을 만듭니다.
+    바인딩 값은 조각이 나온 순서대로 이어지므로 SQL 안의 ? 순서와 같습니다.
+    """
+    sql, params = [], []
+    for part in parts:
+        if isinstance(part, tuple):
+            sql.append(part[0])
+            params.extend(part[1])
+        else:
+            sql.append(part)
+    return ''.join(sql), tuple(params)
+
+
+def date_range_condition(column, input_date):
+    """
+    날짜 시퀀스를 반열린 범위 조건(column >= 시작 AND column < 끝)으로 바꿉니다.
+    LIKE / IN 목록과 달리 (user_id, 날짜) 인덱스의 범위 탐색을 사용할 수 있고, 이어지는 날짜는 하나의 범위로 합쳐지므로
+    기간 길이와 관계없이 구간 수만큼의 조건만 생성됩니다.
+
+    Args:
+    column (str): 날짜 컬럼 이름 (예: 'rp_date', 'rp.rp_date', 'fd_date')
+    input_date (DateRangeSet | list | str): 'yyyy-mm-dd', 'yyyy-mm', 'yyyy' 형식의 날짜 (형식이 섞여 있어도 됨)
+
+    Returns:
+    tuple: (범위 조건 SQL, 바인딩 값). 변환할 날짜가 없으면 EMPTY_SQL.
+    """
+    ranges = DateRangeSet.covering(input_date).half_open()
+    params = tuple(f"{day:%Y-%m-%d}" for start, end in ranges for day in (start, end))
+    condition = f"{column} >= ? AND {column} < ?"
+    if len(ranges) > 1:
+        return "(" + " OR ".join(f"({condition})" for _ in ranges) + ")", params
+    return (condition, params) if ranges else EMPTY_SQL
+
 # 소비, 수입, 입출금 등을 위한 패턴
-def process_date_format(input_date=None, date_type="%Y-%m-%d"):
+def process_date_format(input_date=None, date_type="%Y-%m-%d", column="rp_date"):
     """
-    주어진 날짜 형식(input_date)에 맞춰 SQL 쿼리 문자열을 생성하는 함수.
-    'yyyy-mm-dd', 'yyyy-mm', 'yyyy' 형식의 날짜를 처리하며, 날짜 형식에 따라 다른 쿼리 형식을 반환한다.
+    주어진 날짜(input_date)에 맞춰 SQL 날짜 조건 문자열을 생성하는 함수.
+    'yyyy-mm-dd', 'yyyy-mm', 'yyyy' 형식의 날짜를 해당 일/월/연 전체를 덮는 범위 조건으로 변환한다.
 
     Args:
-    input_date (list): 날짜 정보가 포함된 리스트. 'yyyy-mm-dd', 'yyyy-mm', 또는 'yyyy' 형식.
-    date_type (str): 날짜의 포맷. 기본값은 "%Y-%m-%d"이며, input_date가 없을 경우 오늘 날짜로 설정할 때 사용됨.
+    input_date (list | DateRangeSet): 날짜 정보가 포함된 시퀀스. 'yyyy-mm-dd', 'yyyy-mm', 또는 'yyyy' 형식.
+    date_type (str): 날짜의 포맷. 기본값은 "%Y-%m-%d"이며, 날짜 형식을 알 수 없을 때 오늘 날짜를 만들 때 사용됨.
+    column (str): 조건을 걸 날짜 컬럼. 기본값은 tb_received_paid의 rp_date.
 
     Returns:
-    str: SQL 쿼리 형식의 문자열.
+    tuple: ("AND 날짜 조건" SQL, 바인딩 값)
     """
     
-    # input_date가 None이거나 빈 리스트인 경우 오늘 날짜로 설정
+    # input_date가 None이거나 빈 리스트인 경우 조건 없음
     if not input_date:
-        date_query = ""
+        date_query = EMPTY_SQL
         return date_query
-        # input_date = [datetime.strftime(datetime.today(), date_type)]
-    
-    # 날짜 형식에 따른 처리
-    first_date = input_date[0]
 
-    if len(first_date) == 10:  # 형식이 'yyyy-mm-dd'
-        date_query = "AND rp_date IN ("
-        date_query += ", ".join(f'"{date}"' for date in input_date)
-        date_query += ")"
-        return date_query
+    date_condition = date_range_condition(column, input_date)
+    if date_condition == EMPTY_SQL:
+        # 날짜 형식을 알 수 없는 경우 오늘(date_type 단위)로 설정
+        date_condition = date_range_condition(column, datetime.strftime(datetime.today(), date_type))
+    return sql_join("AND ", date_condition)
+    
+# ===== Monthly Rollup =====
+# tb_received_paid_monthly: (user_id, rp_month, rp_part, rp_hold, rp_detail)별 월 집계
+#   rp_count(건수), rp_total(합계), rp_max/rp_max_date(최고 금액과 그 날짜), rp_min/rp_min_date(최저 금액과 그 날짜)
+# 거래를 추가/삭제할 때 Node(config/monthlyRollup.js)가 같은 트랜잭션 안에서 갱신합니다.
+# 기간이 월 단위로 나누어떨어지면 합계/평균/최고/최저 질문은 거래 행 대신 (월 x 내역) 수만큼의 집계 행만 읽습니다.
+MONTHLY_ROLLUP_TABLE = 'tb_received_paid_monthly'
+USE_MONTHLY_ROLLUP = os.environ.get('CHATBOT_MONTHLY_ROLLUP', '1') == '1'
+# 요청별 사용 여부: Node가 집계 테이블을 거래 테이블과 맞추지 못했으면 요청에 monthly_rollup: false를 보냄
+_monthly_rollup_enabled = contextvars.ContextVar('monthly_rollup_enabled', default=True)
+
+
+def process_month_format(input_date):
+    """
+    기간의 모든 구간이 월의 첫날에 시작해 다음 달 첫날 전에 끝나면 월 집계 테이블의 rp_month 조건을 만듭니다.
 
-    elif len(first_date) == 7:  # 형식이 'yyyy-mm'
-        date_query = "AND (" + " OR ".join(f'rp_date LIKE "{date}%"' for date in input_date) + ")"
-        return date_query
+    Returns:
+    tuple | None: ("AND rp_month >= ? AND rp_month < ?" 형식의 조건, 바인딩 값). 월 단위로 나누어떨어지지 않으면 None.
+    """
+    if not USE_MONTHLY_ROLLUP or not _monthly_rollup_enabled.get() or not input_date:
+        return None
+    ranges = DateRangeSet.covering(input_date).half_open()
+    if not ranges or any(start.day != 1 or end.day != 1 for start, end in ranges):
+        return None
+    return sql_join("AND ", date_range_condition('rp_month', input_date))
+
+
+def generate_query_rollup(rp_part, add_query, month_query, query_type):
+    """월 집계 테이블로 합계/평균/최고/최저 쿼리를 만듭니다. 결과 컬럼 이름은 거래 테이블 쿼리와 같습니다."""
+    where = sql_join(f"WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} ", month_query)
+    if query_type == 'sum':
+        return sql_join(f"SELECT SUM(rp_total) as Total_amount FROM {MONTHLY_ROLLUP_TABLE} ", where)
+    if query_type == 'avg':
+        return sql_join(f"SELECT SUM(rp_total) / SUM(rp_count) as Average_amount FROM {MONTHLY_ROLLUP_TABLE} ", where)
+    if query_type == 'highest':
+        return sql_join(f"SELECT rp_max_date AS rp_date, rp_detail, rp_max AS rp_amount FROM {MONTHLY_ROLLUP_TABLE} ", where, " ORDER BY rp_max DESC LIMIT 1")
+    if query_type == 'lowest':
+        return sql_join(f"SELECT rp_min_date AS rp_date, rp_detail, rp_min AS rp_amount FROM {MONTHLY_ROLLUP_TABLE} ", where, " ORDER BY rp_min ASC LIMIT 1")
+    return None
 
-    elif len(first_date) == 4:  # 형식이 'yyyy'
-        date_query = "AND (" + " OR ".join(f'rp_date LIKE "{date}%"' for date in input_date) + ")"
-        return date_query
 
-    else:
-        today_date = datetime.strftime(datetime.today(), date_type)
-        date_query = f'AND rp_date LIKE "{today_date}%"'
-        return date_query
-    
 # 주식 수량을 위한 패턴
 def process_date_format_stock_qty(input_date, date_type='%Y-%m-%d'):
-    if input_date == None:
-        input_date = [datetime.strftime(datetime.today(), date_type)]  # 오늘
-
-    if len(input_date[0]) == 10:  # 형식이 'yyyy-mm-dd'
-        date_query = f"AND sh_date <= '{input_date[0]}'"
-        return date_query
+    """
+    기간의 마지막 날까지(그 날 포함)의 거래를 더해 보유 수량을 구하는 조건을 만듭니다.
+    'yyyy-mm'/'yyyy'는 그 달/해의 마지막 날까지이며, 기간이 없거나 알 수 없는 형식이면 오늘까지입니다.
 
-    elif len(input_date[0]) == 7:  # 형식이 'yyyy-mm'
-        year, month = map(int, input_date[0].split('-'))
-        last_day = calendar.monthrange(year, month)[1]  # 그 달의 마지막 날 계산
-        end_date = datetime(year, month, last_day).strftime('%Y-%m-%d')  # 그 달의 마지막 날
-        date_query = f"AND sh_date <= '{end_date}'"
-        return date_query
+    Returns:
+    tuple: ("AND sh_date < ?" 조건, (마지막 날 다음 날,))
+    """
+    ranges = DateRangeSet.covering(input_date).half_open() if input_date else []
+    if not ranges:
+        ranges = DateRangeSet.covering(datetime.strftime(datetime.today(), date_type)).half_open()
+    return "AND sh_date < ?", (f"{ranges[-1][1]:%Y-%m-%d}",)
 
-    elif len(input_date[0]) == 4:  # 형식이 'yyyy'
-        year = int(input_date[0])
-        end_date = datetime(year, 12, 31).strftime('%Y-%m-%d')  # 그 해의 12월 31일
-        date_query = f"AND sh_date <= '{end_date}'"
-        return date_query
-    else:
-        end_date = datetime.strftime(datetime.today(), date_type)
-        date_query = f"AND sh_date <= '{end_date}'"
-        return date_query
+def generate_query_expend(ent1, rp_part, add_query, date_query, query_type, month_query=None):
+    # 월 단위 기간이면 월 집계 테이블에서 조회 (top5/bottom5는 여러 거래 행이 필요하므로 거래 테이블 사용)
+    if month_query and query_type in ('highest', 'lowest'):
+        return generate_query_rollup(rp_part, add_query, month_query, query_type)
 
-def generate_query_expend(ent1, rp_part, add_query, date_query, query_type):
     # 기본 쿼리 템플릿
-    base_query = (
+    base_query = sql_join(
         "SELECT rp_date, rp_detail, rp_amount "
         "FROM tb_received_paid "
-        "WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} {date_query} "
-    ).format(rp_part=rp_part, add_query=add_query, date_query=date_query)
+        f"WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} ", date_query, " "
+    )
 
     # 'frequent' 타입은 특별한 쿼리 구조를 가짐
     if query_type == 'frequent':
-        frequent_query = (
-            "AND rp_detail IN ("
-            "SELECT rp_detail FROM tb_received_paid "
-            "WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} {date_query} "
-            "GROUP BY rp_detail HAVING COUNT(*) >= 3 ORDER BY COUNT(*) DESC"
-            ") "
-            "ORDER BY rp_detail DESC, rp_amount LIMIT 3;"
-        ).format(rp_part=rp_part, add_query=add_query, date_query=date_query)
-        return base_query + frequent_query
+        # 3건 이상인 내역은 월 단위 기간이면 월 집계의 건수 합으로 찾음
+        if month_query:
+            frequent_details = sql_join(
+                f"SELECT rp_detail FROM {MONTHLY_ROLLUP_TABLE} "
+                f"WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} ", month_query,
+                " GROUP BY rp_detail HAVING SUM(rp_count) >= 3 ORDER BY SUM(rp_count) DESC"
+            )
+        else:
+            frequent_details = sql_join(
+                "SELECT rp_detail FROM tb_received_paid "
+                f"WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} ", date_query,
+                " GROUP BY rp_detail HAVING COUNT(*) >= 3 ORDER BY COUNT(*) DESC"
+            )
+        return sql_join(base_query, "AND rp_detail IN (", frequent_details, ") ORDER BY rp_detail DESC, rp_amount LIMIT 3;")
 
     # 쿼리 타입에 따른 ORDER BY 절과 LIMIT 값을 매핑
     query_mapping = {
@@ -1007,22 +1408,23 @@ def generate_query_expend(ent1, rp_part, add_query, date_query, query_type):
     if query_type in query_mapping:
         order_by = query_mapping[query_type]['order_by']
         limit = query_mapping[query_type]['limit']
-        return base_query + f"ORDER BY {order_by} LIMIT {limit}"
+        return sql_join(base_query, f"ORDER BY {order_by} LIMIT {limit}")
 
     return None
 
 def generate_query_TRANSACTION(detail, add_query, date_query, order_by=None, limit=None, frequent=False):
-    base_query = f'SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_detail = "{detail}" {add_query} {date_query}'
+    detail_query = ('rp_detail = ?', (detail,))
+    base_query = sql_join('SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {user_id} AND ', detail_query, f' {add_query} ', date_query)
     if frequent:
         # 자주 발생한 데이터를 찾기 위한 추가 쿼리
-        base_query = f'SELECT rp_detail, COUNT(*) as freq, SUM(rp_amount) as Total_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_detail = "{detail}" {add_query} {date_query} GROUP BY rp_detail HAVING COUNT(*) >= 3'
+        base_query = sql_join('SELECT rp_detail, COUNT(*) as freq, SUM(rp_amount) as Total_amount FROM tb_received_paid WHERE user_id = {user_id} AND ', detail_query, f' {add_query} ', date_query, ' GROUP BY rp_detail HAVING COUNT(*) >= 3')
     if order_by:
-        base_query += f' ORDER BY rp_amount {order_by}'
+        base_query = sql_join(base_query, f' ORDER BY rp_amount {order_by}')
     if limit:
-        base_query += f' LIMIT {limit}'
+        base_query = sql_join(base_query, f' LIMIT {limit}')
     return base_query
 
-def finance_pattern_query(finance_query, input_time=None, entity1=None, entity2=None, date_query=None, text=None):
+def finance_pattern_query(finance_query, input_time=None, entity1=None, entity2=None, date_query=None, text=None, month_query=None):
     
     query = {}
     no_space_text = text.replace(" ", "")
@@ -1038,33 +1440,38 @@ def finance_pattern_query(finance_query, input_time=None, entity1=None, entity2=
 
                 if ent2[1] == "sum":
                     rp_part = 1 if finance_query == "지출" or r'구매|구입|\b산\b' in no_space_text else 0
-                    query[f'{add_str}{finance_type}_sum'] = f'SELECT SUM(rp_amount) as Total_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} ' + date_query
+                    if month_query:
+                        query[f'{add_str}{finance_type}_sum'] = generate_query_rollup(rp_part, add_query, month_query, 'sum')
+                    else:
+                        query[f'{add_str}{finance_type}_sum'] = sql_join(f'SELECT SUM(rp_amount) as Total_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} ', date_query)
                 
                 elif ent2[1] == "average":
                     rp_part = 1 if finance_query == "지출" or r'구매|구입|\b산\b' in no_space_text else 0
-                    query[f'{add_str}{finance_type}_avg'] = f'SELECT AVG(rp_amount) as Average_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} ' + date_query
+                    if month_query:
+                        query[f'{add_str}{finance_type}_avg'] = generate_query_rollup(rp_part, add_query, month_query, 'avg')
+                    else:
+                        query[f'{add_str}{finance_type}_avg'] = sql_join(f'SELECT AVG(rp_amount) as Average_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} ', date_query)
                 
                 elif ent2[1] == "sort":
                     rp_part = 1 if finance_query == "지출" or r'구매|구입|\b산\b' in no_space_text else 0
                     if any(word in no_space_text for word in ["큰", "크게", "높은", "높게"]):
                         if any(word in no_space_text for word in ["가장", "최고", "제일"]):
-                            query[f'{add_str}{finance_type}_highest'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'highest')
+                            query[f'{add_str}{finance_type}_highest'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'highest', month_query)
                         else:
-                            query[f'{add_str}{finance_type}_top5'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'top5')
+                            query[f'{add_str}{finance_type}_top5'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'top5', month_query)
                     
                     elif any(word in no_space_text for word in ["작은", "적게", "낮은", "낮게", "적은", "작게"]):
                         if any(word in no_space_text for word in ["가장", "최고", "제일"]):
-                            query[f'{add_str}{finance_type}_lowest'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'lowest')
+                            query[f'{add_str}{finance_type}_lowest'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'lowest', month_query)
                         else:
-                            query[f'{add_str}{finance_type}_bottom5'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'bottom5')
+                            query[f'{add_str}{finance_type}_bottom5'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'bottom5', month_query)
                     
                     elif any(word in no_space_text for word in ["자주", "많이", "빈번", "반복", "주요", "많은"]):
-                        query[f'{add_str}{finance_type}_frequent'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'frequent')
+                        query[f'{add_str}{finance_type}_frequent'] = generate_query_expend(ent1, rp_part, add_query, date_query, 'frequent', month_query)
 
                 elif ent2[1] == "simple":  # None일 때 sum, average, sort 조건 제외한 쿼리만 추가
                     rp_part = 1 if finance_query == "지출" or r'구매|구입|\b산\b' in no_space_text else 0
-                    query[f'{add_str}{finance_type}_simple'] = f"SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} {date_query}"
-
+                    query[f'{add_str}{finance_type}_simple'] = sql_join(f"SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = {rp_part} {add_query} ", date_query)
 
 
     elif finance_query == "예산":
@@ -1084,8 +1491,9 @@ def finance_pattern_query(finance_query, input_time=None, entity1=None, entity2=
                     "WHERE user_id = {user_id} AND rp_date BETWEEN DATE_ADD(NOW(), INTERVAL -3 MONTH) AND NOW() AND rp_part = 1;"
                 )
             else:
-                query["예산"] = (
-                    f'SELECT uf.uf_target_budget, rp.rp_amount FROM tb_user_finance uf CROSS JOIN tb_received_paid rp WHERE uf.user_id = {{user_id}} AND rp.user_id = {{user_id}} AND rp.rp_date LIKE ("{input_time}%")')
+                query["예산"] = sql_join(
+                    'SELECT uf.uf_target_budget, rp.rp_amount FROM tb_user_finance uf CROSS JOIN tb_received_paid rp WHERE uf.user_id = {user_id} AND rp.user_id = {user_id} AND ',
+                    date_range_condition("rp.rp_date", input_time))
                 
 
         elif re.fullmatch(r'\d{4}', input_time):
@@ -1102,27 +1510,26 @@ def finance_pattern_query(finance_query, input_time=None, entity1=None, entity2=
                 query["예외"] = f"올해 예산 조회는 불가능합니다.\n{this_month.strftime('%Y-%m')}만 조회가 가능합니다." 
 
 
-
     elif finance_query == "저축":
 
         detail_conditions = {
-            "예금": "rp_detail = '정기 예금'",
-            "적금": "rp_detail = '적금'",
-            "예적금": "(rp_detail = '정기 예금' OR rp_detail = '적금')",
-            "저축": "(rp_detail = '정기 예금' OR rp_detail = '적금')",
-            "저금": "(rp_detail = '정기 예금' OR rp_detail = '적금')",
+            "예금": ("rp_detail = ?", ('정기 예금',)),
+            "적금": ("rp_detail = ?", ('적금',)),
+            "예적금": ("(rp_detail = ? OR rp_detail = ?)", ('정기 예금', '적금')),
+            "저축": ("(rp_detail = ? OR rp_detail = ?)", ('정기 예금', '적금')),
+            "저금": ("(rp_detail = ? OR rp_detail = ?)", ('정기 예금', '적금')),
         }
         for i in range(len(entity1)):
-            detail_query = detail_conditions.get(entity1[i][0], "")
+            detail_query = detail_conditions.get(entity1[i][0], EMPTY_SQL)
 
             if entity2[0][1] == "stats":
-                query[f'{entity1[i][0]}_stats'] = f'SELECT rp_date, rp_detail, rp_amount, SUM(rp_amount) OVER () AS Total_Amount FROM tb_received_paid WHERE user_id = 10 AND rp_part = 1 AND {detail_query} {date_query} ORDER BY rp_date ASC'
+                query[f'{entity1[i][0]}_stats'] = sql_join('SELECT rp_date, rp_detail, rp_amount, SUM(rp_amount) OVER () AS Total_Amount FROM tb_received_paid WHERE user_id = {user_id} AND rp_part = 1 AND ', detail_query, ' ', date_query, ' ORDER BY rp_date ASC')
                 
             elif entity2[0][1] in ["sum", "date"]:
                 sum_or_date = "SUM(rp_amount) AS Total_Amount" if entity2[0][1] == "sum" else "rp_date, rp_amount"
-                query[f'{entity1[i][0]}_sum'] = f'SELECT rp_detail, {sum_or_date} FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = 1 AND {detail_query} {date_query}'
+                query[f'{entity1[i][0]}_sum'] = sql_join(f'SELECT rp_detail, {sum_or_date} FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = 1 AND ', detail_query, ' ', date_query)
             else:
-                query[f'{entity1[i][0]}_simple'] = f'SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_part = 1 AND {detail_query} {date_query} ORDER BY rp_date ASC'
+                query[f'{entity1[i][0]}_simple'] = sql_join('SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {user_id} AND rp_part = 1 AND ', detail_query, ' ', date_query, ' ORDER BY rp_date ASC')
 
         return query
     
@@ -1143,9 +1550,9 @@ def finance_pattern_query(finance_query, input_time=None, entity1=None, entity2=
             
             if e2 == "sum":
                 if is_deposit(text, e1):
-                    query[f"{add_str}입금_sum"] = f'SELECT SUM(rp_amount) as Total_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_detail = "입금" {add_query} {date_query}'
+                    query[f"{add_str}입금_sum"] = sql_join(f'SELECT SUM(rp_amount) as Total_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND ', ('rp_detail = ?', ('입금',)), f' {add_query} ', date_query)
                 elif is_withdrawal(text, e1):
-                    query[f"{add_str}출금_sum"] = f'SELECT SUM(rp_amount) as Total_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_detail = "출금" {add_query} {date_query}'
+                    query[f"{add_str}출금_sum"] = sql_join(f'SELECT SUM(rp_amount) as Total_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND ', ('rp_detail = ?', ('출금',)), f' {add_query} ', date_query)
             
             elif e2 == "sort":
                 if any(word in text for word in ["큰", "크게", "높은"]):
@@ -1185,28 +1592,26 @@ def finance_pattern_query(finance_query, input_time=None, entity1=None, entity2=
                         )
             elif e2 == "average":
                 if is_deposit(text, e2):
-                    query[f"{add_str}입금_avg"] = f'SELECT AVG(rp_amount) as Average_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_detail = "입금" {add_query} {date_query}'
+                    query[f"{add_str}입금_avg"] = sql_join(f'SELECT AVG(rp_amount) as Average_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND ', ('rp_detail = ?', ('입금',)), f' {add_query} ', date_query)
                 elif is_withdrawal(text, e2):
-                    query[f"{add_str}출금_avg"] = f'SELECT AVG(rp_amount) as Average_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_detail = "출금" {add_query} {date_query}'
+                    query[f"{add_str}출금_avg"] = sql_join(f'SELECT AVG(rp_amount) as Average_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND ', ('rp_detail = ?', ('출금',)), f' {add_query} ', date_query)
 
             else:
                 if is_deposit(text, e1):
-                    query[f"{add_str}입금_simple"] = f'SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_detail = "입금" {add_query} {date_query}'
+                    query[f"{add_str}입금_simple"] = sql_join(f'SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND ', ('rp_detail = ?', ('입금',)), f' {add_query} ', date_query)
                 elif is_withdrawal(text, e1):
-                    query[f"{add_str}출금_simple"] = f'SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND rp_detail = "출금" {add_query} {date_query}'
-
+                    query[f"{add_str}출금_simple"] = sql_join(f'SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {{user_id}} AND ', ('rp_detail = ?', ('출금',)), f' {add_query} ', date_query)
 
 
     elif finance_query == "자산":
         query["링크"] = "https://localhost:3000/myassetplaner"
 
 
-
     elif finance_query == "대출":
         for _ in range(len(entity1)):
             if "상환" in text:
                 # query['대출'] = 'SELECT uf_loan FROM tb_user_finance WHERE user_id = {user_id}'
-                query['대출상환'] = f'SELECT uf.user_id, uf.uf_loan, rp.rp_date, rp.rp_detail, rp.rp_amount, ra.rp_all AS rp_all FROM tb_user_finance uf JOIN tb_received_paid rp ON uf.user_id = rp.user_id JOIN (SELECT sum(rp_amount) AS rp_all FROM tb_received_paid WHERE rp_detail="대출 상환"AND user_id={user_id}) AS ra ON uf.user_id = rp.user_id WHERE rp.rp_detail = "대출 상환" AND uf.user_id={user_id}' + " " + date_query
+                query['대출상환'] = sql_join('SELECT uf.user_id, uf.uf_loan, rp.rp_date, rp.rp_detail, rp.rp_amount, ra.rp_all AS rp_all FROM tb_user_finance uf JOIN tb_received_paid rp ON uf.user_id = rp.user_id JOIN (SELECT sum(rp_amount) AS rp_all FROM tb_received_paid WHERE ', ('rp_detail = ?', ('대출 상환',)), ' AND user_id={user_id}) AS ra ON uf.user_id = rp.user_id WHERE ', ('rp.rp_detail = ?', ('대출 상환',)), ' AND uf.user_id={user_id} ', date_query)
                 # query['갚은대출'] = f'SELECT SUM(rp_amount) as sum_loan_amount FROM tb_received_paid WHERE user_id = {user_id} AND rp_detail = "대출 상환"'
                 text = text.replace("상환", "", 1)
             elif "대출":
@@ -1215,65 +1620,49 @@ def finance_pattern_query(finance_query, input_time=None, entity1=None, entity2=
 
 
     elif finance_query == "가계부":
-        query[f'전체내역'] = 'SELELT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {user_id}' + " " + date_query
+        query[f'전체내역'] = sql_join('SELECT rp_date, rp_detail, rp_amount FROM tb_received_paid WHERE user_id = {user_id}', " ", date_query)
     return query
 
 
+# tb_shares_held의 종목 컬럼 -> 결과 컬럼 이름 뒤에 붙는 약자 (total_ss, buy_ss, sell_ss ...)
+HOLDINGS_COLUMNS = {'sh_ss_count': 'ss', 'sh_ap_count': 'ap', 'sh_bit_count': 'bit'}
+# 수량 행은 구매는 양수, 판매는 음수로 기록되므로 보유 수량은 합계, 구매/판매 수량은 양수/음수만 더한 값
+HOLDINGS_MEASURES = {'total': 'SUM({column})', 'buy': 'SUM(GREATEST({column}, 0))', 'sell': 'SUM(LEAST({column}, 0))'}
+
+
+def holdings_query(columns, measures, date_query):
+    """질문한 종목들의 보유/구매/판매 수량을 한 번의 조회로 구하는 SQL"""
+    select = ', '.join(f"{HOLDINGS_MEASURES[measure].format(column=column)} AS {measure}_{HOLDINGS_COLUMNS[column]}"
+                       for column in columns for measure in measures)
+    return sql_join(f'SELECT {select} FROM tb_shares_held WHERE user_id = {{user_id}} ', date_query)
+
 
 def pattern_stock(entity, input_date, text=None):  # [('삼성', 'STOCK'), ('애플', 'STOCK'), ('산', 'buy')]
-    query, entity_list, entity_str = {}, [], ''
+    query = {}
     buy = r"구매|구입|매입|매수|투자|사고|\b산\b"
     sell = r"판매|매도|\b판\b|처분|팔고"
     stock_mapping = {"삼성": "sh_ss_count", "삼전": "sh_ss_count", "samsung": "sh_ss_count",
                     "애플": "sh_ap_count", "apple": "sh_ap_count",
                     "비트코인": "sh_bit_count", "코인": "sh_bit_count", "bitcoin": "sh_bit_count", "coin": "sh_bit_count"}
 
-    for i, j in entity:
-        if i in stock_mapping:
-            entity_list.append(stock_mapping[i])
-            break
-        for stock in entity_list:
-            entity_str += f'{str(stock)}, '
-
-    if sell in text and buy in text:
-        date_query = process_date_format(input_date, date_query="AND sh_date IN (")
-        if len(entity_list) == 0:
-            query['주식거래'] = 'SELECT sh_date, sh_ss_count, sh_ap_count, sh_bit_count FROM tb_shares_held WHERE user_id = {{user_id}}' + date_query
-        elif len(entity_list) == 1:
-            query[f'{entity_list[0]}거래'] = f'SELECT {entity_str} FROM tb_shares_held' + ' WHERE user_id = {{user_id}}' + date_query
-        else:
-            for i in range(len(entity_list)):
-                query[f'{entity_list[i]}거래'] = f'SELECT {entity_str} FROM tb_shares_held' + ' WHERE user_id = {{user_id}}' + date_query
-        return query
-    elif buy in text:
-        date_query = process_date_format(input_date, date_query="AND sh_date IN (")
-        if len(entity_list) == 0:
-            query['주식구매'] = 'SELECT sh_date, sh_ss_count, sh_ap_count, sh_bit_count FROM tb_shares_held WHERE user_id = {{user_id}} AND (sh_ss_count > 0 OR sh_ap_count > 0 OR sh_bit_count > 0)' + " " + date_query
-        elif len(entity_list) == 1:
-            query[f'{entity_list[0]}구매'] = f'SELECT {entity_str} FROM tb_shares_held' + ' WHERE user_id = {{user_id}}' + f' AND {entity_list[0]} > 0' + " " + date_query
-        else:
-            for i in range(len(entity_list)):
-                query[f'{entity_list[i]}구매'] = f'SELECT {entity_str} FROM tb_shares_held' + ' WHERE user_id = {{user_id}}' + f' AND {entity_list[i]} > 0' + " " + date_query
-        return query
-    elif sell in text:
-        date_query = process_date_format(input_date, date_query="AND sh_date IN (")
-        if len(entity_list) == 0:
-            query['주식판매'] = 'SELECT sh_date, sh_ss_count, sh_ap_count, sh_bit_count FROM tb_shares_held WHERE user_id = {{user_id}} AND (sh_ss_count < 0 OR sh_ap_count < 0 OR sh_bit_count < 0)' + " " + date_query
-        elif len(entity_list) == 1:
-            query[f'{entity_list[0]}판매'] = f'SELECT {entity_list[0]} FROM tb_shares_held' + ' WHERE user_id = {{user_id}}' + f' AND {entity_list[0]} < 0' + " " + date_query
+    # 질문에 나온 종목 (없으면 전체 종목). 여러 종목도 하나의 쿼리로 조회
+    columns = list(dict.fromkeys(stock_mapping[i] for i, j in entity if i in stock_mapping)) or list(HOLDINGS_COLUMNS)
+    bought, sold = bool(re.search(buy, text or '')), bool(re.search(sell, text or ''))
+
+    if bought or sold:
+        # 기간 중 구매/판매한 수량
+        date_query = process_date_format(input_date, column="sh_date")
+        if bought and sold:
+            query['주식거래'] = holdings_query(columns, ('buy', 'sell'), date_query)
+        elif bought:
+            query['주식구매'] = holdings_query(columns, ('buy',), date_query)
         else:
-            for i in range(len(entity_list)):
-                query[f'{entity_list[i]}판매'] = f'SELECT {entity_list[i]} FROM tb_shares_held' + ' WHERE user_id = {{user_id}}' + f' AND {entity_list[i]} < 0' + " " + date_query
+            query['주식판매'] = holdings_query(columns, ('sell',), date_query)
         return query
     else:
+        # 기간의 마지막 날 기준 보유 수량
         date_query = process_date_format_stock_qty(input_date, date_type="%Y-%m-%d")
-        if len(entity_list) == 0:
-            query['주식내역'] = 'SELECT sh_date, SUM(sh_ss_count) as total_ss, SUM(sh_ap_count) as total_ap, SUM(sh_bit_count) as total_bit FROM tb_shares_held WHERE user_id = {{user_id}}' + " " + date_query
-        elif len(entity_list) == 1:
-            query[f'{entity_list[0]}주식내역'] = f'SELECT SUM({entity_list[0]}) as total_{entity_list[0]} FROM tb_shares_held WHERE user_id = {{user_id}} {date_query}'
-        else:
-            for i in range(len(entity_list)):
-                query[f'{entity_list[i]}주식내역'] = f'SELECT SUM({entity_list[i]}) as total_{entity_list[i]} FROM tb_shares_held WHERE user_id = {{user_id}} {date_query}'
+        query['주식내역'] = holdings_query(columns, ('total',), date_query)
         return query
 
 
@@ -1315,11 +1704,12 @@ def process_fixed_dates_original(input_date, text):
 
     if isinstance(input_date, str):
         input_date = [input_date]
-    input_dates = []
+    # 조회할 날짜를 일 단위 구간으로 모음 (지난 한 달/한 해도 구간 하나로 표현)
+    intervals = []
 
     # "고정"이 text에 포함된 경우 처리
     if input_date == None:
-        date_query = ""
+        date_query = EMPTY_SQL
 
     elif "고정" in text or "고 정" in text:
         for x in range(len(input_date)):
@@ -1336,27 +1726,19 @@ def process_fixed_dates_original(input_date, text):
                 for day in input_date:
                     day_str = str(day)
                     if len(day_str) == 10:
-                        input_dates.append(today.strftime("%Y-%m-%d"))
+                        intervals.append((today.date(), today.date()))
 
                     elif len(day_str) == 7:
-                        start_date = one_month_ago + timedelta(days=1)
-                        end_date = today
-                        while start_date <= end_date:
-                            input_dates.append(start_date.strftime("%Y-%m-%d"))
-                            start_date += timedelta(days=1)
+                        intervals.append(((one_month_ago + timedelta(days=1)).date(), today.date()))
 
                     elif len(day_str) == 4:
-                        start_date = one_year_ago + timedelta(days=1)
-                        end_date = today
-                        while start_date <= end_date:
-                            input_dates.append(start_date.strftime("%Y-%m-%d"))
-                            start_date += timedelta(days=1)
+                        intervals.append(((one_year_ago + timedelta(days=1)).date(), today.date()))
 
             # input_date가 현재 날짜보다 과거인 경우
             elif input_date_compare < today:
-                input_dates.append(input_date[x])
+                intervals += DateRangeSet.covering(input_date[x]).intervals
 
-    date_query = process_date_format(input_dates) if input_date else ""
+    date_query = process_date_format(DateRangeSet('day', intervals)) if input_date else EMPTY_SQL
     return date_query
 
 
@@ -1401,7 +1783,8 @@ def finance_create_query(text):
                 date_query = process_date_format(input_date)
             else:
                 date_query = process_date_format(input_date)
-            return finance_pattern_query(finance_query=entity1pattern, entity1=entity1, entity2=entity2, date_query=date_query, text=text)
+            month_query = process_month_format(input_date)
+            return finance_pattern_query(finance_query=entity1pattern, entity1=entity1, entity2=entity2, date_query=date_query, text=text, month_query=month_query)
 
         elif entity1pattern == "예산":
             input_date = split_and_return_periods(text, True)
@@ -1440,6 +1823,7 @@ def finance_create_query(text):
             query = { "예외": "죄송합니다. 2개 이상의 재무정보는 한번에 답변이 불가능합니다." }
             return query
 
+
 def finance_clean_query(text):
     query = finance_create_query(text)
     complite_query = {}
@@ -1450,6 +1834,17 @@ def finance_clean_query(text):
             temp_value.add(j)
     return complite_query
 
+def stock_date_condition(text):
+    """
+    주식 질문의 기간을 fd_date 범위 조건으로 변환합니다. 기간이 없으면 어제 하루를 조회합니다.
+    월/연 단위 기간은 해당 월/연 전체(오늘까지)를 조회하며, 오늘 이후만 남는 경우 EMPTY_SQL을 반환합니다.
+    """
+    today = datetime.now(kst).date()
+    dates = split_and_return_periods(text, True)  # 미래 날짜도 포함
+    if not dates:
+        return date_range_condition('fd_date', (today - timedelta(days=1)).strftime('%Y-%m-%d'))
+    return date_range_condition('fd_date', DateRangeSet.covering(dates).until(today))
+
 def stockpricequery(text):
     entities = extract_stock_entities(text)
     stock_labels = ["삼성전자", "애플", "비트코인"]
@@ -1458,39 +1853,10 @@ def stockpricequery(text):
     if not requested_stocks:
         return {"예외": "조회할 주식 종목을 명확히 알려주세요."}
 
-    # 날짜 처리
-    today = datetime.now(kst)
-    yesterday = today - timedelta(days=1)
-    dates = split_and_return_periods(text, True)  # 미래 날짜도 포함
-    if dates:
-        converted_dates = []
-        for date_str in dates:
-            try:
-                if len(date_str) == 10:
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                elif len(date_str) == 7:
-                    date_obj = datetime.strptime(date_str, '%Y-%m')
-                elif len(date_str) == 4:
-                    date_obj = datetime.strptime(date_str, '%Y')
-                else:
-                    continue
-                date_obj = kst.localize(date_obj)
-                converted_dates.append(date_obj)
-            except ValueError:
-                continue
-        past_dates = [date for date in converted_dates if date <= today]
-        if not past_dates:
-            return {"예외": "미래 예측 데이터는 이곳에서 확인해 주세요.\nhttps://localhost:3000/stockprediction"}
-    else:
-        # 날짜가 없으면 오늘 날짜로 설정
-        past_dates = [yesterday]
-
-    # 날짜 조건 생성
-    date_conditions = []
-    for date_obj in past_dates:
-        date_str = date_obj.strftime('%Y-%m-%d')
-        date_conditions.append(f"'{date_str}'")
-    date_condition = f"fd_date IN ({', '.join(date_conditions)})"  # 컬럼 이름 수정
+    # 날짜 처리 (미래 날짜도 포함하여 추출한 뒤 오늘 이후는 제외)
+    date_condition = stock_date_condition(text)
+    if date_condition == EMPTY_SQL:
+        return {"예외": "미래 예측 데이터는 이곳에서 확인해 주세요.\nhttps://localhost:3000/stockprediction"}
 
     # 종목별 컬럼 매핑
     stocks_map = {
@@ -1503,7 +1869,7 @@ def stockpricequery(text):
     stock_column = stocks_map.get(requested_stocks[0])
     if not stock_column:
         return {"예외": "해당 주식 종목에 대한 정보가 없습니다."}
-    query = f"SELECT fd_date, {stock_column} FROM tb_stock WHERE {date_condition} ORDER BY fd_date DESC;"  # 컬럼 이름 수정
+    query = sql_join(f"SELECT fd_date, {stock_column} FROM tb_stock WHERE ", date_condition, " ORDER BY fd_date DESC;")  # 컬럼 이름 수정
     return {f"{requested_stocks[0]}_주가": query}
 
 def stock_information_query(text):
@@ -1540,39 +1906,10 @@ def stock_information_query(text):
     if not requested_infos:
         return {"예외": "조회할 정보를 명확히 알려주세요. (PER, PBR, ROE, 시가총액 등)"}
 
-    # 날짜 처리
-    today = datetime.now(kst)
-    yesterday = today - timedelta(days=1)
-    dates = split_and_return_periods(text, True)  # 미래 날짜 포함
-    if dates:
-        converted_dates = []
-        for date_str in dates:
-            try:
-                if len(date_str) == 10:
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                elif len(date_str) == 7:
-                    date_obj = datetime.strptime(date_str, '%Y-%m')
-                elif len(date_str) == 4:
-                    date_obj = datetime.strptime(date_str, '%Y')
-                else:
-                    continue
-                date_obj = kst.localize(date_obj)
-                converted_dates.append(date_obj)
-            except ValueError:
-                continue
-        past_dates = [date for date in converted_dates if date <= today]
-        if not past_dates:
-            return {"예외": "미래 날짜의 정보는 제공할 수 없습니다."}
-    else:
-        # 날짜가 없을 경우 최신 날짜로 설정
-        past_dates = [yesterday]
-
-    # 날짜 조건 생성
-    date_conditions = []
-    for date_obj in past_dates:
-        date_str = date_obj.strftime('%Y-%m-%d')
-        date_conditions.append(f"'{date_str}'")
-    date_condition = f"fd_date IN ({', '.join(date_conditions)})"
+    # 날짜 처리 (미래 날짜 제외)
+    date_condition = stock_date_condition(text)
+    if date_condition == EMPTY_SQL:
+        return {"예외": "미래 날짜의 정보는 제공할 수 없습니다."}
 
     # SQL 쿼리 생성
     queries = {}
@@ -1583,7 +1920,7 @@ def stock_information_query(text):
             if not stock_info_column or not stock_price_column:
                 continue  # 해당 정보가 없으면 건너뜀
             query_key = f"{stock}_{info}"
-            query = f"SELECT fd_date, {stock_info_column}, {stock_price_column} FROM tb_stock WHERE {date_condition} ORDER BY fd_date DESC;"
+            query = sql_join(f"SELECT fd_date, {stock_info_column}, {stock_price_column} FROM tb_stock WHERE ", date_condition, " ORDER BY fd_date DESC;")
             queries[query_key] = query
 
     if not queries:
@@ -1613,7 +1950,9 @@ def stock_create_quary(text):
     elif "경제지표" in entities:
         return economic_indicator_query()
     elif "증시" in entities:
-        
+        stock_market_news = resources.get('stock_market_news')
+        if not stock_market_news:
+            return {"예외": "현재 증시 정보를 불러올 수 없습니다."}
         return {"증시": f"{stock_market_news}"}
     else:
         return {"예외": "올바른 주식 관련 질문을 해주세요."}
@@ -1627,192 +1966,252 @@ def make_query(predict, text):
         return { 'FAQ' : 'https://localhost:3000/faq' }
 
 
+# ================================================================================ Economic Entity Function ================================================================================
+# 재무 관련 패턴 정의 (pattern1: 재무 항목, pattern2: 조회 방식)
+finance_patterns = {
+    "지출": r"지출|소비|쓴|사용|결제|카드",
+    "소득": r"수입|소득|월급|급여",
+    "예산": r"예산",
+    "대출": r"대출",
+    "저축": r"적금|예금|저축|저금|예적금",
+    "입출금": r"입출금|입금|출금|이체|송금|인출|납부|입금내역",
+    "자산" : r"보유|자산|재정|재무|자본|재산|잔고",
+    "주식" : r"주식|삼성|삼전|애플|코인|비트코인|samsung|apple|coin|bitcoin",
+    "구매" : r"구매|구입|매입|매수|투자|\b산\b",
+    "판매" : r"판매|매도|\b판\b|처분",
+    "가계부": r"가계부|가계|금전",
+}
+finance_patterns2 = {
+    "stats" : r"비교|통계|보고|정리|분석|현황",  # 내역+합계
+    "simple" : r"내역|상황|항목|목록|기록|출처|조회|정보|사항|이력|내용",  # 내역
+    "sum" : r"합계|총액|총 금액|잔액|잔고|총합|누적|합산|총계|전체금액|최종금액",  # 합계
+    "average" : r"평균",  # 평균
+    "date" : r"언제",  # 날짜
+    "sort" : r"가장|큰|크게|작은|제일|많이|적게|높은|높게|낮은|낮게|순위|순서|자주|반복|빈번|주요|적은|많은",  # 정렬
+}
 
+REGEX_METACHARACTERS = set('.^$*+?{}[]\\()|')
 
-# ================================================================================ Economic Entity Function ================================================================================
-def extract_finance_entities(text):
-    patterns = {
-        "지출": r"지출|소비|쓴|사용|결제|카드",
-        "소득": r"수입|소득|월급|급여",
-        "예산": r"예산",
-        "대출": r"대출",
-        "저축": r"적금|예금|저축|저금|예적금",
-        "입출금": r"입출금|입금|출금|이체|송금|인출|납부|입금내역",
-        "자산" : r"보유|자산|재정|재무|자본|재산|잔고",
-        "주식" : r"주식|삼성|삼전|애플|코인|비트코인|samsung|apple|coin|bitcoin",
-        "구매" : r"구매|구입|매입|매수|투자|\b산\b",
-        "판매" : r"판매|매도|\b판\b|처분",
-        "가계부": r"가계부|가계|금전",
-    }
-    patterns2 = {
-        "stats" : r"비교|통계|보고|정리|분석|현황",  # 내역+합계
-        "simple" : r"내역|상황|항목|목록|기록|출처|조회|정보|사항|이력|내용",  # 내역
-        "sum" : r"합계|총액|총 금액|잔액|잔고|총합|누적|합산|총계|전체금액|최종금액",  # 합계
-        "average" : r"평균",  # 평균
-        "date" : r"언제",  # 날짜
-        "sort" : r"가장|큰|크게|작은|제일|많이|적게|높은|높게|낮은|낮게|순위|순서|자주|반복|빈번|주요|적은|많은",  # 정렬
-    }
+def is_word_char(ch):
+    """정규식 \\w와 같은 기준(유니코드 문자/숫자 또는 '_')으로 단어 문자인지 확인합니다."""
+    return ch.isalnum() or ch == '_'
 
-    # 패턴에 맞는 주요 키워드 추출 함수
-    def extract_main_keyword(text, pattern):
-        match = re.search(pattern, text)
-        if match:
-            return match.group(0)
-        return None
+class KeywordMatcher:
+    """
+    라벨별 키워드 패턴(예: r"지출|소비|\\b산\\b")을 Aho-Corasick 오토마톤 하나로 컴파일한 다중 키워드 매처입니다.
+    문장을 한 번 훑어서 모든 라벨의 키워드 위치를 찾으며, 비용은 키워드 수가 아니라 문장 길이와 매칭 수에 비례합니다.
 
-    # 텍스트에서 조사를 제거하는 함수
-    def clean_text(text):
-        cleaned_text = re.sub(r'(과|와|의|가|이|을|를|은|는|에서|으로|고|까지|부터|도|만|조차|뿐|에|와|에서|로)$', '', text)
-        return cleaned_text
-
-    # 사용자 정의 spaCy 파이프라인 컴포넌트
-    @spacy.Language.component("custom_finance_entity_adder")
-    def custom_finance_entity_adder(doc):
-        ents = []
-        seen_tokens = set()
-
-        for token in doc:
-            text_cleaned = clean_text(token.text)
-            # patterns1 검사
-            for label, pattern in patterns.items():
-                main_keyword = extract_main_keyword(text_cleaned, pattern)
-                if main_keyword and token.i not in seen_tokens:
-                    ent = Span(doc, token.i, token.i + 1, label=f"{label}_pattern1")
-                    ent._.set("cleaned_text", text_cleaned)
-                    ents.append(ent)
-                    seen_tokens.add(token.i)
-                    break
+    - 라벨 번호(label index)는 entries의 순서이며, 작은 번호가 우선순위가 높습니다. (기존 패턴 사전의 순회 순서와 동일)
+    - 패턴은 '|'로 구분한 리터럴 키워드만 허용하고, 키워드 양끝의 \\b는 단어 경계 조건으로 처리합니다.
+    """
 
-            for label, pattern in patterns2.items():
-                main_keyword = extract_main_keyword(text_cleaned, pattern)
-                if main_keyword and token.i not in seen_tokens:
-                    ent = Span(doc, token.i, token.i + 1, label=f"{label}_pattern2")
-                    ent._.set("cleaned_text", text_cleaned)
-                    ents.append(ent)
-                    seen_tokens.add(token.i)
-                    
-        doc.ents = ents
-        return doc
-    
-    # spaCy 모델 로드
-    nlp = spacy.load("ko_core_news_sm")
-    Span.set_extension("cleaned_text", default=None, force=True)
+    def __init__(self, entries):
+        """
+        Args:
+        - entries: (라벨, 패턴 문자열) 리스트 또는 {라벨: 패턴 문자열} 딕셔너리
+        """
+        entries = list(entries.items()) if isinstance(entries, dict) else list(entries)
+        self.labels = [label for label, _ in entries]
+        self.keywords = []  # (키워드, 라벨 번호, 단어 경계 필요 여부)
+
+        for index, (_, pattern) in enumerate(entries):
+            for keyword in pattern.split('|'):
+                boundary = keyword.startswith(r'\b') and keyword.endswith(r'\b')
+                if boundary:
+                    keyword = keyword[2:-2]
+                if not keyword or any(ch in REGEX_METACHARACTERS for ch in keyword):
+                    raise ValueError(f"리터럴 키워드만 사용할 수 있습니다: {pattern!r}")
+                self.keywords.append((keyword, index, boundary))
+
+        self._build()
+
+    def _build(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for keyword_index, (keyword, _, _) in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                if ch not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][ch] = len(self._goto) - 1
+                state = self._goto[state][ch]
+            self._out[state].append(keyword_index)
+
+        # 실패 링크를 너비 우선으로 계산하고, 실패 상태의 출력을 합침 (루트의 자식은 루트로 실패)
+        pending = list(self._goto[0].values())
+        for state in pending:
+            for ch, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def finditer(self, text, start=0, end=None):
+        """
+        text[start:end]에 나타나는 모든 키워드 위치를 (시작, 끝, 키워드 번호)로 반환합니다. (겹치는 매칭 포함, 경계 조건 미적용)
+        """
+        end = len(text) if end is None else end
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i in range(start, end):
+            ch = text[i]
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword_index in out[state]:
+                yield i + 1 - len(self.keywords[keyword_index][0]), i + 1, keyword_index
+
+    def boundary_ok(self, keyword_index, text, match_start, match_end, start=0, end=None):
+        """\\b 키워드가 text[start:end] 범위 안에서 단어 경계에 있는지 확인합니다. (범위 양끝은 경계로 취급)"""
+        if not self.keywords[keyword_index][2]:
+            return True
+        end = len(text) if end is None else end
+        before = match_start == start or not is_word_char(text[match_start - 1])
+        after = match_end == end or not is_word_char(text[match_end])
+        return before and after
+
+    def labels_in(self, text, start=0, end=None):
+        """text[start:end]에서 매칭된 라벨 번호 집합을 반환합니다."""
+        end = len(text) if end is None else end
+        return {
+            self.keywords[keyword_index][1]
+            for match_start, match_end, keyword_index in self.finditer(text, start, end)
+            if self.boundary_ok(keyword_index, text, match_start, match_end, start, end)
+        }
 
-    # custom_finance_entity_adder가 이미 파이프라인에 존재하면 제거
-    if "custom_finance_entity_adder" in nlp.pipe_names:
-        nlp.remove_pipe("custom_finance_entity_adder")
-    nlp.add_pipe("custom_finance_entity_adder", after="ner")
-    doc = nlp(text)
-    
-    # 엔티티 결과 수집
-    entities = {f"pattern{i}": [(ent._.get("cleaned_text"), ent.label_.replace(f"_pattern{i}", "")) for ent in doc.ents if f"_pattern{i}" in ent.label_] for i in (1, 2)}
-    if not entities['pattern2']:
-        entities['pattern2'].append(('기본값', 'simple'))
+# 텍스트에서 조사를 제거하는 함수
+def clean_finance_text(text):
+    cleaned_text = re.sub(r'(과|와|의|가|이|을|를|은|는|에서|으로|고|까지|부터|도|만|조차|뿐|에|와|에서|로)$', '', text)
+    return cleaned_text
+
+def finance_matcher_entries():
+    """pattern1 라벨이 pattern2 라벨보다 우선 (토큰마다 pattern1에서 먼저 찾고, 없으면 pattern2에서 찾음)"""
+    return ([(f"{label}_pattern1", pattern) for label, pattern in finance_patterns.items()]
+            + [(f"{label}_pattern2", pattern) for label, pattern in finance_patterns2.items()])
+
+finance_matcher = KeywordMatcher(finance_matcher_entries())
+
+# 사용자 정의 spaCy 파이프라인 컴포넌트 (모듈 로드 시 한 번만 등록)
+@spacy.Language.component("custom_finance_entity_adder")
+def custom_finance_entity_adder(doc):
+    text = doc.text
+    token_starts = [token.idx for token in doc]
+    cleaned_texts = [clean_finance_text(token.text) for token in doc]
+
+    # 문장 전체를 한 번 훑은 뒤, 각 매칭을 조사를 제거한 토큰 범위 안에 있는 경우에만 해당 토큰에 배정
+    best_labels = {}
+    for match_start, match_end, keyword_index in finance_matcher.finditer(text):
+        i = bisect.bisect_right(token_starts, match_start) - 1
+        if i < 0:
+            continue
+        span_start = token_starts[i]
+        span_end = span_start + len(cleaned_texts[i])
+        if match_end > span_end or not finance_matcher.boundary_ok(keyword_index, text, match_start, match_end, span_start, span_end):
+            continue
+        label_index = finance_matcher.keywords[keyword_index][1]
+        best_labels[i] = min(best_labels.get(i, label_index), label_index)
 
-    return entities
+    ents = []
+    for i in sorted(best_labels):
+        ent = Span(doc, i, i + 1, label=finance_matcher.labels[best_labels[i]])
+        ent._.set("cleaned_text", cleaned_texts[i])
+        ents.append(ent)
 
-def extract_stock_entities(text):
-    """주어진 텍스트에서 주식 관련 엔티티를 추출하는 통합 함수입니다."""
-    
-    # 주식 관련 패턴 정의
-    patterns1 = {
-        "주가": r"주가|주식|종가|가격|값",
-        "증시": r"증시|뉴스",
-        "예상": r"예상|예측|전망|앞으로",
-        "삼성전자": r"삼성전자|삼성|삼전|samsung",
-        "애플": r"애플|apple",
-        "비트코인": r"비트코인|bitcoin|비트|코인|coin",
-        "PER": r"PER|per|주가수익비율|Price Earning Ratio",
-        "PBR": r"PBR|pbr|주가순자산비율|Price Book-value Ratio",
-        "ROE": r"ROE|roe|자기자본이익률|Return on Equity",
-        "MC": r"MC|mc|시가총액|총액|시총|Market Cap",
-        "경제지표":r"경제지표|국내총생산|GDP|기준금리|IR|수입물가지수|IPI|생산자물가지수|PPI|소비자물가지수|CPI|외환보유액"
-    }
+    doc.ents = ents
+    return doc
 
-    # 패턴 통합
-    combined_patterns = {**patterns1}
 
-    # 텍스트에서 패턴에 맞는 주요 키워드 추출
-    def extract_main_keyword(text, pattern):
-        match = re.search(pattern, text)
-        if match:
-            return match.group(0)  # 매칭된 주요 키워드 반환
-        return None  # 매칭되지 않으면 None 반환
+@request_memo('finance_entities')
+def extract_finance_entities(text):
+    doc = run_entity_adder("custom_finance_entity_adder", text)
 
-    def clean_text(text):
-        # Komoran으로 형태소 분석을 수행
-        token_pos = komoran.pos(text)
-        cleaned_tokens = [word for word, pos in token_pos if not pos.startswith('J')]
-        cleaned_text = ''.join(cleaned_tokens)
+    # 엔티티 결과 수집
+    entities = {f"pattern{i}": [(ent._.get("cleaned_text"), ent.label_.replace(f"_pattern{i}", "")) for ent in doc.ents if f"_pattern{i}" in ent.label_] for i in (1, 2)}
+    if not entities['pattern2']:
+        entities['pattern2'].append(('기본값', 'simple'))
 
-        return cleaned_text
+    return entities
 
-    # 사용자 정의 spaCy 파이프라인 컴포넌트
-    @spacy.Language.component("custom_stock_entity_adder")
-    def custom_stock_entity_adder(doc):
-        new_ents = []
 
-        for token in doc:
-            # 형태소 분석을 통해 명사와 동사/형용사 추출
-            token_pos = komoran.pos(token.text)
-            
-            # 품사별로 나눠서 명사 및 동사 추출
-            noun_phrase = ''.join([word for word, tag in token_pos if tag in ['NNG', 'NNP', 'SL']])  # 명사
-            verb_phrase = ''.join([word for word, tag in token_pos if tag in ['VV', 'VA']])  # 동사/형용사
-
-            # 형태소 분석 결과와 원래 텍스트 보정
-            noun_phrase_cleaned = clean_text(noun_phrase)  # 형태소 분석된 명사에서 조사를 제거
-            original_text_cleaned = clean_text(token.text)  # 원래 텍스트에서 조사를 제거
-
-            found = False  # 해당 단어가 패턴과 매칭되는지 확인
-            for label, pattern in combined_patterns.items():
-                if noun_phrase_cleaned and len(noun_phrase_cleaned) > 1:  # 명사가 있으면
-                    main_keyword = extract_main_keyword(noun_phrase_cleaned, pattern)
-                    if main_keyword:
-                        found = True
-                        new_ent = Span(doc, token.i, token.i + 1, label=label)
-                        new_ent._.set("cleaned_text", noun_phrase_cleaned)
-                        new_ents.append(new_ent)
-                        break
+# 주식 관련 패턴 정의
+stock_patterns = {
+    "주가": r"주가|주식|종가|가격|값",
+    "증시": r"증시|뉴스",
+    "예상": r"예상|예측|전망|앞으로",
+    "삼성전자": r"삼성전자|삼성|삼전|samsung",
+    "애플": r"애플|apple",
+    "비트코인": r"비트코인|bitcoin|비트|코인|coin",
+    "PER": r"PER|per|주가수익비율|Price Earning Ratio",
+    "PBR": r"PBR|pbr|주가순자산비율|Price Book-value Ratio",
+    "ROE": r"ROE|roe|자기자본이익률|Return on Equity",
+    "MC": r"MC|mc|시가총액|총액|시총|Market Cap",
+    "경제지표":r"경제지표|국내총생산|GDP|기준금리|IR|수입물가지수|IPI|생산자물가지수|PPI|소비자물가지수|CPI|외환보유액"
+}
 
-                if verb_phrase:  # 동사/형용사가 있으면
-                    main_keyword = extract_main_keyword(verb_phrase, pattern)
-                    if main_keyword:
-                        found = True
-                        new_ent = Span(doc, token.i, token.i + 1, label=label)
-                        new_ent._.set("cleaned_text", verb_phrase)
-                        new_ents.append(new_ent)
-                        break
+stock_matcher = KeywordMatcher(stock_patterns)
 
-            if not found:
-                # 원래 텍스트에 기반해 패턴 매칭 시도
-                main_keyword = extract_main_keyword(original_text_cleaned, pattern)
-                if main_keyword:
-                    new_ent = Span(doc, token.i, token.i + 1, label=label)
-                    new_ent._.set("cleaned_text", original_text_cleaned)
-                    new_ents.append(new_ent)
-                    break
+def clean_stock_text(text):
+    # Komoran으로 형태소 분석을 수행하여 조사를 제거
+    token_pos = current_analysis().pos('komoran', text)
+    cleaned_tokens = [word for word, pos in token_pos if not pos.startswith('J')]
+    cleaned_text = ''.join(cleaned_tokens)
 
-        # 최종 엔티티 설정
-        doc.ents = new_ents
+    return cleaned_text
 
-        return doc
+# 사용자 정의 spaCy 파이프라인 컴포넌트 (모듈 로드 시 한 번만 등록)
+@spacy.Language.component("custom_stock_entity_adder")
+def custom_stock_entity_adder(doc):
+    new_ents = []
 
-    # spaCy 모델 로드
-    nlp = spacy.load("ko_core_news_sm")
+    for token in doc:
+        # 형태소 분석을 통해 명사와 동사/형용사 추출 (요청 내에서 어절별로 한 번만 분석)
+        token_pos = current_analysis().token_pos('komoran', token)
+        
+        # 품사별로 나눠서 명사 및 동사 추출
+        noun_phrase = ''.join([word for word, tag in token_pos if tag in ['NNG', 'NNP', 'SL']])  # 명사
+        verb_phrase = ''.join([word for word, tag in token_pos if tag in ['VV', 'VA']])  # 동사/형용사
+
+        # 형태소 분석 결과와 원래 텍스트 보정
+        noun_phrase_cleaned = clean_stock_text(noun_phrase)  # 형태소 분석된 명사에서 조사를 제거
+        original_text_cleaned = clean_stock_text(token.text)  # 원래 텍스트에서 조사를 제거
+
+        # 라벨 우선순위 순서대로 명사 -> 동사/형용사를 확인 (같은 라벨이면 명사가 우선)
+        noun_labels = stock_matcher.labels_in(noun_phrase_cleaned) if noun_phrase_cleaned and len(noun_phrase_cleaned) > 1 else set()
+        verb_labels = stock_matcher.labels_in(verb_phrase) if verb_phrase else set()
+
+        if noun_labels and (not verb_labels or min(noun_labels) <= min(verb_labels)):
+            new_ent = Span(doc, token.i, token.i + 1, label=stock_matcher.labels[min(noun_labels)])
+            new_ent._.set("cleaned_text", noun_phrase_cleaned)
+            new_ents.append(new_ent)
+        elif verb_labels:
+            new_ent = Span(doc, token.i, token.i + 1, label=stock_matcher.labels[min(verb_labels)])
+            new_ent._.set("cleaned_text", verb_phrase)
+            new_ents.append(new_ent)
+        else:
+            # 원래 텍스트에 기반해 패턴 매칭 시도 (기존 동작과 같이 마지막 라벨 패턴만 확인하고, 매칭되면 순회 종료)
+            last_label = len(stock_matcher.labels) - 1
+            if last_label in stock_matcher.labels_in(original_text_cleaned):
+                new_ent = Span(doc, token.i, token.i + 1, label=stock_matcher.labels[last_label])
+                new_ent._.set("cleaned_text", original_text_cleaned)
+                new_ents.append(new_ent)
+                break
 
-    # 확장 속성 등록
-    Span.set_extension("cleaned_text", default=None, force=True)
+    # 최종 엔티티 설정
+    doc.ents = new_ents
 
-    # 기존 파이프라인에서 custom_stock_entity_adder 제거
-    if "custom_stock_entity_adder" in nlp.pipe_names:
-        nlp.remove_pipe("custom_stock_entity_adder")
+    return doc
 
-    # custom_stock_entity_adder 추가
-    nlp.add_pipe("custom_stock_entity_adder", after="ner")
 
-    # 텍스트 처리
-    doc = nlp(text)
+@request_memo('stock_entities')
+def extract_stock_entities(text):
+    """주어진 텍스트에서 주식 관련 엔티티를 추출하는 통합 함수입니다."""
+    doc = run_entity_adder("custom_stock_entity_adder", text)
 
     # 결과 출력
     entities = [ent._.get("cleaned_text") for ent in doc.ents] + [ent.label_ for ent in doc.ents]
@@ -1820,78 +2219,458 @@ def extract_stock_entities(text):
 
 
 # ================================================================================ Model Load ================================================================================
-# current_dir = os.path.dirname(os.path.abspath(__file__))
-current_dir = r"C:\Users\dlavk\SEBIN\AICC_TEAM\aicc_contest\aicc_map\server\src\Algorithm\script"
-tokenizer = AutoTokenizer.from_pretrained(current_dir)
-model = AutoModelForSequenceClassification.from_pretrained(current_dir, num_labels=3)
-
-
+def load_tokenizer():
+    return AutoTokenizer.from_pretrained(current_dir, local_files_only=True)
+
+def load_classifier():
+    model = AutoModelForSequenceClassification.from_pretrained(current_dir, num_labels=3, local_files_only=True)
+    model.eval()
+    return model
+
+resources.register('tokenizer', load_tokenizer)
+resources.register('classifier', load_classifier)
+
+# 분류기 실행 백엔드: 'torch'(기본) 또는 'onnx'(ONNX Runtime, CPU)
+CLASSIFIER_BACKEND = os.environ.get('CHATBOT_CLASSIFIER_BACKEND', 'torch')
+ONNX_MODEL_PATH = os.path.join(current_dir, 'model.onnx')
+ONNX_INT8_MODEL_PATH = os.path.join(current_dir, 'model.int8.onnx')
+
+# 분류기 입력 길이 설정: 배치 내 가장 긴 문장 길이에 맞춰 패딩하되, 아래 배수로 올림하고 최대 길이로 자름
+CLASSIFIER_MAX_LENGTH = int(os.environ.get('CHATBOT_MAX_LENGTH', 512))
+CLASSIFIER_PAD_MULTIPLE = int(os.environ.get('CHATBOT_PAD_MULTIPLE', 8)) or None
+
+# 분류기 검증(패리티 체크), 워밍업에 사용하는 고정 질문 목록 (라벨별)
+# 1단계 키워드 분류기의 prior와 threshold도 이 예시로 정함
+labeled_sample_questions = {
+    'finance': [
+        "이번달 지출 내역", "지난달 소득 합계", "작년 지출 평균", "이번달 가장 큰 지출",
+        "저번달 자주 쓴 지출", "고정 지출 내역", "올해 적금 내역", "이번달 입금 내역",
+        "대출 상환 내역", "이번달 예산", "다음달 예산 추천", "보유 주식 내역",
+        "지금 삼성전자 몇 주 있어", "삼성전자 주식 몇 주 있어", "작년에 산 삼성전자",
+    ],
+    'stock': [
+        "삼성전자 주가", "애플 어제 주가", "비트코인 가격", "삼성전자 PER",
+        "애플 시가총액", "오늘 증시 뉴스", "삼성전자 주가 예측", "경제지표 알려줘",
+    ],
+    'FAQ': ["비밀번호를 잊어버렸어요", "회원 탈퇴는 어떻게 하나요", "자주 묻는 질문", "챗봇 사용 방법"],
+}
+sample_questions = [question for questions in labeled_sample_questions.values() for question in questions]
 
 
 # ================================================================================ Return Query Function ================================================================================
 # 텍스트 전처리
-spacing = Spacing()
+def spacing_text(text):
+    spacing = resources.get('spacing')
+    with _spacing_lock:
+        return spacing(text)
 
 def processe_text(text):
-    text = spacing(text)
+    text = current_analysis().get('spacing', text, lambda: spacing_text(text))
     text = re.sub(r"[^가-힣a-zA-Z0-9\s]", "", text)
     text = repeat_normalize(text, num_repeats=3)
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-def predict_label(text, model, tokenizer):
-    # 토큰화
-    inputs = tokenizer(text, return_tensors="pt", padding="max_length", truncation=True, max_length=512)
-    # 모델 예측
-    outputs = model(**inputs)
-    probs = torch.softmax(outputs.logits, dim=-1)
-    pred = torch.argmax(probs, dim=1).item()
+label_map = {0: 'stock', 1: 'finance', 2: 'FAQ'}
 
-    label_map = {0: 'stock', 1: 'finance', 2: 'FAQ'}
-    return label_map[pred]
+def classifier_inputs(texts, tokenizer, padding="longest", max_length=None):
+    """
+    분류기 입력 텐서를 만듭니다. 기본값은 배치에서 가장 긴 문장 길이(CLASSIFIER_PAD_MULTIPLE 배수로 올림)까지만 패딩합니다.
+    """
+    max_length = max_length or CLASSIFIER_MAX_LENGTH
+    pad_multiple = CLASSIFIER_PAD_MULTIPLE if padding == "longest" else None
+    return tokenizer(texts, return_tensors="pt", padding=padding, truncation=True, max_length=max_length, pad_to_multiple_of=pad_multiple)
 
-def format_number_korean(num):
-    units = [("조", 1e12), ("억", 1e8), ("만", 1e4), ("", 1)]
-    for unit_name, unit_value in units:
-        if num >= unit_value:
-            value = num / unit_value
-            if unit_name:
-                return f"{value:.2f}{unit_name}"
-            else:
-                return f"{int(value)}"
-    return str(num)
+class OnnxClassifier:
+    """
+    ONNX Runtime(CPU)으로 분류기를 실행합니다. torch 모델과 같은 입력을 받아 로짓 텐서를 반환합니다.
+    onnxruntime은 이 백엔드를 사용할 때만 필요합니다.
+    """
 
+    def __init__(self, path):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError("ONNX 백엔드를 사용하려면 onnxruntime 패키지가 필요합니다.") from e
 
-# ================================================================================ Sentence Creation Function ================================================================================
+        if not os.path.exists(path):
+            raise RuntimeError(f"ONNX 모델 파일이 없습니다: {path} (--export-onnx로 먼저 생성하세요)")
 
-def month_plus(data, text_message):
-        
-    this_month = int(datetime.strftime(datetime.today(), '%m'))
-    next_month =  this_month + 1
-    next_month = 1 if next_month == 13 else next_month
-    step = 0
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [node.name for node in self.session.get_inputs()]
 
-    if any(phrase in text_message for phrase in ["다음달", "다음 달", f"{next_month}월"]):
-        step = 2
-    elif any(phrase in text_message for phrase in ["이번달", "이번 달", f"{this_month}월"]):
-        step = 1
+    def __call__(self, inputs):
+        feed = {name: inputs[name].numpy() for name in self.input_names}
+        logits = self.session.run(['logits'], feed)[0]
+        return torch.from_numpy(logits)
 
-    if step > 0:
-        for i in range(len(data)):
-            data[i]['rp_date'] = datetime.strptime(data[i]['rp_date'], '%Y-%m-%d')
-            data[i]['rp_date'] = data[i]['rp_date'] + relativedelta(months=step)
-            data[i]['rp_date'] = data[i]['rp_date'].strftime('%Y-%m-%d')           
-    
-    return data
 
-def format_date(date_str):
-    for fmt in ("%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
-        try:
-            date_obj = datetime.strptime(date_str, fmt)
-            return date_obj.strftime("%Y년 %m월 %d일")
-        except ValueError:
-            continue
-    return None
+def export_onnx(quantize=False):
+    """
+    현재 분류기를 ONNX로 내보내고, quantize가 True이면 동적 int8 양자화 모델도 생성합니다.
+
+    Returns:
+    - dict: 생성한 파일 경로
+    """
+    model = resources.get('classifier')
+    inputs = classifier_inputs(sample_questions[:2], resources.get('tokenizer'))
+    export_kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs['dynamo'] = False  # TorchScript 기반 내보내기 사용
+
+    torch.onnx.export(
+        model,
+        (inputs['input_ids'], inputs['attention_mask']),
+        ONNX_MODEL_PATH,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['logits'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            'logits': {0: 'batch'},
+        },
+        opset_version=14,
+        **export_kwargs,
+    )
+    exported = {"onnx": ONNX_MODEL_PATH}
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(ONNX_MODEL_PATH, ONNX_INT8_MODEL_PATH, weight_type=QuantType.QInt8)
+        exported["onnx_int8"] = ONNX_INT8_MODEL_PATH
+
+    return exported
+
+
+def load_intent_model():
+    """CHATBOT_CLASSIFIER_BACKEND 설정에 따라 분류에 사용할 모델을 반환합니다."""
+    if CLASSIFIER_BACKEND == 'onnx':
+        quantized = os.environ.get('CHATBOT_ONNX_QUANTIZED', '0') == '1'
+        return OnnxClassifier(ONNX_INT8_MODEL_PATH if quantized else ONNX_MODEL_PATH)
+    return resources.get('classifier')
+
+
+def classifier_logits(texts, model, tokenizer, padding="longest", max_length=None):
+    """추론 모드(no-grad)에서 문장 리스트의 로짓을 계산합니다. model은 torch 모델 또는 OnnxClassifier입니다."""
+    inputs = classifier_inputs(texts, tokenizer, padding=padding, max_length=max_length)
+    if isinstance(model, OnnxClassifier):
+        return model(inputs)
+    with torch.inference_mode():
+        return model(**inputs).logits
+
+def predict_labels(texts, model, tokenizer):
+    """
+    여러 문장을 한 번의 forward pass로 분류합니다.
+
+    Args:
+    - texts (list[str]): 전처리된 질문 리스트
+
+    Returns:
+    - list[str]: 문장별 분류 결과 ('stock', 'finance', 'FAQ')
+    """
+    logits = classifier_logits(texts, model, tokenizer)
+    preds = torch.argmax(logits, dim=-1).tolist()
+
+    return [label_map[pred] for pred in preds]
+
+
+def predict_label(text, model, tokenizer):
+    return predict_labels([text], model, tokenizer)[0]
+
+
+class Histogram:
+    """상한값(bucket) 목록으로 구간을 나누어 관측값의 분포를 기록합니다."""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._total = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            self._counts[index] += 1
+            self._total += 1
+            self._sum += value
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, value_sum = self._total, self._sum
+        labels = [f"<={bound}" for bound in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, counts)),
+            "count": total,
+            "mean": round(value_sum / total, 3) if total else 0.0,
+        }
+
+
+class MicroBatchScheduler:
+    """
+    동시에 들어온 분류 요청을 모아 한 번의 forward pass로 처리합니다.
+    첫 요청이 도착한 뒤 window_ms 동안, 최대 max_batch_size개까지 묶어서 실행합니다.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=8, window_ms=5.0):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32])
+        self.queue_wait_ms = Histogram([1, 2, 5, 10, 25, 50, 100, 250, 1000])
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='intent-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, text):
+        """분류 요청을 대기열에 넣고 결과를 받을 Future를 반환합니다."""
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def predict(self, text):
+        return self.submit(text).result()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.monotonic()
+            for _, _, enqueued_at in batch:
+                self.queue_wait_ms.observe((started - enqueued_at) * 1000)
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                labels = self.predict_batch([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), label in zip(batch, labels):
+                future.set_result(label)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "pending": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+
+resources.register('intent_model', load_intent_model)
+intent_batcher = MicroBatchScheduler(
+    lambda texts: predict_labels(texts, resources.get('intent_model'), resources.get('tokenizer')),
+    max_batch_size=int(os.environ.get('CHATBOT_MAX_BATCH_SIZE', 8)),
+    window_ms=float(os.environ.get('CHATBOT_BATCH_WINDOW_MS', 5)),
+)
+
+
+class KeywordIntentClassifier:
+    """
+    1단계(저비용) 의도 분류기.
+    엔티티 패턴 사전의 키워드를 특징으로 하는 선형 점수 모델로, 키워드 가중치는
+    그 키워드를 공유하는 라벨 수로 나누어 배분합니다. (예: '삼성'은 stock/finance에 0.5씩)
+    긴 키워드 안에 든 키워드는 따로 세지 않고, 그 라벨을 긴 키워드의 라벨에 합쳐 한 번만 반영합니다.
+    (예: '삼성전자'는 stock의 '삼성전자'와 stock/finance의 '삼성'을 합쳐 stock/finance에 0.5씩)
+    """
+
+    def __init__(self, label_patterns, priors=None, temperature=4.0, min_keyword_length=2):
+        self.labels = list(label_patterns)
+        self.priors = priors or {}
+        self.temperature = temperature
+        self.weights = {}
+        self._owners = {}  # 키워드 -> 라벨 집합
+        self._bounded = set()  # \b로 감싼 키워드 (단어 전체가 같을 때만 매칭하므로 한 글자여도 사용: '산', '판')
+
+        for label, patterns in label_patterns.items():
+            for pattern in patterns:
+                for keyword in pattern.split('|'):
+                    word = keyword.replace(r'\b', '')
+                    if word != keyword:
+                        self._bounded.add(word)
+                    elif len(word) < min_keyword_length:
+                        continue
+                    self._owners.setdefault(word, set()).add(label)
+        self._build()
+
+    def _build(self):
+        self.weights = {}
+        for keyword in self._owners:
+            nested = [other for other in self._owners
+                      if other == keyword or (other not in self._bounded and other in keyword)]
+            labels = set().union(*(self._owners[other] for other in nested))
+            self.weights[keyword] = {label: 1 / len(labels) for label in labels}
+
+        # 긴 키워드를 먼저 매칭하여 '삼성전자' 안의 '삼성'이 따로 매칭되지 않도록 함
+        keywords = sorted(self._owners, key=len, reverse=True)
+        self._regex = re.compile('|'.join(
+            rf'\b{re.escape(keyword)}\b' if keyword in self._bounded else re.escape(keyword) for keyword in keywords))
+
+    def scores(self, text):
+        scores = {label: self.priors.get(label, 0.0) for label in self.labels}
+        for keyword in set(self._regex.findall(text)):
+            for label, weight in self.weights[keyword].items():
+                scores[label] += weight
+        return scores
+
+    def predict(self, text):
+        """
+        Returns:
+        - tuple: (라벨, 신뢰도). 매칭된 키워드가 없으면 (None, 0.0)
+        """
+        scores = self.scores(text)
+        if not any(scores[label] > self.priors.get(label, 0.0) for label in self.labels):
+            return None, 0.0
+        exp_scores = {label: math.exp(self.temperature * score) for label, score in scores.items()}
+        total = sum(exp_scores.values())
+        label = max(exp_scores, key=exp_scores.get)
+        return label, exp_scores[label] / total
+
+    def fit(self, labeled_texts, min_threshold=0.9):
+        """
+        라벨별 예시 질문으로 키워드 공유 라벨, prior, threshold를 정합니다.
+
+        - 예시에서 매칭된 키워드는 그 예시의 라벨도 공유합니다. (FAQ 예시 '챗봇 사용 방법'의 '사용'은 finance/FAQ)
+        - prior: 라벨별 예시 비율의 로그를 temperature로 나눈 값 (키워드가 같으면 예시가 많은 라벨이 우세)
+        - threshold: 예시 중 키워드로 잘못 결정되는 문장의 신뢰도보다 높은 가장 작은 값 (min_threshold 이상)
+
+        Returns:
+        - float: 2단계 모델을 건너뛸 신뢰도 threshold
+        """
+        for label, texts in labeled_texts.items():
+            for text in texts:
+                for keyword in set(self._regex.findall(text)):
+                    self._owners[keyword].add(label)
+        self._build()
+
+        total = sum(len(texts) for texts in labeled_texts.values())
+        self.priors = {label: math.log(len(texts) / total) / self.temperature
+                       for label, texts in labeled_texts.items() if texts}
+        wrong = [confidence for label, texts in labeled_texts.items() for text in texts
+                 for predicted, confidence in [self.predict(text)] if predicted not in (None, label)]
+        return max([min_threshold] + [math.nextafter(confidence, 1.0) for confidence in wrong])
+
+
+class IntentCascade:
+    """
+    1단계 분류기의 신뢰도가 threshold 이상이면 그 결과를 사용하고,
+    그렇지 않을 때만 2단계(DeBERTa) 분류기를 실행합니다.
+    """
+
+    def __init__(self, first_stage, fallback, threshold=0.9, enabled=True):
+        self.first_stage = first_stage
+        self.fallback = fallback
+        self.threshold = threshold
+        self.enabled = enabled
+        self._counts = {"total": 0, "short_circuited": 0}
+        self._labels = {}
+        self._lock = threading.Lock()
+
+    def predict(self, text):
+        label, confidence = self.first_stage.predict(text) if self.enabled else (None, 0.0)
+        short_circuited = label is not None and confidence >= self.threshold
+        if not short_circuited:
+            label = self.fallback(text)
+
+        with self._lock:
+            self._counts["total"] += 1
+            self._counts["short_circuited"] += int(short_circuited)
+            stage = "keyword" if short_circuited else "model"
+            self._labels[f"{stage}:{label}"] = self._labels.get(f"{stage}:{label}", 0) + 1
+        return label
+
+    def stats(self):
+        with self._lock:
+            total, short = self._counts["total"], self._counts["short_circuited"]
+            labels = dict(self._labels)
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "total": total,
+            "short_circuited": short,
+            "short_circuit_ratio": round(short / total, 4) if total else 0.0,
+            "labels": labels,
+        }
+
+
+# 보유 수량/매매 질문("삼성전자 몇 주 있어", "작년에 산 삼성전자")은 종목 이름이 stock 키워드와 겹치므로
+# 수량/매매 표현을 finance 키워드로 두어 finance(주식내역 쿼리)로 결정되도록 함
+HOLDINGS_KEYWORDS = r"몇 주|몇주|보유|\b산\b|\b판\b|매수|매도"
+
+# 분류 라벨별 키워드 사전. FAQ는 키워드가 없으므로 예시 질문으로 정한 prior로만 점수를 받음
+keyword_classifier = KeywordIntentClassifier({
+    'stock': list(stock_patterns.values()),
+    'finance': [*finance_patterns.values(), HOLDINGS_KEYWORDS],
+    'FAQ': [],
+})
+# prior/threshold는 라벨별 예시 질문으로 정함 (CHATBOT_CASCADE_THRESHOLD로 threshold를 직접 지정 가능)
+keyword_cascade_threshold = keyword_classifier.fit(labeled_sample_questions)
+intent_cascade = IntentCascade(
+    keyword_classifier,
+    intent_batcher.predict,
+    threshold=float(os.environ.get('CHATBOT_CASCADE_THRESHOLD', keyword_cascade_threshold)),
+    enabled=os.environ.get('CHATBOT_CASCADE', '1') == '1',
+)
+
+def format_number_korean(num):
+    units = [("조", 1e12), ("억", 1e8), ("만", 1e4), ("", 1)]
+    for unit_name, unit_value in units:
+        if num >= unit_value:
+            value = num / unit_value
+            if unit_name:
+                return f"{value:.2f}{unit_name}"
+            else:
+                return f"{int(value)}"
+    return str(num)
+
+
+# ================================================================================ Sentence Creation Function ================================================================================
+
+def month_plus(data, text_message):
+        
+    this_month = int(datetime.strftime(datetime.today(), '%m'))
+    next_month =  this_month + 1
+    next_month = 1 if next_month == 13 else next_month
+    step = 0
+
+    if any(phrase in text_message for phrase in ["다음달", "다음 달", f"{next_month}월"]):
+        step = 2
+    elif any(phrase in text_message for phrase in ["이번달", "이번 달", f"{this_month}월"]):
+        step = 1
+
+    if step > 0:
+        for i in range(len(data)):
+            data[i]['rp_date'] = datetime.strptime(data[i]['rp_date'], '%Y-%m-%d')
+            data[i]['rp_date'] = data[i]['rp_date'] + relativedelta(months=step)
+            data[i]['rp_date'] = data[i]['rp_date'].strftime('%Y-%m-%d')           
+    
+    return data
+
+def format_date(date_str):
+    for fmt in ("%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            date_obj = datetime.strptime(date_str, fmt)
+            return date_obj.strftime("%Y년 %m월 %d일")
+        except ValueError:
+            continue
+    return None
 
 
 # 지출/소득/입출금/예적금
@@ -2025,18 +2804,133 @@ def loan_answer(query, front_key):
         return result
 
 
+# 보유 주식 수량 (pattern_stock의 키 -> 답변 머리말)
+HOLDINGS_HEADERS = {'주식내역': '보유 주식 수량', '주식구매': '기간 중 구매한 주식 수량', '주식판매': '기간 중 판매한 주식 수량', '주식거래': '기간 중 주식 거래 수량'}
+HOLDINGS_NAMES = {'ss': ('삼성전자', '주'), 'ap': ('애플', '주'), 'bit': ('비트코인', '개')}
+
+
+def format_quantity(value):
+    """수량 표시 (소수 수량은 뒤의 0을 지움)"""
+    value = round(float(value), 8)
+    return f"{int(value):,}" if value.is_integer() else f"{value:,.8f}".rstrip('0')
+
+
+def holdings_answer(query, front_key):
+    row = query[0] if query else {}
+    lines = []
+    for suffix, (name, unit) in HOLDINGS_NAMES.items():
+        # 결과가 NULL이면(해당 기간에 거래 없음) 0으로 표시, 판매 수량은 음수로 저장되어 있으므로 부호를 뗌
+        values = {measure: float(row[f'{measure}_{suffix}'] or 0) for measure in HOLDINGS_MEASURES if f'{measure}_{suffix}' in row}
+        if 'sell' in values:
+            values['sell'] = -values['sell']
+        if not values:
+            continue
+        if 'buy' in values and 'sell' in values:
+            net = values['buy'] - values['sell']
+            lines.append(f"{name}: 구매 {format_quantity(values['buy'])}{unit}, 판매 {format_quantity(values['sell'])}{unit} "
+                         f"(순 {'+' if net >= 0 else '-'}{format_quantity(abs(net))}{unit})")
+        else:
+            lines.append(f"{name}: {format_quantity(next(iter(values.values())))}{unit}")
+    return f"{HOLDINGS_HEADERS[front_key]}:\n" + '\n'.join(lines)
+
+
+# ===== Stock Price Summary =====
+# 긴 기간의 주가 질문("작년 삼성전자 주가")은 일별 문장을 모두 이어 붙이지 않고, 기간 길이에 따라 주/월/연 단위의
+# 시가/고가/저가/종가 요약으로 답하여 답변 길이가 기간과 관계없이 일정 범위 안에 들도록 합니다.
+# (기간 길이(일) 상한, 묶음 단위) - 첫 항목 이하는 기존 일별 답변
+STOCK_SUMMARY_GRANULARITIES = [(31, None), (183, 'week'), (731, 'month'), (None, 'year')]
+STOCK_PRICE_COLUMNS = ('sc_ss_stock', 'sc_ap_stock', 'sc_coin')
+STOCK_CURRENCIES = {'삼성전자': '원', '애플': '달러', '비트코인': '달러'}
+
+
+def stock_summary_granularity(span_days):
+    """조회된 기간 길이(일)에 맞는 묶음 단위. 일별로 답하면 되는 기간이면 None."""
+    for limit, granularity in STOCK_SUMMARY_GRANULARITIES:
+        if limit is None or span_days <= limit:
+            return granularity
+
+
+def stock_periods(dates, granularity):
+    """날짜 배열(datetime64[D])의 각 날짜가 속한 주(월요일)/월/연의 첫날"""
+    if granularity == 'week':
+        # 1970-01-01은 목요일이므로 (일수 + 3) % 7이 월요일 기준 요일
+        return dates - ((dates.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+    unit = 'datetime64[M]' if granularity == 'month' else 'datetime64[Y]'
+    return dates.astype(unit).astype('datetime64[D]')
+
+
+def summarize_stock_ohlc(dates, prices, granularity):
+    """
+    날짜순 정렬과 묶음별 시가/고가/저가/종가를 배열 연산(reduceat)으로 계산합니다.
+
+    Returns:
+    - dict: period(묶음 첫날), start/end(묶음의 첫/마지막 거래일), open/high/low/close 배열
+    """
+    order = np.argsort(dates, kind='stable')
+    dates, prices = dates[order], prices[order]
+    periods = stock_periods(dates, granularity)
+    starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+    ends = np.r_[starts[1:], len(dates)] - 1
+    return {
+        'period': periods[starts], 'start': dates[starts], 'end': dates[ends],
+        'open': prices[starts], 'high': np.maximum.reduceat(prices, starts),
+        'low': np.minimum.reduceat(prices, starts), 'close': prices[ends],
+    }
+
+
+def format_stock_price(value, currency):
+    return f"{value:,.0f}{currency}" if currency == '원' else f"{value:,.2f}{currency}"
+
+
+def summarize_stock_prices(query_result, stock_name):
+    """
+    주가 조회 결과가 일별로 답하기에 긴 기간이면 주/월/연 단위 요약 답변을 만듭니다.
+    짧은 기간이거나 가격이 있는 행이 없으면 None을 반환하며, 이때는 기존 일별 답변을 사용합니다.
+    """
+    records = [record for record in query_result if isinstance(record, dict)] if isinstance(query_result, list) else []
+    column = next((name for name in STOCK_PRICE_COLUMNS if records and name in records[0]), None)
+    priced = [record for record in records if column and record.get(column) is not None and record.get('fd_date')]
+    if not priced:
+        return None
+    dates = np.array([record['fd_date'].split('T')[0] for record in priced], dtype='datetime64[D]')
+    granularity = stock_summary_granularity(int((dates.max() - dates.min()).astype(np.int64)) + 1)
+    if granularity is None:
+        return None
+
+    prices = np.array([float(record[column]) for record in priced], dtype=np.float64)
+    ohlc = summarize_stock_ohlc(dates, prices, granularity)
+    currency = STOCK_CURRENCIES.get(stock_name, '원')
+    labels = {
+        'week': lambda day: f"{day:%Y년 %m월 %d일} 주",
+        'month': lambda day: f"{day:%Y년 %m월}",
+        'year': lambda day: f"{day:%Y년}",
+    }[granularity]
+    unit_name = {'week': '주별', 'month': '월별', 'year': '연도별'}[granularity]
+
+    first, last = ohlc['start'][0].item(), ohlc['end'][-1].item()
+    response = f"{stock_name}의 {first:%Y년 %m월 %d일}~{last:%Y년 %m월 %d일} 주가 ({unit_name} 요약, 전일 종가 기준):\n"
+    for period, opened, high, low, closed in zip(ohlc['period'].tolist(), *(ohlc[name].tolist() for name in ('open', 'high', 'low', 'close'))):
+        response += (f"{labels(period)}: 시가 {format_stock_price(opened, currency)}, 고가 {format_stock_price(high, currency)}, "
+                     f"저가 {format_stock_price(low, currency)}, 종가 {format_stock_price(closed, currency)}\n")
+
+    high_index, low_index = int(np.argmax(prices)), int(np.argmin(prices))
+    change = (ohlc['close'][-1] / ohlc['open'][0] - 1) * 100 if ohlc['open'][0] else 0.0
+    response += (f"기간 전체: {format_stock_price(ohlc['open'][0], currency)} → {format_stock_price(ohlc['close'][-1], currency)} ({change:+.2f}%), "
+                 f"최고 {format_stock_price(prices[high_index], currency)}({dates[high_index].item():%Y-%m-%d}), "
+                 f"최저 {format_stock_price(prices[low_index], currency)}({dates[low_index].item():%Y-%m-%d})")
+    return response
+
+
 def generate_stock_price_response(query_result, stock_name):
     if not query_result:
         return f"{stock_name}의 주가 정보를 찾을 수 없습니다."
 
-    # 종목별 통화 단위 매핑
-    currency_map = {
-        '삼성전자': '원',
-        '애플': '달러',
-        '비트코인': '달러'
-    }
+    # 한 달이 넘는 기간은 일별 문장 대신 주/월/연 단위 요약
+    summary = summarize_stock_prices(query_result, stock_name)
+    if summary is not None:
+        return summary
 
-    currency = currency_map.get(stock_name, '원')  # 기본값은 '원'으로 설정
+    currency = STOCK_CURRENCIES.get(stock_name, '원')  # 기본값은 '원'으로 설정
 
     response = f"{stock_name}의 주가는:\n"
     if isinstance(query_result, list):
@@ -2135,12 +3029,1566 @@ def generate_stock_info_response(query_result, keyword):
 sys.stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-if __name__ == "__main__":
+# 여러 요청의 응답이 섞이지 않도록 stdout 쓰기를 직렬화
+_stdout_lock = threading.Lock()
+
+NOT_FOUND_MESSAGE = "해당하는 결과를 찾을 수 없습니다. 다시 질문해 주세요."
+
+
+class ConversationStore:
+    """
+    request_id 별로 2단계(queryResult) 처리에 필요한 대화 상태를 보관합니다.
+    정리되지 않은 대화는 ttl(초)이 지나면 제거됩니다.
+    """
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def put(self, request_id, text_message):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, saved_at) in self._items.items() if now - saved_at > self.ttl]
+            for key in expired:
+                del self._items[key]
+            self._items[request_id] = (text_message, now)
+
+    def get(self, request_id, default=None):
+        with self._lock:
+            item = self._items.get(request_id)
+        return item[0] if item else default
+
+    def pop(self, request_id):
+        with self._lock:
+            item = self._items.pop(request_id, None)
+        return item[0] if item else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+class IntentCache:
+    """
+    원본 질문 -> (정규화된 질문, 분류 라벨) LRU 캐시입니다.
+    반복되는 질문은 띄어쓰기 교정(processe_text)과 의도 분류를 모두 건너뜁니다.
+
+    - capacity: 최대 항목 수, max_bytes: 최대 크기(UTF-8 바이트), ttl: 항목 유효 시간(초, 0이면 무제한)
+    - path가 주어지면 load()/save()로 재시작 사이에 캐시를 유지합니다.
+    """
+
+    def __init__(self, capacity=1024, ttl=3600, max_bytes=1 << 20, path=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path = path
+        self._items = OrderedDict()  # message -> (normalized, label, saved_at, size)
+        self._bytes = 0
+        self._counts = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(message, normalized, label):
+        return len(message.encode('utf-8')) + len(normalized.encode('utf-8')) + len(str(label))
+
+    def _remove(self, message):
+        _, _, _, size = self._items.pop(message)
+        self._bytes -= size
+
+    def get(self, message):
+        """캐시된 (정규화된 질문, 라벨)을 반환합니다. 없거나 만료되었으면 None."""
+        with self._lock:
+            item = self._items.get(message)
+            if item is not None and self.ttl and time.time() - item[2] > self.ttl:
+                self._remove(message)
+                self._counts["expired"] += 1
+                item = None
+            if item is None:
+                self._counts["misses"] += 1
+                return None
+            self._items.move_to_end(message)
+            self._counts["hits"] += 1
+            return item[0], item[1]
+
+    def put(self, message, normalized, label, saved_at=None):
+        if self.capacity <= 0:
+            return
+        size = self._entry_size(message, normalized, label)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if message in self._items:
+                self._remove(message)
+            self._items[message] = (normalized, label, saved_at or time.time(), size)
+            self._bytes += size
+            while len(self._items) > self.capacity or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._items)))
+                self._counts["evicted"] += 1
+
+    def load(self):
+        """path의 캐시 파일을 읽어옵니다. 파일이 없거나 손상되었으면 빈 캐시로 시작합니다."""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning('의도 캐시 파일을 읽지 못했습니다: %s (%s)', self.path, e)
+            return 0
+
+        now = time.time()
+        loaded = 0
+        for message, normalized, label, saved_at in entries:
+            if self.ttl and now - saved_at > self.ttl:
+                continue
+            self.put(message, normalized, label, saved_at=saved_at)
+            loaded += 1
+        return loaded
+
+    def save(self):
+        """캐시를 path에 원자적으로 기록합니다. (임시 파일 작성 후 교체)"""
+        if not self.path:
+            return
+        with self._lock:
+            entries = [[message, normalized, label, saved_at]
+                       for message, (normalized, label, saved_at, _) in self._items.items()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning('의도 캐시 파일을 저장하지 못했습니다: %s (%s)', self.path, e)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self._counts["hits"], self._counts["misses"]
+            return {
+                **self._counts,
+                "size": len(self._items),
+                "bytes": self._bytes,
+                "capacity": self.capacity,
+                "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+intent_cache = IntentCache(
+    capacity=int(os.environ.get('CHATBOT_INTENT_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('CHATBOT_INTENT_CACHE_TTL', 3600)),
+    max_bytes=int(os.environ.get('CHATBOT_INTENT_CACHE_BYTES', 1 << 20)),
+    path=os.environ.get('CHATBOT_INTENT_CACHE_PATH') or None,
+)
+intent_cache.load()
+atexit.register(intent_cache.save)
+
+
+def classify_message(message):
+    """
+    질문을 정규화하고 의도를 분류합니다. 같은 질문은 intent_cache에서 바로 반환합니다.
+
+    Returns:
+    - tuple: (정규화된 질문, 분류 라벨)
+    """
+    cached = intent_cache.get(message)
+    if cached is not None:
+        return cached
+
+    normalized = processe_text(message)
+    classification = intent_cascade.predict(normalized)
+    intent_cache.put(message, normalized, classification)
+    return normalized, classification
+
+
+# ===== Bound Query =====
+# 쿼리 빌더가 만든 SQL 문장과, 그 안의 자리표시자(사용자 ID 자리, 빌더가 만든 ? 자리)
+SQL_STATEMENT = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+SQL_PLACEHOLDER = re.compile(r'\{\{?user_id\}\}?|\?')
+
+def is_sql_query(query):
+    """쿼리 빌더가 만든 (SQL, 바인딩 값) 또는 SQL 문자열이면 True, 예외/링크 등 안내 문구면 False"""
+    return isinstance(query, tuple) or bool(SQL_STATEMENT.match(query))
+
+def bind_query(query, user_id):
+    """
+    쿼리 빌더가 만든 SQL을 prepared statement용 문장과 바인딩 값 목록으로 나눕니다.
+    날짜, 항목명 같은 값은 빌더가 이미 ? 자리와 바인딩 값으로 만들었으므로, 사용자 ID 자리({user_id})만 ?로 바꾸고
+    SQL에 나온 순서대로 사용자 ID와 빌더의 바인딩 값을 params에 담습니다.
+    같은 형태의 질문은 사용자나 기간이 달라도 같은 문장이 되어 DB에서 파싱/실행 계획을 재사용할 수 있습니다.
+
+    Args:
+    - query (tuple | str): 쿼리 빌더가 만든 (SQL, 바인딩 값) 또는 바인딩 값이 없는 SQL
+    - user_id: 세션 사용자 ID
+
+    Returns:
+    - dict: {"sql": 자리표시자(?)가 들어간 문장, "params": 바인딩 값 리스트}
+    """
+    sql, values = query if isinstance(query, tuple) else (query, ())
+    values, params = iter(values), []
+
+    def bind(match):
+        params.append(next(values) if match.group(0) == '?' else user_id)
+        return '?'
+
+    return {"sql": SQL_PLACEHOLDER.sub(bind, sql), "params": params}
+
+def create_query_message(message, user_id, monthly_rollup=True):
+    """
+    1단계 처리: 질문을 전처리 및 분류하여 실행할 쿼리를 생성합니다.
+
+    Args:
+    - message (str): 사용자 질문
+    - user_id: 세션 사용자 ID
+    - monthly_rollup (bool): 월 단위 기간의 질문에 월 집계 테이블을 사용할지 여부
+
+    Returns:
+    - tuple: (키별 쿼리 딕셔너리, 정규화된 질문)
+    """
+    # 월 집계 테이블 사용 여부는 이 요청의 쿼리를 만드는 동안만 적용
+    rollup_token = _monthly_rollup_enabled.set(monthly_rollup)
+    try:
+        # 띄어쓰기 교정, 형태소 분석, 엔티티/날짜 추출 결과를 이 요청 안에서 공유
+        with analysis_scope():
+            message, classification = classify_message(message)
+            query = make_query(classification, message)
+    finally:
+        _monthly_rollup_enabled.reset(rollup_token)
+
+    # 예측/경제지표처럼 안내 문구만 반환하는 경우는 링크 답변으로 전달
+    if isinstance(query, str):
+        query = {'링크': query}
+
+    # SQL은 문장 + 바인딩 값으로 분리하고, 예외/링크 등 안내 문구는 그대로 전달
+    for key in query:
+        query[key] = bind_query(query[key], user_id) if is_sql_query(query[key]) else query[key]
+
+    return query, message
+
+
+# ===== Columnar Query Result =====
+# Node는 행 객체 배열 대신 열 단위 결과를 보낼 수 있습니다.
+#   {"columns": ["rp_date", "rp_amount", ...], "values": [[날짜...], [금액...], ...]}
+# 날짜 열(RESULT_DATE_COLUMNS)은 UTC ISO 문자열('YYYY-MM-DDTHH:MM:SS.sssZ')이며,
+# 행마다 strptime/astimezone/strftime을 호출하지 않고 열 전체를 NumPy 배열 연산으로 한 번에 변환합니다.
+RESULT_DATE_COLUMNS = ('rp_date', 'fd_date')  # 한 행에 둘 다 있으면 rp_date만 변환
+KST_OFFSET_HOURS = 9  # 한국은 서머타임이 없으므로 고정 오프셋
+
+
+class ResultRows(list):
+    """날짜 열 변환을 마친 쿼리 결과 행 목록. 다시 변환하지 않도록 일반 list와 구분합니다."""
+
+
+def format_days(days):
+    """datetime64[D] 배열을 'YYYY-MM-DD' 문자열 목록으로 변환합니다. (문자 코드 배열을 직접 채워 만듦)"""
+    years = days.astype('datetime64[Y]')
+    months = days.astype('datetime64[M]')
+    year = years.astype(np.int64) + 1970
+    month = (months - years.astype('datetime64[M]')).astype(np.int64) + 1
+    day = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+
+    chars = np.empty((len(days), 10), dtype=np.uint32)
+    for column, (value, unit) in enumerate([(year, 1000), (year, 100), (year, 10), (year, 1), (None, 0),
+                                            (month, 10), (month, 1), (None, 0), (day, 10), (day, 1)]):
+        chars[:, column] = ord('-') if value is None else value // unit % 10 + ord('0')
+    return chars.view('U10').ravel().tolist()
+
+
+def to_kst_dates(values):
+    """UTC ISO 문자열('YYYY-MM-DDTHH:MM:SS.sssZ') 목록을 KST 'YYYY-MM-DD' 문자열 목록으로 변환합니다."""
+    # 'YYYY-MM-DDTHH'까지의 문자를 코드 배열로 읽어 날짜와 시를 숫자로 계산 (UTC 15시 이후는 KST로 다음날)
+    codes = np.asarray(values, dtype='U13').view(np.uint32).reshape(-1, 13).astype(np.int64)
+    if not (np.all(codes[:, [4, 7]] == ord('-')) and np.all(codes[:, 10] == ord('T'))):
+        raise ValueError('UTC ISO 형식(YYYY-MM-DDTHH:MM:SS.sssZ)이 아닌 날짜가 있습니다.')
+    year, month, day, hour = (
+        (codes[:, start:end] - ord('0')) @ 10 ** np.arange(end - start - 1, -1, -1)
+        for start, end in ((0, 4), (5, 7), (8, 10), (11, 13))
+    )
+    months = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1)
+    return format_days(months.astype('datetime64[D]') + (day - 1) + (hour + KST_OFFSET_HOURS >= 24))
+
+
+def decode_query_result(query_result):
+    """
+    Node에서 받은 쿼리 결과를 행 목록(ResultRows)으로 바꾸고 날짜 열을 KST 'YYYY-MM-DD'로 변환합니다.
+    열 단위 결과와 행 객체 배열을 모두 받으며, 예외/링크 문자열 등 그 밖의 값은 그대로 반환합니다.
+    """
+    if isinstance(query_result, ResultRows):
+        return query_result
+
+    if isinstance(query_result, dict) and 'columns' in query_result and 'values' in query_result:
+        columns = list(query_result['columns'])
+        values = [list(column) for column in query_result['values']]
+        date_columns = [name for name in RESULT_DATE_COLUMNS if name in columns]
+        if date_columns and values and values[0]:
+            index = columns.index(date_columns[0])
+            values[index] = to_kst_dates(values[index])
+        return ResultRows(dict(zip(columns, row)) for row in zip(*values))
+
+    if not isinstance(query_result, list):
+        return query_result
+
+    rows = ResultRows(query_result)
+    pending = [row for row in rows if isinstance(row, dict)]
+    for name in RESULT_DATE_COLUMNS:
+        matched = [row for row in pending if name in row]
+        if matched:
+            for row, date in zip(matched, to_kst_dates([row[name] for row in matched])):
+                row[name] = date
+            pending = [row for row in pending if name not in row]
+    return rows
+
+
+# ===== Transaction Store =====
+# 같은 사용자가 이어서 묻는 재무 질문("이번달 지출", "그중 가장 큰 건")마다 DB를 다시 조회하지 않도록,
+# 사용자의 거래(tb_received_paid)를 열 단위 NumPy 배열로 보관하고 쿼리 빌더가 만든 바인딩 쿼리를 직접 계산합니다.
+# CHATBOT_TRANSACTION_CACHE=1일 때만 사용합니다.
+# - 보관된 거래가 없으면 1단계 응답에 전체 거래 조회(TRANSACTION_STORE_KEY)를 함께 보내고, 2단계 결과로 채웁니다.
+# - 보관된 거래가 있고 모든 키를 계산할 수 있으면 1단계에서 바로 답변하므로 DB 조회와 2단계 요청이 생략됩니다.
+#   계산할 수 없는 형태의 쿼리(예산/대출 조인 등)가 하나라도 있으면 기존처럼 Node가 조회합니다.
+# - 거래를 추가/삭제하면 Node가 {type: 'invalidate', user_id}를 보내 해당 사용자의 거래를 버리며, 그 밖에는 ttl(초)이 지나면 다시 조회합니다.
+TRANSACTION_STORE_KEY = '__transactions__'
+TRANSACTION_STORE_QUERY = 'SELECT rp_date, rp_detail, rp_amount, rp_hold, rp_part FROM tb_received_paid WHERE user_id = {user_id} ORDER BY rp_date, rp_id'
+FINANCE_SQL_TOKEN = re.compile(r"\s*(>=|[(),;?=<*/]|[A-Za-z_][A-Za-z_0-9]*|\d+)")
+
+
+def tokenize_finance_sql(sql):
+    """SQL 문장을 토큰 목록으로 나눕니다. 알 수 없는 문자(따옴표, 비교 연산자 등)가 있으면 None."""
+    tokens, position = [], 0
+    sql = sql.rstrip()
+    while position < len(sql):
+        match = FINANCE_SQL_TOKEN.match(sql, position)
+        if not match:
+            return None
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+# SELECT 목록 -> (결과 종류, 결과 컬럼 이름). 월 집계 테이블의 컬럼은 거래 테이블에서 같은 값을 계산합니다.
+FINANCE_PROJECTIONS = {
+    ' '.join(tokenize_finance_sql(text)).lower(): spec for text, spec in [
+        ('SUM(rp_amount) as Total_amount', ('sum', ['Total_amount'])),
+        ('SUM(rp_total) as Total_amount', ('sum', ['Total_amount'])),
+        ('AVG(rp_amount) as Average_amount', ('avg', ['Average_amount'])),
+        ('SUM(rp_total) / SUM(rp_count) as Average_amount', ('avg', ['Average_amount'])),
+        ('rp_date, rp_detail, rp_amount', ('rows', ['rp_date', 'rp_detail', 'rp_amount'])),
+        ('rp_detail, rp_date, rp_amount', ('rows', ['rp_detail', 'rp_date', 'rp_amount'])),
+        ('rp_max_date AS rp_date, rp_detail, rp_max AS rp_amount', ('rows', ['rp_date', 'rp_detail', 'rp_amount'])),
+        ('rp_min_date AS rp_date, rp_detail, rp_min AS rp_amount', ('rows', ['rp_date', 'rp_detail', 'rp_amount'])),
+        ('rp_date, rp_detail, rp_amount, SUM(rp_amount) OVER () AS Total_Amount', ('rows_total', ['rp_date', 'rp_detail', 'rp_amount', 'Total_Amount'])),
+        ('rp_detail, SUM(rp_amount) AS Total_Amount', ('detail_sum', ['rp_detail', 'Total_Amount'])),
+        ('rp_detail, COUNT(*) as freq, SUM(rp_amount) as Total_amount', ('groups', ['rp_detail', 'freq', 'Total_amount'])),
+        ('rp_detail', ('details', ['rp_detail'])),
+    ]
+}
+FINANCE_ORDER_COLUMNS = {'rp_amount': 'rp_amount', 'rp_max': 'rp_amount', 'rp_min': 'rp_amount', 'rp_date': 'rp_date', 'rp_detail': 'rp_detail'}
+FINANCE_GROUP_COUNTS = ('COUNT ( * )', 'SUM ( rp_count )')
+
+
+class FinanceSqlParser:
+    """
+    재무 쿼리 빌더(finance_pattern_query, generate_query_expend 등)가 만드는 형태의 바인딩 쿼리만 해석합니다.
+
+    SELECT <목록> FROM tb_received_paid[_monthly] WHERE user_id = ? {AND <조건>}
+      [GROUP BY rp_detail HAVING COUNT(*)|SUM(rp_count) >= n] [ORDER BY <컬럼> [ASC|DESC], ...] [LIMIT n] [;]
+
+    조건: rp_part/rp_hold = n, rp_detail = ?, (rp_detail = ? OR ...), 날짜 범위(OR로 묶인 범위 포함), rp_detail IN (하위 쿼리)
+    해석할 수 없으면 ValueError를 발생시킵니다.
+    """
+
+    def __init__(self, tokens, date_columns=('rp_date', 'rp_month')):
+        self.tokens = tokens
+        self.date_columns = date_columns
+        self.position = 0
+        self.params = 0  # 지금까지 읽은 자리표시자 수 = 다음 자리표시자의 바인딩 값 위치
+        self.user_params = []  # user_id = ? 자리표시자 위치 (하위 쿼리 포함)
+
+    def peek(self):
+        return self.tokens[self.position].upper() if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or (expected is not None and token != expected.upper()):
+            raise ValueError(f'{expected} 위치에 {token}')
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def number(self):
+        token = self.take()
+        if not token.isdigit():
+            raise ValueError(f'숫자 위치에 {token}')
+        return int(token)
+
+    def param(self):
+        self.take('?')
+        self.params += 1
+        return self.params - 1
+
+    def select(self):
+        self.take('SELECT')
+        start = self.position
+        while self.peek() not in ('FROM', None):
+            self.position += 1
+        projection = FINANCE_PROJECTIONS.get(' '.join(self.tokens[start:self.position]).lower())
+        if projection is None:
+            raise ValueError('지원하지 않는 SELECT 목록')
+        self.take('FROM')
+        table = self.take()
+        if table not in ('tb_received_paid', MONTHLY_ROLLUP_TABLE):
+            raise ValueError(f'지원하지 않는 테이블 {table}')
+
+        self.take('WHERE')
+        self.take('user_id')
+        self.take('=')
+        self.user_params.append(self.param())
+        plan = {'kind': projection[0], 'columns': projection[1], 'conditions': [], 'min_count': None, 'order': [], 'limit': None}
+        while self.peek() == 'AND':
+            self.take('AND')
+            plan['conditions'].append(self.condition())
+
+        if self.peek() == 'GROUP':
+            self.take('GROUP')
+            self.take('BY')
+            self.take('rp_detail')
+            self.take('HAVING')
+            self.group_count()
+            self.take('>=')
+            plan['min_count'] = self.number()
+        if self.peek() == 'ORDER':
+            self.take('ORDER')
+            self.take('BY')
+            while True:
+                if plan['min_count'] is not None and self.peek() in ('COUNT', 'SUM'):
+                    self.group_count()  # IN 하위 쿼리의 정렬은 결과에 영향이 없음
+                    column = None
+                else:
+                    column = FINANCE_ORDER_COLUMNS.get(self.take().lower())
+                    if column is None:
+                        raise ValueError('지원하지 않는 정렬 컬럼')
+                descending = self.peek() == 'DESC'
+                if self.peek() in ('ASC', 'DESC'):
+                    self.take()
+                if column:
+                    plan['order'].append((column, descending))
+                if self.peek() != ',':
+                    break
+                self.take(',')
+        if self.peek() == 'LIMIT':
+            self.take('LIMIT')
+            plan['limit'] = self.number()
+
+        # 집계 테이블의 행은 (월 x 내역) 묶음이므로 최고/최저 1건 조회만 거래 단위 결과와 같음
+        if table == MONTHLY_ROLLUP_TABLE and plan['kind'] == 'rows' and (plan['limit'] != 1 or not plan['order']):
+            raise ValueError('월 집계 테이블의 행 조회')
+        if (plan['min_count'] is None) != (plan['kind'] in ('rows', 'rows_total', 'sum', 'avg', 'detail_sum')):
+            raise ValueError('GROUP BY와 SELECT 목록이 맞지 않음')
+        return plan
+
+    def group_count(self):
+        start = self.position
+        self.position += 4
+        if ' '.join(self.tokens[start:self.position]) not in FINANCE_GROUP_COUNTS:
+            raise ValueError('지원하지 않는 집계 조건')
+
+    def condition(self):
+        if self.peek() == '(':
+            self.take('(')
+            if self.peek() == '(':
+                ranges = []
+                while True:
+                    self.take('(')
+                    ranges.append(self.date_range())
+                    self.take(')')
+                    if self.peek() != 'OR':
+                        break
+                    self.take('OR')
+                self.take(')')
+                return ('dates', ranges)
+            params = []
+            while True:
+                self.take('rp_detail')
+                self.take('=')
+                params.append(self.param())
+                if self.peek() != 'OR':
+                    break
+                self.take('OR')
+            self.take(')')
+            return ('detail', params)
+
+        column = self.peek()
+        if column in ('RP_PART', 'RP_HOLD'):
+            self.take()
+            self.take('=')
+            return (column.lower(), self.number())
+        if column == 'RP_DETAIL':
+            self.take()
+            if self.peek() == 'IN':
+                self.take('IN')
+                self.take('(')
+                subquery = self.select()
+                self.take(')')
+                if subquery['kind'] != 'details':
+                    raise ValueError('지원하지 않는 하위 쿼리')
+                return ('frequent', subquery)
+            self.take('=')
+            return ('detail', [self.param()])
+        if column and column.lower() in self.date_columns:
+            return ('dates', [self.date_range()])
+        raise ValueError(f'지원하지 않는 조건 {column}')
+
+    def date_range(self):
+        column = self.take().lower()
+        if column not in self.date_columns:
+            raise ValueError(f'지원하지 않는 날짜 컬럼 {column}')
+        self.take('>=')
+        start = self.param()
+        self.take('AND')
+        self.take(column)
+        self.take('<')
+        return (start, self.param())
+
+
+@functools.lru_cache(maxsize=512)
+def compile_finance_sql(sql):
+    """바인딩 쿼리 문장을 TransactionStore가 계산할 수 있는 계획(dict)으로 바꿉니다. 지원하지 않으면 None."""
+    tokens = tokenize_finance_sql(sql)
+    if not tokens:
+        return None
+    parser = FinanceSqlParser(tokens)
+    try:
+        plan = parser.select()
+        if parser.peek() == ';':
+            parser.take(';')
+        if parser.peek() is not None:
+            raise ValueError('문장 끝에 남은 토큰')
+    except ValueError:
+        return None
+    plan['user_params'] = parser.user_params
+    return plan
+
+
+class UserTransactions:
+    """
+    한 사용자의 거래를 열 단위로 보관합니다. 행 순서는 DB의 기본 순서와 같은 (rp_date, rp_id)입니다.
+    rp_detail은 정렬된 내역 사전(vocabulary)의 코드로 보관하므로 코드 순서가 곧 문자열 순서입니다.
+    """
+
+    def __init__(self, dates, details, amounts, holds, parts):
+        vocabulary = sorted({detail for detail in details if detail is not None})
+        self.vocabulary_index = {detail: code for code, detail in enumerate(vocabulary)}
+        # NULL 내역은 코드 -1 -> vocabulary의 마지막 원소(None)로 되돌림 (= 조건에는 걸리지 않음)
+        self.vocabulary = np.array(vocabulary + [None], dtype=object)
+        self.dates = np.array(dates, dtype='datetime64[D]')
+        self.details = np.array([self.vocabulary_index.get(detail, -1) for detail in details], dtype=np.int32)
+        self.amounts = np.array(amounts, dtype=np.int64)
+        self.holds = np.array([-1 if hold is None else hold for hold in holds], dtype=np.int8)
+        self.parts = np.array([-1 if part is None else part for part in parts], dtype=np.int8)
+        self.nbytes = (sum(array.nbytes for array in (self.dates, self.details, self.amounts, self.holds, self.parts))
+                       + sum(len(detail.encode('utf-8')) + 64 for detail in vocabulary))
+
+    @classmethod
+    def from_result(cls, query_result):
+        """TRANSACTION_STORE_QUERY의 결과(열 단위 또는 행 객체 배열)로 만듭니다. 금액/날짜가 없는 거래가 있으면 None."""
+        names = ('rp_date', 'rp_detail', 'rp_amount', 'rp_hold', 'rp_part')
+        if isinstance(query_result, dict) and 'columns' in query_result:
+            columns = dict(zip(query_result['columns'], query_result['values']))
+        elif isinstance(query_result, list):
+            rows = [row for row in query_result if isinstance(row, dict)]
+            columns = {name: [row.get(name) for row in rows] for name in names}
+        else:
+            return None
+        if not all(name in columns for name in names):
+            return None
+        dates, amounts = list(columns['rp_date']), list(columns['rp_amount'])
+        if any(value is None for value in dates) or any(value is None for value in amounts):
+            return None
+        if dates and len(dates[0]) > 10:
+            dates = to_kst_dates(dates)
+        return cls(dates, columns['rp_detail'], amounts, columns['rp_hold'], columns['rp_part'])
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def mask(self, conditions, params):
+        mask = np.ones(len(self), dtype=bool)
+        for kind, value in conditions:
+            if kind == 'rp_part':
+                mask &= self.parts == value
+            elif kind == 'rp_hold':
+                mask &= self.holds == value
+            elif kind == 'detail':
+                codes = [self.vocabulary_index[params[i]] for i in value if params[i] in self.vocabulary_index]
+                mask &= np.isin(self.details, codes)
+            elif kind == 'dates':
+                in_range = np.zeros(len(self), dtype=bool)
+                for start, end in value:
+                    in_range |= (self.dates >= np.datetime64(params[start], 'D')) & (self.dates < np.datetime64(params[end], 'D'))
+                mask &= in_range
+            elif kind == 'frequent':
+                mask &= np.isin(self.details, self.frequent_codes(value, params))
+        return mask
+
+    def detail_counts(self, mask):
+        """조건에 맞는 거래의 내역 코드별 건수와 금액 합계 (NULL 내역 제외)"""
+        codes = self.details[mask]
+        amounts = self.amounts[mask][codes >= 0]
+        codes = codes[codes >= 0]
+        size = len(self.vocabulary) - 1
+        return (np.bincount(codes, minlength=size),
+                np.bincount(codes, weights=amounts, minlength=size).astype(np.int64))
+
+    def frequent_codes(self, plan, params):
+        counts, _ = self.detail_counts(self.mask(plan['conditions'], params))
+        return np.flatnonzero(counts >= plan['min_count'])
+
+    def evaluate(self, plan, params):
+        """계획을 계산하여 DB 조회 결과와 같은 모양의 행 목록(ResultRows)을 반환합니다."""
+        mask = self.mask(plan['conditions'], params)
+        kind, columns = plan['kind'], plan['columns']
+
+        if kind in ('sum', 'avg'):
+            amounts = self.amounts[mask]
+            value = None if not len(amounts) else amounts.sum().item() if kind == 'sum' else amounts.mean().item()
+            return ResultRows([{columns[0]: value}])
+        if kind == 'detail_sum':
+            index = np.flatnonzero(mask)
+            if not len(index):
+                return ResultRows([{columns[0]: None, columns[1]: None}])
+            return ResultRows([{columns[0]: self.vocabulary[self.details[index[0]]], columns[1]: self.amounts[index].sum().item()}])
+        if kind == 'groups':
+            counts, totals = self.detail_counts(mask)
+            codes = np.flatnonzero(counts >= plan['min_count'])
+            return ResultRows([dict(zip(columns, values)) for values in zip(
+                self.vocabulary[codes].tolist(), counts[codes].tolist(), totals[codes].tolist())])
+
+        index = np.flatnonzero(mask)
+        if plan['order']:
+            keys = {'rp_amount': self.amounts, 'rp_date': self.dates.astype(np.int64), 'rp_detail': self.details}
+            # lexsort는 마지막 키가 1순위이며 안정 정렬이므로 동률은 (rp_date, rp_id) 순서를 유지
+            index = index[np.lexsort([-keys[column][index] if descending else keys[column][index]
+                                      for column, descending in reversed(plan['order'])])]
+        if plan['limit'] is not None:
+            index = index[:plan['limit']]
+        values = {
+            'rp_date': format_days(self.dates[index]),
+            'rp_detail': self.vocabulary[self.details[index]].tolist(),
+            'rp_amount': self.amounts[index].tolist(),
+        }
+        if kind == 'rows_total':
+            values['Total_Amount'] = [self.amounts[mask].sum().item()] * len(index)
+        return ResultRows([dict(zip(columns, row)) for row in zip(*(values[name] for name in columns))])
+
+
+class TransactionStore:
+    """
+    user_id -> UserTransactions LRU 캐시입니다.
+
+    - max_bytes: 보관할 거래 배열의 최대 크기 합계(바이트). 넘으면 가장 오래 사용하지 않은 사용자부터 제거합니다.
+    - ttl: 보관 시간(초). 거래 변경은 invalidate로 알리지만, 알림이 누락되어도 ttl이 지나면 다시 조회합니다.
+
+    전체 거래 조회 중에 거래가 바뀌면 조회 결과가 이미 오래된 것일 수 있으므로, 사용자별 세대(invalidate 횟수)를
+    조회 요청 시점에 기록해 두고 결과를 받았을 때 세대가 달라졌으면 보관하지 않습니다.
+
+    보관할 테이블은 클래스 속성(load_key, load_sql, records, compile)으로 정하므로, 다른 사용자별 테이블도 상속하여 같은 방식으로 보관합니다.
+    """
+
+    load_key = TRANSACTION_STORE_KEY
+    load_sql = TRANSACTION_STORE_QUERY
+    records = UserTransactions
+    compile = staticmethod(compile_finance_sql)
+
+    def __init__(self, enabled=False, max_bytes=64 * 1024 * 1024, ttl=600):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._generations = {}  # user_id -> invalidate 횟수
+        self._loading = {}  # request_id -> (user_id, 조회 요청 시점의 세대)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.loads = self.evictions = 0
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            item = self._items.get(key)
+            if item and time.monotonic() - item[1] > self.ttl:
+                self._remove(key)
+                item = None
+            if item:
+                self._items.move_to_end(key)
+            return item[0] if item else None
+
+    def put(self, user_id, query_result, request_id=None):
+        key = str(user_id)
+        with self._lock:
+            loading = self._loading.pop(request_id, None)
+            if loading is not None and loading != (key, self._generations.get(key, 0)):
+                return None
+        transactions = self.records.from_result(query_result)
+        if transactions is None or transactions.nbytes > self.max_bytes:
+            return None
+        with self._lock:
+            # 변환하는 동안 invalidate가 들어왔으면 무효화 전의 조회 결과이므로 보관하지 않음
+            if loading is not None and self._generations.get(key, 0) != loading[1]:
+                return None
+            self._remove(key)
+            self._items[key] = (transactions, time.monotonic())
+            self._bytes += transactions.nbytes
+            self.loads += 1
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._items)))
+                self.evictions += 1
+        return transactions
+
+    def invalidate(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._remove(key)
+
+    def discard(self, request_id):
+        """2단계 없이 끝난 요청의 조회 기록을 정리합니다."""
+        with self._lock:
+            self._loading.pop(request_id, None)
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item:
+            self._bytes -= item[0].nbytes
+
+    def evaluate(self, query, user_id):
+        """바인딩 쿼리({sql, params}) 하나를 보관된 거래로 계산합니다. 보관된 거래가 없거나 계산할 수 없는 쿼리면 None."""
+        plan = self.compile(query['sql']) if self.enabled else None
+        if plan is None or any(str(query['params'][i]) != str(user_id) for i in plan['user_params']):
+            return None
+        transactions = self.get(user_id)
+        if transactions is None:
+            return None
+        with self._lock:
+            self.hits += 1
+        return transactions.evaluate(plan, query['params'])
+
+    def load_query(self, query, user_id, request_id):
+        """계산할 수 있는 쿼리가 있는데 보관된 거래가 없으면 {load_key: 전체 거래 조회}를 반환합니다."""
+        if not self.enabled or not user_id or self.get(user_id) is not None:
+            return {}
+        if not any(isinstance(value, dict) and self.compile(value['sql']) for value in query.values()):
+            return {}
+        key = str(user_id)
+        with self._lock:
+            self._loading[request_id] = (key, self._generations.get(key, 0))
+            self.misses += 1
+        return {self.load_key: bind_query(self.load_sql, user_id)}
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "users": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "loads": self.loads, "evictions": self.evictions}
+
+
+def is_passthrough_key(key):
+    """Node가 DB에 조회하지 않고 그대로 돌려주는 키 (chatbotController의 예외/링크/FAQ/증시 처리와 같은 기준)"""
+    return any(word in key for word in ('예외', '링크', '증시')) or 'FAQ' in key.upper()
+
+
+transaction_store = TransactionStore(
+    enabled=os.environ.get('CHATBOT_TRANSACTION_CACHE', '0') == '1',
+    max_bytes=int(float(os.environ.get('CHATBOT_TRANSACTION_CACHE_MB', 64)) * 1024 * 1024),
+    ttl=float(os.environ.get('CHATBOT_TRANSACTION_CACHE_TTL', 600)),
+)
+
+
+# ===== Stock Index =====
+# tb_stock(일별 주가/지표)은 작고 끝에만 행이 추가되므로, fd_date 순으로 정렬된 배열로 보관하고
+# 주가/PER/PBR/ROE/시가총액 질문의 날짜 범위를 이진 탐색(searchsorted)으로 잘라 DB 조회 없이 답합니다.
+# - 색인이 비었거나 마지막 갱신 후 refresh(초)가 지났으면 1단계 응답에 갱신 조회(STOCK_INDEX_KEY)를 추가하고, 2단계 결과로 갱신합니다.
+#   갱신은 색인의 마지막 날짜부터만 조회하여 뒤에 이어 붙입니다. (마지막 날짜의 행은 다시 받은 값으로 교체)
+# - 갱신 시간이 지났더라도 질문한 기간이 색인의 마지막 날짜 안쪽이면 지난 날짜는 바뀌지 않으므로 바로 답합니다.
+# CHATBOT_STOCK_INDEX=0이면 사용하지 않습니다.
+STOCK_INDEX_KEY = '__stock_index__'
+STOCK_INDEX_COLUMNS = ('sc_ss_stock', 'sc_ap_stock', 'sc_coin', 'sc_ss_per', 'sc_ss_pbr', 'sc_ss_roe', 'sc_ss_mc',
+                       'sc_ap_per', 'sc_ap_pbr', 'sc_ap_roe', 'sc_ap_mc')
+STOCK_INDEX_QUERY = f"SELECT fd_date, {', '.join(STOCK_INDEX_COLUMNS)} FROM tb_stock{{condition}} ORDER BY fd_date"
+
+
+@functools.lru_cache(maxsize=256)
+def compile_stock_sql(sql):
+    """
+    stockpricequery / stock_information_query 형태의 바인딩 쿼리를 StockIndex가 계산할 계획(dict)으로 바꿉니다.
+    SELECT fd_date, <컬럼>... FROM tb_stock WHERE <fd_date 범위> ORDER BY fd_date [ASC|DESC] [;] 만 지원하며, 그 밖에는 None.
+    """
+    tokens = tokenize_finance_sql(sql)
+    if not tokens:
+        return None
+    parser = FinanceSqlParser(tokens, date_columns=('fd_date',))
+    try:
+        parser.take('SELECT')
+        columns = [parser.take()]
+        while parser.peek() == ',':
+            parser.take(',')
+            columns.append(parser.take())
+        parser.take('FROM')
+        parser.take('tb_stock')
+        parser.take('WHERE')
+        kind, ranges = parser.condition()
+        parser.take('ORDER')
+        parser.take('BY')
+        parser.take('fd_date')
+        descending = parser.peek() == 'DESC'
+        if parser.peek() in ('ASC', 'DESC'):
+            parser.take()
+        if parser.peek() == ';':
+            parser.take(';')
+        if parser.peek() is not None:
+            raise ValueError('문장 끝에 남은 토큰')
+    except ValueError:
+        return None
+    if kind != 'dates' or columns[0] != 'fd_date' or not set(columns[1:]) <= set(STOCK_INDEX_COLUMNS):
+        return None
+    return {'columns': columns, 'ranges': ranges, 'descending': descending}
+
+
+class StockIndex:
+    """
+    tb_stock을 fd_date 순으로 정렬된 배열로 보관합니다.
+    컬럼 값은 DB에서 받은 값 그대로(object 배열) 보관하여 답변이 DB 조회 결과와 같게 만들고,
+    계산에 쓸 수 있도록 float 배열(NULL은 NaN)도 함께 둡니다.
+    """
+
+    def __init__(self, enabled=True, refresh=300):
+        self.enabled = enabled
+        self.refresh = refresh
+        # (날짜, {컬럼: 원래 값}, {컬럼: float}) 묶음을 통째로 교체하므로 읽는 쪽은 잠금 없이 한 시점의 색인을 사용
+        self._data = (np.array([], dtype='datetime64[D]'),
+                      {name: np.array([], dtype=object) for name in STOCK_INDEX_COLUMNS},
+                      {name: np.array([], dtype=np.float64) for name in STOCK_INDEX_COLUMNS})
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.loads = 0
+
+    def snapshot(self):
+        return self._data
+
+    def is_fresh(self):
+        return self._refreshed_at is not None and time.monotonic() - self._refreshed_at <= self.refresh
+
+    def merge(self, query_result):
+        """갱신 조회 결과를 색인 뒤에 이어 붙입니다. 결과의 첫 날짜 이후에 있던 행은 새 행으로 교체합니다."""
+        if isinstance(query_result, dict) and 'columns' in query_result:
+            columns = dict(zip(query_result['columns'], query_result['values']))
+        elif isinstance(query_result, list):
+            rows = [row for row in query_result if isinstance(row, dict)]
+            columns = {name: [row.get(name) for row in rows] for name in ('fd_date',) + STOCK_INDEX_COLUMNS}
+        else:
+            return
+        dates = list(columns.get('fd_date') or [])
+        if any(date is None for date in dates):
+            return
+
+        with self._lock:
+            old_dates, old_values, old_numbers = self._data
+            if dates:
+                if len(dates[0]) > 10:
+                    dates = to_kst_dates(dates)
+                new_dates = np.array(dates, dtype='datetime64[D]')
+                order = np.argsort(new_dates, kind='stable')
+                keep = np.searchsorted(old_dates, new_dates[order[0]])
+                values, numbers = {}, {}
+                for name in STOCK_INDEX_COLUMNS:
+                    new = np.array(columns.get(name) or [None] * len(dates), dtype=object)[order]
+                    values[name] = np.concatenate([old_values[name][:keep], new])
+                    numbers[name] = np.concatenate([old_numbers[name][:keep], np.array(
+                        [np.nan if value is None else float(value) for value in new], dtype=np.float64)])
+                self._data = (np.concatenate([old_dates[:keep], new_dates[order]]), values, numbers)
+            self._refreshed_at = time.monotonic()
+            self.loads += 1
+
+    def evaluate(self, query):
+        """tb_stock 조회({sql, params}) 하나를 색인으로 계산합니다. 색인이 질문한 기간을 덮지 못하거나 지원하지 않는 쿼리면 None."""
+        plan = compile_stock_sql(query['sql']) if self.enabled else None
+        if plan is None:
+            return None
+        dates, values, _ = self.snapshot()
+        if not len(dates):
+            return None
+        params = query['params']
+        bounds = [(np.datetime64(params[start], 'D'), np.datetime64(params[end], 'D')) for start, end in plan['ranges']]
+        if not self.is_fresh() and max(end for _, end in bounds) > dates[-1] + np.timedelta64(1, 'D'):
+            return None
+
+        index = np.unique(np.concatenate([np.arange(*np.searchsorted(dates, [start, end])) for start, end in bounds]))
+        if plan['descending']:
+            index = index[::-1]
+        columns = {'fd_date': format_days(dates[index])}
+        columns.update({name: values[name][index].tolist() for name in plan['columns'][1:]})
+        with self._lock:
+            self.hits += 1
+        return ResultRows([dict(zip(plan['columns'], row)) for row in zip(*(columns[name] for name in plan['columns']))])
+
+    def load_query(self, query):
+        """주가 질문인데 색인이 비었거나 갱신 시간이 지났으면 {STOCK_INDEX_KEY: 마지막 날짜부터의 갱신 조회}를 반환합니다."""
+        if not self.enabled or not any(isinstance(value, dict) and compile_stock_sql(value['sql']) for value in query.values()):
+            return {}
+        if len(self.snapshot()[0]) and self.is_fresh():
+            return {}
+        with self._lock:
+            self.misses += 1
+        return {STOCK_INDEX_KEY: self.refresh_query()}
+
+    def refresh_query(self):
+        """색인의 마지막 날짜부터(색인이 비었으면 전체) 조회하는 바인딩 쿼리"""
+        dates = self.snapshot()[0]
+        condition = (" WHERE fd_date >= ?", (format_days(dates[-1:])[0],)) if len(dates) else EMPTY_SQL
+        sql, params = condition
+        return bind_query((STOCK_INDEX_QUERY.format(condition=sql), params), None)
+
+    def stats(self):
+        dates = self.snapshot()[0]
+        with self._lock:
+            return {"enabled": self.enabled, "rows": len(dates),
+                    "last_date": format_days(dates[-1:])[0] if len(dates) else None, "fresh": self.is_fresh(),
+                    "hits": self.hits, "misses": self.misses, "loads": self.loads}
+
+
+stock_index = StockIndex(
+    enabled=os.environ.get('CHATBOT_STOCK_INDEX', '1') == '1',
+    refresh=float(os.environ.get('CHATBOT_STOCK_INDEX_REFRESH', 300)),
+)
+
+
+def local_results(query, user_id):
+    """
+    1단계 쿼리({key: 바인딩 쿼리 | 예외/링크 문자열})를 보관된 거래(TransactionStore), 보유 수량 색인(HoldingsIndex)과
+    주가 색인(StockIndex)으로 계산합니다.
+    계산할 수 없는 키가 하나라도 있거나 계산한 키가 없으면 None을 반환하며, 이때는 기존처럼 Node가 DB에서 조회합니다.
+    """
+    results, computed = {}, False
+    for key, value in query.items():
+        if isinstance(value, str) and is_passthrough_key(key):
+            results[key] = value
+            continue
+        result = None
+        if isinstance(value, dict):
+            result = transaction_store.evaluate(value, user_id)
+            if result is None:
+                result = holdings_index.evaluate(value, user_id)
+            if result is None:
+                result = stock_index.evaluate(value)
+        if result is None:
+            return None
+        results[key] = result
+        computed = True
+    return results if computed else None
+
+
+# ===== Holdings Index =====
+# 보유 주식 질문("지금 삼성전자 몇 주 있어?", "작년에 산 애플")은 사용자의 수량 거래(tb_shares_held) 전체를 매번 다시 더하지 않도록,
+# 날짜별 누적 합(prefix sum)으로 보관하고 "그 날까지의 보유 수량"과 "기간 중 구매/판매 수량"을 이진 탐색 두 번으로 계산합니다.
+# 삼성전자/애플/비트코인 세 종목을 한 배열에 함께 누적하므로 종목 수와 관계없이 한 번에 계산합니다.
+# - 보관/만료/무효화는 TransactionStore와 같습니다. (투자 저장 시 Node가 {type: 'invalidate', user_id}를 보냄)
+# CHATBOT_HOLDINGS_INDEX=0이면 사용하지 않습니다.
+HOLDINGS_INDEX_KEY = '__shares_held__'
+HOLDINGS_INDEX_QUERY = f"SELECT sh_date, {', '.join(HOLDINGS_COLUMNS)} FROM tb_shares_held WHERE user_id = {{user_id}} ORDER BY sh_date"
+# holdings_query가 만드는 SELECT 항목 -> (측정값 위치, 종목 위치, 결과 컬럼 이름)
+HOLDINGS_PROJECTIONS = {
+    ' '.join(tokenize_finance_sql(f"{template.format(column=column)} AS {measure}_{suffix}")).lower(): (measure_index, column_index, f'{measure}_{suffix}')
+    for measure_index, (measure, template) in enumerate(HOLDINGS_MEASURES.items())
+    for column_index, (column, suffix) in enumerate(HOLDINGS_COLUMNS.items())
+}
+
+
+@functools.lru_cache(maxsize=256)
+def compile_holdings_sql(sql):
+    """
+    holdings_query 형태의 바인딩 쿼리를 UserHoldings가 계산할 계획(dict)으로 바꿉니다.
+    SELECT <SUM 항목>, ... FROM tb_shares_held WHERE user_id = ? [AND sh_date < ? | AND <sh_date 범위>] [;] 만 지원하며, 그 밖에는 None.
+    """
+    tokens = tokenize_finance_sql(sql)
+    if not tokens:
+        return None
+    parser = FinanceSqlParser(tokens, date_columns=('sh_date',))
+    try:
+        parser.take('SELECT')
+        items = []
+        while True:
+            # GREATEST(x, 0)처럼 괄호 안의 쉼표는 항목 구분이 아님
+            start, depth = parser.position, 0
+            while parser.peek() is not None and not (depth == 0 and parser.peek() in (',', 'FROM')):
+                depth += {'(': 1, ')': -1}.get(parser.take(), 0)
+            item = HOLDINGS_PROJECTIONS.get(' '.join(tokens[start:parser.position]).lower())
+            if item is None:
+                raise ValueError('지원하지 않는 SELECT 항목')
+            items.append(item)
+            if parser.peek() != ',':
+                break
+            parser.take(',')
+        parser.take('FROM')
+        parser.take('tb_shares_held')
+        parser.take('WHERE')
+        parser.take('user_id')
+        parser.take('=')
+        parser.user_params.append(parser.param())
+        ranges = [(None, None)]
+        if parser.peek() == 'AND':
+            parser.take('AND')
+            if tokens[parser.position + 1:parser.position + 2] == ['<']:
+                parser.take('sh_date')
+                parser.take('<')
+                ranges = [(None, parser.param())]
+            else:
+                kind, ranges = parser.condition()
+                if kind != 'dates':
+                    raise ValueError(f'지원하지 않는 조건 {kind}')
+        if parser.peek() == ';':
+            parser.take(';')
+        if parser.peek() is not None:
+            raise ValueError('문장 끝에 남은 토큰')
+    except ValueError:
+        return None
+    return {'items': items, 'ranges': ranges, 'user_params': parser.user_params}
+
+
+class UserHoldings:
+    """
+    한 사용자의 수량 거래를 날짜별 누적 합으로 보관합니다.
+
+    - dates: 거래가 있는 날짜(datetime64[D], 중복 없이 정렬)
+    - sums[i, m, c]: dates[i] 전날까지 종목 c의 측정값 m(보유 합계/구매/판매)의 합 (sums[0]은 0)
+    - counts[i, c]: dates[i] 전날까지 종목 c의 값이 NULL이 아닌 행 수 (SUM의 NULL 결과를 DB와 같게 만들기 위해 사용)
+
+    기간의 합은 기간 경계의 searchsorted 위치 두 곳의 누적 합 차이로 구하므로 거래 수와 관계없이 O(log n)입니다.
+    """
+
+    def __init__(self, dates, quantities):
+        order = np.argsort(dates, kind='stable')
+        dates, quantities = dates[order], quantities[order]
+        present = ~np.isnan(quantities)
+        values = np.where(present, quantities, 0.0)
+        # 정수 수량만 있는 종목은 결과도 정수로 반환 (비트코인처럼 소수 수량이 있으면 실수)
+        self.integral = np.all(values == np.round(values), axis=0)
+        measures = np.stack([values, np.maximum(values, 0), np.minimum(values, 0)], axis=1)
+
+        self.dates, starts = np.unique(dates, return_index=True)
+        self.sums = np.zeros((len(self.dates) + 1, *measures.shape[1:]))
+        self.counts = np.zeros((len(self.dates) + 1, quantities.shape[1]), dtype=np.int64)
+        if len(self.dates):
+            # 같은 날짜의 행을 하나로 합친 뒤 누적
+            np.cumsum(np.add.reduceat(measures, starts, axis=0), axis=0, out=self.sums[1:])
+            np.cumsum(np.add.reduceat(present.astype(np.int64), starts, axis=0), axis=0, out=self.counts[1:])
+        self.nbytes = self.dates.nbytes + self.sums.nbytes + self.counts.nbytes
+
+    @classmethod
+    def from_result(cls, query_result):
+        """HOLDINGS_INDEX_QUERY의 결과(열 단위 또는 행 객체 배열)로 만듭니다. 날짜가 없는 행은 날짜 조건에 걸리지 않으므로 제외합니다."""
+        names = ('sh_date', *HOLDINGS_COLUMNS)
+        if isinstance(query_result, dict) and 'columns' in query_result:
+            columns = dict(zip(query_result['columns'], query_result['values']))
+        elif isinstance(query_result, list):
+            rows = [row for row in query_result if isinstance(row, dict)]
+            columns = {name: [row.get(name) for row in rows] for name in names}
+        else:
+            return None
+        if not all(name in columns for name in names):
+            return None
+        keep = [index for index, value in enumerate(columns['sh_date']) if value is not None]
+        dates = [columns['sh_date'][index] for index in keep]
+        if dates and len(dates[0]) > 10:
+            dates = to_kst_dates(dates)
+        # DECIMAL 수량은 문자열로 올 수 있으므로 실수로 변환 (NULL은 NaN)
+        quantities = np.array([[np.nan if columns[name][index] is None else float(columns[name][index]) for name in HOLDINGS_COLUMNS]
+                               for index in keep], dtype=np.float64).reshape(len(keep), len(HOLDINGS_COLUMNS))
+        return cls(np.array(dates, dtype='datetime64[D]'), quantities)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def evaluate(self, plan, params):
+        """계획을 계산하여 DB 조회 결과와 같은 모양의 한 행(ResultRows)을 반환합니다."""
+        sums, counts = np.zeros(self.sums.shape[1:]), np.zeros(self.counts.shape[1], dtype=np.int64)
+        for start, end in plan['ranges']:
+            low = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(params[start], 'D')))
+            high = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(params[end], 'D')))
+            high = max(low, high)
+            sums += self.sums[high] - self.sums[low]
+            counts += self.counts[high] - self.counts[low]
+
+        row = {}
+        for measure, column, name in plan['items']:
+            value = sums[measure, column].item()
+            row[name] = None if not counts[column] else int(round(value)) if self.integral[column] else round(value, 8)
+        return ResultRows([row])
+
+
+class HoldingsIndex(TransactionStore):
+    """user_id -> UserHoldings LRU 캐시입니다. 보관 용량/만료/세대 확인은 TransactionStore와 같습니다."""
+
+    load_key = HOLDINGS_INDEX_KEY
+    load_sql = HOLDINGS_INDEX_QUERY
+    records = UserHoldings
+    compile = staticmethod(compile_holdings_sql)
+
+
+holdings_index = HoldingsIndex(
+    enabled=os.environ.get('CHATBOT_HOLDINGS_INDEX', '1') == '1',
+    max_bytes=int(float(os.environ.get('CHATBOT_HOLDINGS_INDEX_MB', 16)) * 1024 * 1024),
+    ttl=float(os.environ.get('CHATBOT_HOLDINGS_INDEX_TTL', 600)),
+)
+
+
+def render_answer(keyword, query_result, text_message):
+    """
+    2단계 처리: 키(keyword)와 쿼리 결과로 사용자에게 보낼 답변 문장을 생성합니다.
+
+    Args:
+    - keyword (str): 1단계에서 생성한 쿼리 키 (예: '지출_sum')
+    - query_result: Node에서 실행한 쿼리 결과(행 객체 배열 또는 열 단위 결과) 또는 예외/링크 문자열
+    - text_message (str): 1단계에서 정규화된 질문
+
+    Returns:
+    - str: 답변 문장
+    """
+    query_result = decode_query_result(query_result)
+
+    backword_key = None
+    if "_" in keyword:
+        front_key = keyword.split("_")[0]
+        backword_key = keyword.split("_")[1]
+    else:
+        front_key = keyword
+
+    if (keyword == '예외') and ('https' in query_result) :
+        return f'{query_result}'
+    elif (keyword == '예외') and ('https' not in query_result) :
+        return f'"{query_result}"\n올바른 형식으로 다시 질문해 주세요.'
+    elif any(i in keyword for i in ['지출', '소득', '입금', '출금', '저축', '저금', '예적금', '예금', '적금']):
+        return make_answer(query_result, front_key, backword_key, text_message)
+    elif '예산' in keyword: #in ['예산', '올해 예산', '올해 예산추천', '이번달 예산추천', "과거 예산 조회"]:
+        return budget_answer(query_result, front_key)
+    elif '대출' in keyword:
+        return loan_answer(query_result, front_key)
+    elif '링크' in keyword or 'FAQ' in keyword:
+        return query_result
+    elif keyword in HOLDINGS_HEADERS:
+        return holdings_answer(query_result, keyword)
+    elif '주가' in keyword:
+        stock_name = keyword.replace('_주가', '')
+        return generate_stock_price_response(query_result, stock_name)
+    elif any(metric in keyword for metric in ["PER", "PBR", "ROE", "MC"]):
+        return generate_stock_info_response(query_result, keyword)
+    else:
+        return json.dumps(query_result)
+
+
+def render_answers(results, text_message):
+    """
+    여러 키의 쿼리 결과({key: rows})를 한 번에 받아 키 순서대로 답변을 만들고 하나의 메시지로 합칩니다.
+    키별 답변은 render_answer로 만들고, 결과가 비어 있는 키는 NOT_FOUND_MESSAGE로 답합니다.
+
+    Args:
+    - results (dict): 키별 쿼리 결과 (Node에서 실행한 결과 또는 예외/링크 문자열)
+    - text_message (str): 1단계에서 정규화된 질문
+
+    Returns:
+    - str: 키별 답변을 빈 줄로 구분하여 이어 붙인 최종 메시지
+    """
+    answers = []
+    for keyword, query_result in results.items():
+        query_result = decode_query_result(query_result)
+        answers.append(render_answer(keyword, query_result, text_message) if query_result else NOT_FOUND_MESSAGE)
+    return ''.join(f'{str(answer).strip()}\n\n' for answer in answers)
+
+
+def collect_stats():
+    """처리 단계별 성능 지표를 모아 반환합니다."""
+    return {
+        "intent_batching": intent_batcher.stats(),
+        "intent_cascade": intent_cascade.stats(),
+        "intent_cache": intent_cache.stats(),
+        "resources": resources.stats(),
+        "analysis": analysis_stats(),
+        "particles": check_conjunction_and_particle_with_kkma.cache_info()._asdict(),
+        "transaction_store": transaction_store.stats(),
+        "stock_index": stock_index.stats(),
+        "holdings_index": holdings_index.stats(),
+    }
+
+
+def handle_request(data, conversations):
+    """
+    request_id가 포함된 메시지(프로토콜 모드)를 처리합니다.
+
+    - {request_id, message, user_id[, monthly_rollup]} -> {request_id, query}  (monthly_rollup: false면 월 집계 테이블 미사용)
+                                               {request_id, query, answer}  (보관된 거래/보유 수량/주가 색인으로 바로 답변, 2단계 생략)
+    - {request_id, key, queryResult}        -> {request_id, key, answer}
+    - {request_id, results: {key: rows}, user_id} -> {request_id, answer}  (모든 키의 답변을 한 번에 조합)
+    - {request_id, type: 'close'}           -> 대화 상태 정리 (응답 없음)
+    - {request_id, type: 'invalidate', user_id} -> 보관된 거래/보유 수량 제거 (응답 없음)
+    - {request_id, type: 'stats'}           -> {request_id, stats}
+
+    Returns:
+    - dict | None: 응답 메시지
+    """
+    request_id = data['request_id']
+    if data.get('type') == 'close':
+        conversations.pop(request_id)
+        transaction_store.discard(request_id)
+        holdings_index.discard(request_id)
+        return None
+    if data.get('type') == 'invalidate':
+        transaction_store.invalidate(data.get('user_id'))
+        holdings_index.invalidate(data.get('user_id'))
+        return None
+    if data.get('type') == 'stats':
+        return {'request_id': request_id, 'stats': collect_stats()}
+
+    message = data.get('message')
+    user_id = data.get('user_id')
+    query_result = data.get('queryResult')
+    keyword = data.get('key')
+    results = data.get('results')
+
+    if message and user_id and not query_result and not keyword:
+        query, text_message = create_query_message(message, user_id, data.get('monthly_rollup', True) is not False)
+        results = local_results(query, user_id)
+        if results is not None:
+            return {'request_id': request_id, 'query': query, 'answer': render_answers(results, text_message)}
+        query = {**query, **transaction_store.load_query(query, user_id, request_id),
+                 **holdings_index.load_query(query, user_id, request_id), **stock_index.load_query(query)}
+        conversations.put(request_id, text_message)
+        return {'request_id': request_id, 'query': query}
+
+    elif isinstance(results, dict):
+        text_message = conversations.get(request_id, '')
+        results = dict(results)
+        if TRANSACTION_STORE_KEY in results:
+            transactions = results.pop(TRANSACTION_STORE_KEY)
+            if user_id:
+                transaction_store.put(user_id, transactions, request_id)
+        if HOLDINGS_INDEX_KEY in results:
+            holdings = results.pop(HOLDINGS_INDEX_KEY)
+            if user_id:
+                holdings_index.put(user_id, holdings, request_id)
+        if STOCK_INDEX_KEY in results:
+            stock_index.merge(results.pop(STOCK_INDEX_KEY))
+        return {'request_id': request_id, 'answer': render_answers(results, text_message)}
+
+    elif keyword and query_result:
+        text_message = conversations.get(request_id, '')
+        return {'request_id': request_id, 'key': keyword, 'answer': render_answer(keyword, query_result, text_message)}
+
+    elif keyword or query_result:
+        return {'request_id': request_id, 'key': keyword, 'answer': NOT_FOUND_MESSAGE}
+
+    return {'request_id': request_id, 'error': '처리할 수 없는 메시지 형식입니다.'}
+
+
+def write_output(text):
+    """응답 한 건을 stdout에 기록합니다."""
+    with _stdout_lock:
+        sys.stdout.write(f'{text}\n')
+        sys.stdout.flush()
+
+
+def process_request(data, conversations):
+    """프로토콜 메시지를 처리하고, 오류가 나면 오류 응답으로 변환합니다."""
+    try:
+        return handle_request(data, conversations)
+    except Exception as e:
+        logging.exception('요청 처리 중 오류 (request_id=%s)', data.get('request_id'))
+        return {'request_id': data.get('request_id'), 'error': str(e)}
+
+
+# ================================================================================ Message Codec ================================================================================
+# Node와 주고받는 메시지의 경계를 정하는 방식
+# - line: JSON 한 줄 = 메시지 한 건 (기존 방식, request_id가 없는 기존 형식 메시지도 처리)
+# - frame: [본문 길이 4바이트 big-endian][메시지 종류 1바이트][UTF-8 JSON 본문]
+#   본문 길이를 먼저 보내므로 큰 응답이 여러 조각으로 나뉘거나 다음 응답과 붙어서 와도 그대로 복원되고,
+#   응답을 기다리지 않고 여러 요청을 연달아 보낼 수 있습니다(응답은 request_id로 구분).
+FRAME_HEADER = struct.Struct('>IB')
+FRAME_TYPES = {'ready': 1, 'request': 2, 'response': 3, 'error': 4}
+FRAME_KINDS = {code: kind for kind, code in FRAME_TYPES.items()}
+FRAME_MAX_SIZE = 64 * 1024 * 1024  # 메시지 한 건(queryResult 포함)의 최대 크기
+
+
+class LineCodec:
+    """JSON 한 줄을 메시지 한 건으로 보는 코덱. 메시지 종류는 본문(type, error)으로 구분합니다."""
+    name = 'line'
+
+    def encode(self, kind, message):
+        return (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def read(self, stream):
+        """(종류, 본문) 또는 입력이 끝났으면 None. 빈 줄은 본문이 빈 값입니다."""
+        line = stream.readline()
+        return ('request', line.strip()) if line else None
+
+    async def read_async(self, reader):
+        line = await reader.readline()
+        return ('request', line.strip()) if line else None
+
+
+class FrameCodec:
+    """길이와 종류를 헤더에 담은 프레임 하나를 메시지 한 건으로 보는 코덱."""
+    name = 'frame'
+
+    def encode(self, kind, message):
+        body = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        if len(body) > FRAME_MAX_SIZE:
+            raise ValueError(f'메시지가 최대 크기({FRAME_MAX_SIZE}바이트)를 넘습니다: {len(body)}바이트')
+        return FRAME_HEADER.pack(len(body), FRAME_TYPES[kind]) + body
+
+    def decode_header(self, header):
+        size, code = FRAME_HEADER.unpack(header)
+        if code not in FRAME_KINDS or size > FRAME_MAX_SIZE:
+            raise ValueError(f'잘못된 프레임 헤더입니다: {header.hex()}')
+        return size, FRAME_KINDS[code]
+
+    def read(self, stream):
+        header = stream.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return None
+        size, kind = self.decode_header(header)
+        body = stream.read(size)
+        if len(body) < size:
+            return None
+        return kind, body
+
+    async def read_async(self, reader):
+        try:
+            size, kind = self.decode_header(await reader.readexactly(FRAME_HEADER.size))
+            return kind, await reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            return None
+
+
+CODECS = {codec.name: codec for codec in (LineCodec(), FrameCodec())}
+
+
+def encode_reply(codec, response):
+    """응답을 코덱으로 인코딩합니다. 프레임에 담을 수 없는 크기면 같은 request_id의 오류 응답으로 바꿉니다."""
+    try:
+        return codec.encode('error' if 'error' in response else 'response', response)
+    except ValueError as e:
+        logging.warning('응답 인코딩 실패 (request_id=%s): %s', response.get('request_id'), e)
+        return codec.encode('error', {'request_id': response.get('request_id'), 'error': str(e)})
+
+
+def decode_request(body):
+    """요청 본문을 파싱합니다. request_id가 있는 JSON 객체가 아니면 None."""
+    try:
+        data = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return data if isinstance(data, dict) and data.get('request_id') is not None else None
+
+
+INVALID_REQUEST = {'request_id': None, 'error': 'request_id가 포함된 JSON 메시지만 처리할 수 있습니다.'}
+
+
+# 읽기 루프에서 바로 처리하는 메시지 종류 (응답 없음)
+# 작업 스레드로 넘기면 바로 뒤에 읽은 질문이 먼저 처리되어 무효화 전의 거래로 답할 수 있으므로,
+# 이후 요청을 작업 스레드에 넘기기 전에 반영합니다. (보관소의 잠금만 잡으므로 오래 걸리지 않음)
+INLINE_REQUEST_TYPES = frozenset({'invalidate', 'close'})
+
+
+def serve_request(data, conversations, codec, send):
+    """작업 스레드에서 프로토콜 메시지를 처리하고 응답을 코덱으로 인코딩해 기록합니다."""
+    response = process_request(data, conversations)
+    if response is not None:
+        send(encode_reply(codec, response))
+
+
+# ================================================================================ Startup Warm-up ================================================================================
+# 서로 독립적인 리소스 묶음. 같은 묶음 안의 리소스는 순서대로 로드합니다.
+# (Komoran/Kkma는 JVM을 공유하므로 같은 스레드에서 시작하고, intent_model은 tokenizer와 함께 로드)
+WARMUP_GROUPS = [
+    ['komoran', 'kkma'],
+    ['spacing'],
+    ['spacy'],
+    ['tokenizer', 'intent_model'],
+    ['stock_market_news'],
+]
+
+# 각 처리 단계를 한 번씩 거치게 할 워밍업 질문 (finance/stock 쿼리 생성기 포함)
+WARMUP_QUESTIONS = ["이번달 지출 내역", "삼성전자 주가"]
+
+
+def warm_up(workers=None):
+    """
+    리소스 묶음을 동시에 로드한 뒤, 워밍업 질문으로 전체 처리 단계(띄어쓰기 교정, 분류, 쿼리 생성)를 한 번 실행합니다.
+    워밍업 결과는 캐시와 통계에 남기지 않습니다.
+
+    Returns:
+    - dict: 리소스별 로드 시간, 워밍업 단계별 소요 시간, 전체 시작 시간(초)
+    """
+    started = time.perf_counter()
+
+    def load_group(names):
+        for name in names:
+            resources.get(name)
+
+    with ThreadPoolExecutor(max_workers=workers or len(WARMUP_GROUPS)) as executor:
+        for future in [executor.submit(load_group, group) for group in WARMUP_GROUPS]:
+            future.result()
+    load_wall = time.perf_counter() - started
+
+    stages = {}
+
+    def timed(stage, func, *args):
+        stage_started = time.perf_counter()
+        result = func(*args)
+        stages[stage] = round(stages.get(stage, 0) + time.perf_counter() - stage_started, 3)
+        return result
+
+    timed('particles', preload_particle_decisions)
+    for question in WARMUP_QUESTIONS:
+        normalized = timed('processe_text', processe_text, question)
+        timed('keyword_classifier', keyword_classifier.predict, normalized)
+        label = timed('intent_model', predict_labels, [normalized], resources.get('intent_model'), resources.get('tokenizer'))[0]
+        try:
+            timed('make_query', make_query, label, normalized)
+        except Exception as e:
+            logging.warning('워밍업 쿼리 생성 실패: %s (%s)', question, e)
+
+    return {
+        "load_seconds": dict(resources.load_seconds),
+        "load_wall_seconds": round(load_wall, 3),
+        "warmup_seconds": stages,
+        "total_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def ready_message(startup):
+    """시작이 끝났음을 알리는 READY 메시지. request_id가 없으므로 요청 응답과 구분됩니다."""
+    return {"type": "ready", "pid": os.getpid(), "startup": startup}
+
+
+# ================================================================================ Inference Daemon ================================================================================
+# 데몬 모드: 하나의 파이썬 프로세스가 모델을 한 번만 로드하고,
+# 여러 Node 워커가 Unix 소켓으로 접속하여 같은 message/queryResult 교환을 수행
+DAEMON_SOCKET_PATH = os.environ.get('CHATBOT_SOCKET', '/tmp/aiccmap_chatbot.sock')
+DAEMON_READ_LIMIT = FRAME_MAX_SIZE  # 한 줄(queryResult 포함)의 최대 크기
+
+
+async def handle_daemon_client(reader, writer, executor, greeting, codec):
+    """
+    소켓 연결 하나를 처리합니다. 연결마다 대화 상태를 따로 두고,
+    요청은 공유 작업 스레드에서 동시에 처리합니다(invalidate/close는 읽은 즉시 처리). 연결 직후 READY 메시지(greeting)를 보냅니다.
+    """
+    loop = asyncio.get_running_loop()
+    writer.write(codec.encode('ready', greeting))
+    conversations = ConversationStore(ttl=float(os.environ.get('CHATBOT_CONVERSATION_TTL', 600)))
+    pending = set()
+
+    async def respond(data):
+        response = await loop.run_in_executor(executor, process_request, data, conversations)
+        if response is not None:
+            writer.write(encode_reply(codec, response))
+            await writer.drain()
+
+    try:
+        while True:
+            message = await codec.read_async(reader)
+            if message is None:
+                break
+            _, body = message
+            if not body:
+                continue
+
+            data = decode_request(body)
+            if data is None:
+                writer.write(codec.encode('error', INVALID_REQUEST))
+                continue
+            if data.get('type') in INLINE_REQUEST_TYPES:
+                process_request(data, conversations)
+                continue
+
+            task = asyncio.create_task(respond(data))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    except (ConnectionResetError, asyncio.LimitOverrunError, ValueError) as e:
+        logging.warning('데몬 클라이언트 연결 오류: %s', e)
+    finally:
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        writer.close()
+
+
+def run_daemon(socket_path, workers, startup=None, codec=CODECS['line']):
+    """Unix 소켓 위에서 asyncio 추론 서버를 실행합니다. 소켓은 워밍업이 끝난 뒤에 생성됩니다."""
+    executor = ThreadPoolExecutor(max_workers=workers)
+    greeting = ready_message(startup or {})
+
+    async def serve():
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(
+            lambda reader, writer: handle_daemon_client(reader, writer, executor, greeting, codec),
+            path=socket_path, limit=DAEMON_READ_LIMIT)
+        os.chmod(socket_path, 0o660)
+        logging.info('추론 데몬 대기 중: %s (workers=%d, protocol=%s)', socket_path, workers, codec.name)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    finally:
+        executor.shutdown(wait=False)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def run_stdio(workers, startup=None, codec=CODECS['line']):
+    """
+    stdin/stdout 모드를 실행합니다. 먼저 READY 메시지를 출력한 뒤 입력을 받습니다.
+    request_id가 있는 메시지는 작업 스레드에서 동시에 처리하고(invalidate/close는 읽은 즉시 처리),
+    request_id가 없는 기존 형식의 메시지는 (line 코덱에서만) 순서대로 처리합니다.
+    """
+    stdout = sys.stdout  # 래퍼가 정리되면 stdout이 닫히므로 참조를 유지
+    if codec.name == 'frame':
+        # 프레임 사이에 다른 출력이 끼어들지 않도록 print 등의 일반 출력은 stderr로 보냄
+        stdout.flush()
+        sys.stdout = sys.stderr
+
+    def send(payload):
+        with _stdout_lock:
+            stdout.buffer.write(payload)
+            stdout.buffer.flush()
+
+    send(codec.encode('ready', ready_message(startup or {})))
+    conversations = ConversationStore(ttl=float(os.environ.get('CHATBOT_CONVERSATION_TTL', 600)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    text_message = ''
+
     while True:
-        input_data = sys.stdin.readline().strip()
+        try:
+            message = codec.read(sys.stdin.buffer)
+        except ValueError as e:
+            # 프레임 경계를 잃으면 이후 입력을 해석할 수 없으므로 종료 (Node가 프로세스를 다시 시작)
+            logging.error('입력 프레임 오류: %s', e)
+            break
+        if message is None:
+            break  # stdin이 닫히면(EOF) 종료
+        _, input_data = message
         if not input_data:
             continue  # 입력이 없으면 다시 대기 상태로 돌아감
 
+        data = decode_request(input_data)
+        if data is not None and data.get('type') in INLINE_REQUEST_TYPES:
+            process_request(data, conversations)
+            continue
+        if data is not None:
+            executor.submit(serve_request, data, conversations, codec, send)
+            continue
+        if codec.name != 'line':
+            send(codec.encode('error', INVALID_REQUEST))
+            continue
+
         try:
             # 입력된 데이터를 JSON으로 파싱
             data = json.loads(input_data)
@@ -2150,78 +4598,50 @@ if __name__ == "__main__":
             user_id = data.get('user_id')
             query_result = data.get('queryResult')  # queryResult가 맞는지 확인
             keyword = data.get('key')
-        
+            results = data.get('results')
 
             # 첫 번째 입력 처리: message와 user_id가 있는 경우
             if message and user_id and not query_result and not keyword:
-                message = processe_text(message)
-                classification = predict_label(message, model, tokenizer)
-                query = make_query(classification, message)
+                query, text_message = create_query_message(message, user_id)
+                write_output(json.dumps(query, ensure_ascii=False) + '<END>')
 
-                for key in query:
-                    query[key] = query[key].format(user_id=user_id)
-
-                text_message = message[:]
-
-                message = ''
-                user_id = ''
-                print(json.dumps(query, ensure_ascii=False) + '<END>', flush=True)
+            # 두 번째 입력 처리: 모든 키의 결과를 한 번에 받은 경우
+            elif isinstance(results, dict):
+                write_output(render_answers(results, text_message))
 
             # 두 번째 입력 처리: key와 query_result가 있는 경우
             elif keyword and query_result:
-                for entry in query_result:
-                    if 'rp_date' in entry:
-                        query_time = datetime.strptime(entry['rp_date'], "%Y-%m-%dT%H:%M:%S.%fZ")
-                        korea_time = query_time.replace(tzinfo=pytz.utc).astimezone(kst)
-                        entry['rp_date'] = korea_time.strftime("%Y-%m-%d")
-                    elif 'fd_date' in entry:
-                        query_time = datetime.strptime(entry['fd_date'], "%Y-%m-%dT%H:%M:%S.%fZ")
-                        korea_time = query_time.replace(tzinfo=pytz.utc).astimezone(kst)
-                        entry['fd_date'] = korea_time.strftime("%Y-%m-%d")
-
-                # 전달받은 queryResult 데이터로 처리
-                try:
-                    if "_" in keyword:
-                        front_key = keyword.split("_")[0]
-                        backword_key = keyword.split("_")[1]
-                    else:
-                        front_key = keyword
-
-                    if (keyword == '예외') and ('https' in query_result) :
-                        print(f'{query_result}', flush=True)
-                    elif (keyword == '예외') and ('https' not in query_result) :
-                        print(f'"{query_result}"\n올바른 형식으로 다시 질문해 주세요.', flush=True)
-                    elif any(i in keyword for i in ['지출', '소득', '입금', '출금', '저축', '저금', '예적금', '예금', '적금']):
-                        sentence = make_answer(query_result, front_key, backword_key, text_message)
-                        print(sentence, flush=True)
-                    elif '예산' in keyword: #in ['예산', '올해 예산', '올해 예산추천', '이번달 예산추천', "과거 예산 조회"]:
-                        sentence = budget_answer(query_result, front_key)
-                        print(sentence, flush=True)
-                    elif '대출' in keyword:
-                        sentence = loan_answer(query_result, front_key)
-                        print(sentence, flush=True)
-                    elif '링크' in keyword or 'FAQ' in keyword:
-                        print(query_result, flush=True)
-                    elif '주가' in keyword:
-                        stock_name = keyword.replace('_주가', '')
-                        sentence = generate_stock_price_response(query_result, stock_name)
-                        print(sentence, flush=True)
-                    elif any(metric in keyword for metric in ["PER", "PBR", "ROE", "MC"]):
-                        response = generate_stock_info_response(query_result, keyword)
-                        print(response, flush=True)
-                    else:
-                        print(json.dumps(query_result), flush=True)
-                    query_result = ''
-                    keyword = ''
-                    text_message = ''
-                except json.JSONDecodeError as e:
-                    print(f"JSONDecodeError: {e}", flush=True)
+                write_output(render_answer(keyword, query_result, text_message))
 
             # key 또느 query_result의 값이 1개만 있을 때,
             elif (keyword and not query_result) or (not keyword and query_result):
-                print("해당하는 결과를 찾을 수 없습니다. 다시 질문해 주세요.", flush=True)
+                write_output(NOT_FOUND_MESSAGE)
 
         except json.JSONDecodeError:
-            print("Error: 입력 데이터를 JSON으로 파싱하는 중 오류가 발생했습니다.", flush=True)
+            write_output("Error: 입력 데이터를 JSON으로 파싱하는 중 오류가 발생했습니다.")
         except Exception as e:
-            print(f"Error: {str(e)}", flush=True)
+            write_output(f"Error: {str(e)}")
+
+    executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='AICC MAP 챗봇 추론 스크립트')
+    parser.add_argument('--daemon', action='store_true', help='Unix 소켓 추론 데몬으로 실행')
+    parser.add_argument('--socket', default=DAEMON_SOCKET_PATH, help='데몬 소켓 경로')
+    parser.add_argument('--protocol', choices=sorted(CODECS), default=os.environ.get('CHATBOT_PROTOCOL', 'line'), help='메시지 경계 방식 (line: JSON 한 줄, frame: 길이 헤더가 붙은 프레임)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('CHATBOT_WORKERS', 4)), help='동시 처리 작업 스레드 수')
+    parser.add_argument('--export-onnx', action='store_true', help='분류기를 ONNX로 내보내고 종료')
+    parser.add_argument('--quantize', action='store_true', help='--export-onnx와 함께 동적 int8 양자화 모델도 생성')
+    args = parser.parse_args()
+
+    if args.export_onnx:
+        print(json.dumps(export_onnx(quantize=args.quantize), ensure_ascii=False, indent=2), flush=True)
+    else:
+        # CHATBOT_WARMUP=0이면 워밍업 없이 바로 READY를 보내고, 리소스는 첫 요청에서 로드
+        startup = warm_up() if os.environ.get('CHATBOT_WARMUP', '1') == '1' else {}
+        logging.info('시작 완료: %s', json.dumps(startup, ensure_ascii=False))
+        if args.daemon:
+            run_daemon(args.socket, args.workers, startup, CODECS[args.protocol])
+        else:
+            run_stdio(args.workers, startup, CODECS[args.protocol])
@@ -0,0 +1,136 @@
+const pool = require('./database');
+
+// 가계부 거래(tb_received_paid)의 월 집계 테이블
+// (사용자, 월, 수입/지출, 고정 여부, 내역)별 건수, 합계, 최고/최저 금액과 그 날짜를 보관
+// 챗봇(unified_script.py)의 월 단위 합계/평균/최고/최저/자주 질문은 거래 행 대신 이 테이블을 조회
+// 거래를 추가/삭제하는 쿼리와 같은 커넥션(트랜잭션)으로 갱신해야 함
+// NULL은 키로 쓸 수 없으므로 rp_part/rp_hold는 -1, rp_detail은 ''로 저장 (챗봇의 `= 값` 조건에는 걸리지 않음)
+const CREATE_MONTHLY_ROLLUP = `
+  CREATE TABLE IF NOT EXISTS tb_received_paid_monthly (
+    user_id INT NOT NULL,
+    rp_month DATE NOT NULL,
+    rp_part TINYINT NOT NULL,
+    rp_hold TINYINT NOT NULL,
+    rp_detail VARCHAR(255) NOT NULL,
+    rp_count INT NOT NULL,
+    rp_total BIGINT NOT NULL,
+    rp_max INT NOT NULL,
+    rp_max_date DATE NOT NULL,
+    rp_min INT NOT NULL,
+    rp_min_date DATE NOT NULL,
+    PRIMARY KEY (user_id, rp_month, rp_part, rp_hold, rp_detail)
+  )
+`;
+
+// 거래 테이블에서 집계 행을 다시 계산 (최고/최저 금액의 거래가 여러 건이면 가장 이른 날짜)
+const rebuildMonthlyRollup = (condition) => `
+  INSERT INTO tb_received_paid_monthly
+  SELECT user_id, rp_month, rp_part, rp_hold, rp_detail, COUNT(*), SUM(rp_amount),
+         MAX(rp_amount), MIN(CASE WHEN max_rank = 1 THEN rp_date END),
+         MIN(rp_amount), MIN(CASE WHEN min_rank = 1 THEN rp_date END)
+  FROM (
+    SELECT user_id, rp_date, rp_amount,
+           DATE_FORMAT(rp_date, '%Y-%m-01') AS rp_month,
+           IFNULL(rp_part, -1) AS rp_part, IFNULL(rp_hold, -1) AS rp_hold, IFNULL(rp_detail, '') AS rp_detail,
+           RANK() OVER (PARTITION BY user_id, DATE_FORMAT(rp_date, '%Y-%m'), rp_part, rp_hold, rp_detail ORDER BY rp_amount DESC) AS max_rank,
+           RANK() OVER (PARTITION BY user_id, DATE_FORMAT(rp_date, '%Y-%m'), rp_part, rp_hold, rp_detail ORDER BY rp_amount ASC) AS min_rank
+    FROM tb_received_paid
+    WHERE rp_date IS NOT NULL AND rp_amount IS NOT NULL AND ${condition}
+  ) ranked
+  GROUP BY user_id, rp_month, rp_part, rp_hold, rp_detail
+`;
+
+// 집계 테이블이 거래 테이블과 일치함을 확인(또는 다시 계산)한 뒤에만 true
+// false인 동안에는 거래 추가/삭제 시 집계를 갱신하지 않고, 챗봇도 집계 테이블 대신 거래 테이블을 조회
+// (다음 서버 시작 시 일치 검사에서 다시 계산됨)
+let monthlyRollupReady = false;
+const isMonthlyRollupReady = () => monthlyRollupReady;
+
+// 거래 테이블에서 바로 계산한 (사용자, 월, 수입/지출, 고정 여부, 내역)별 건수/합계와 집계 테이블을 비교
+// 모든 묶음의 건수와 합계가 같고 묶음 수도 같으면(집계에만 있는 묶음이 없으면) 일치
+const CHECK_MONTHLY_ROLLUP = `
+  SELECT (SELECT COUNT(*) FROM tb_received_paid_monthly) AS rollup_groups,
+         COUNT(*) AS base_groups,
+         IFNULL(SUM(r.user_id IS NULL OR r.rp_count <> b.rp_count OR r.rp_total <> b.rp_total), 0) AS mismatched
+  FROM (
+    SELECT user_id, rp_month, rp_part, rp_hold, rp_detail, COUNT(*) AS rp_count, SUM(rp_amount) AS rp_total
+    FROM (
+      SELECT user_id, rp_amount, DATE_FORMAT(rp_date, '%Y-%m-01') AS rp_month,
+             IFNULL(rp_part, -1) AS rp_part, IFNULL(rp_hold, -1) AS rp_hold, IFNULL(rp_detail, '') AS rp_detail
+      FROM tb_received_paid
+      WHERE rp_date IS NOT NULL AND rp_amount IS NOT NULL
+    ) normalized
+    GROUP BY user_id, rp_month, rp_part, rp_hold, rp_detail
+  ) b
+  LEFT JOIN tb_received_paid_monthly r
+    ON r.user_id = b.user_id AND r.rp_month = b.rp_month AND r.rp_part = b.rp_part
+    AND r.rp_hold = b.rp_hold AND r.rp_detail = b.rp_detail
+`;
+
+// 서버 시작 시(요청을 받기 전) 집계 테이블을 만들고, 거래 테이블과 일치하지 않으면 트랜잭션 안에서 다시 계산
+const ensureMonthlyRollup = async () => {
+  let connection;
+  try {
+    connection = await pool.getConnection();
+    await connection.query(CREATE_MONTHLY_ROLLUP);
+    const [check] = await connection.query(CHECK_MONTHLY_ROLLUP);
+    const mismatched = Number(check.mismatched);
+    if (mismatched > 0 || Number(check.rollup_groups) !== Number(check.base_groups)) {
+      await connection.beginTransaction();
+      // 다른 서버의 거래 추가/삭제가 끝나기를 기다리고, 다시 계산하는 동안에는 새 거래가 들어오지 않도록 거래 테이블을 잠금
+      await connection.query('SELECT COUNT(*) FROM tb_received_paid LOCK IN SHARE MODE');
+      await connection.query('DELETE FROM tb_received_paid_monthly');
+      await connection.query(rebuildMonthlyRollup('1 = 1'));
+      await connection.commit();
+      console.log(`월 집계 테이블(tb_received_paid_monthly)을 거래 테이블로 다시 계산했습니다. (불일치 ${mismatched}건, 집계 ${check.rollup_groups}건 / 거래 ${check.base_groups}건)`);
+    }
+    monthlyRollupReady = true;
+  } catch (error) {
+    if (connection) await connection.rollback().catch(() => {});
+    monthlyRollupReady = false;
+    console.error('월 집계 테이블 준비 실패 (챗봇은 거래 테이블을 조회):', error.message);
+  } finally {
+    if (connection) connection.release();
+  }
+  return monthlyRollupReady;
+};
+
+// 거래 한 건 추가를 집계에 반영 (건수/합계는 누적, 최고/최저는 비교 후 갱신)
+// ON DUPLICATE KEY UPDATE는 왼쪽부터 적용되므로 날짜를 금액보다 먼저 갱신
+const addToMonthlyRollup = async (connection, { userId, date, detail, amount, hold, part }) => {
+  if (!monthlyRollupReady) return;
+  await connection.query(`
+    INSERT INTO tb_received_paid_monthly
+      (user_id, rp_month, rp_part, rp_hold, rp_detail, rp_count, rp_total, rp_max, rp_max_date, rp_min, rp_min_date)
+    VALUES (?, DATE_FORMAT(?, '%Y-%m-01'), IFNULL(?, -1), IFNULL(?, -1), IFNULL(?, ''), 1, ?, ?, ?, ?, ?)
+    ON DUPLICATE KEY UPDATE
+      rp_max_date = IF(VALUES(rp_max) > rp_max OR (VALUES(rp_max) = rp_max AND VALUES(rp_max_date) < rp_max_date), VALUES(rp_max_date), rp_max_date),
+      rp_max = GREATEST(rp_max, VALUES(rp_max)),
+      rp_min_date = IF(VALUES(rp_min) < rp_min OR (VALUES(rp_min) = rp_min AND VALUES(rp_min_date) < rp_min_date), VALUES(rp_min_date), rp_min_date),
+      rp_min = LEAST(rp_min, VALUES(rp_min)),
+      rp_count = rp_count + 1,
+      rp_total = rp_total + VALUES(rp_total)
+  `, [userId, date, part, hold, detail, amount, amount, date, amount, date]);
+};
+
+// 거래 삭제 후 해당 (사용자, 월, 수입/지출, 고정 여부, 내역)의 집계를 거래 테이블에서 다시 계산
+// (삭제된 거래가 최고/최저였을 수 있으므로 누적값을 빼는 대신 그 묶음만 다시 계산)
+const refreshMonthlyRollup = async (connection, { userId, date, detail, hold, part }) => {
+  if (!monthlyRollupReady) return;
+  await connection.query(`
+    DELETE FROM tb_received_paid_monthly
+    WHERE user_id = ? AND rp_month = DATE_FORMAT(?, '%Y-%m-01')
+    AND rp_part = IFNULL(?, -1) AND rp_hold = IFNULL(?, -1) AND rp_detail = IFNULL(?, '')
+  `, [userId, date, part, hold, detail]);
+  await connection.query(rebuildMonthlyRollup(`
+    user_id = ? AND rp_date >= DATE_FORMAT(?, '%Y-%m-01') AND rp_date < DATE_FORMAT(?, '%Y-%m-01') + INTERVAL 1 MONTH
+    AND rp_part <=> ? AND rp_hold <=> ? AND rp_detail <=> ?
+  `), [userId, date, date, part, hold, detail]);
+};
+
+module.exports = {
+  ensureMonthlyRollup,
+  isMonthlyRollupReady,
+  addToMonthlyRollup,
+  refreshMonthlyRollup,
+};
@@ -1,4 +1,6 @@
 const pool = require('../config/database');
+const { addToMonthlyRollup, refreshMonthlyRollup } = require('../config/monthlyRollup');
+const { invalidateFinanceCache } = require('./chatbotController');
 
 const login = async (req, res) => {
   try {
@@ -88,6 +90,7 @@ const searchHouseHoldData = async (req, res) => {
 
 // 새로운 데이터를 저장하는 함수
 const addHouseHoldData = async (req, res) => {
+  let connection;
   try {
     const userId = req.session.userId;
     console.log('Session user_id:', userId); // 세션에 저장된 user_id 확인
@@ -108,7 +111,9 @@ const addHouseHoldData = async (req, res) => {
     }
     const localDate = new Date(rp_date).toISOString().split('T')[0];
 
-    const result = await pool.query(`
+    connection = await pool.getConnection();
+    await connection.beginTransaction();  // 거래와 월 집계를 함께 반영
+    const result = await connection.query(`
       INSERT INTO tb_received_paid (rp_date, 
                                     rp_amount, 
                                     rp_detail, 
@@ -117,11 +122,17 @@ const addHouseHoldData = async (req, res) => {
                                     user_id)
       VALUES (?, ?, ?, ?, ?, ?)
     `, [localDate, rp_amount, rp_detail, rp_hold, rp_part, userId]);
+    await addToMonthlyRollup(connection, { userId, date: localDate, detail: rp_detail, amount: rp_amount, hold: rp_hold, part: rp_part });
+    await connection.commit();
+    invalidateFinanceCache(userId);  // 챗봇이 보관 중인 거래 갱신
     const insertId = result.insertId.toString();  // BigInt 값을 문자열로 변환
     res.json({ message: 'Data inserted successfully', insertId });
   } catch (error) {
+    if (connection) await connection.rollback();
     console.error('Error adding data: ', error);
     res.status(500).json({ error: 'Internal server error', details: error.message });
+  } finally {
+    if (connection) connection.release();
   }
 };
 // 메모 저장/업데이트 함수 추가
@@ -190,6 +201,7 @@ const getMemo = async (req, res) => {
 
 // 가계부 데이터를 삭제하는 함수
 const deleteHouseHoldData = async (req, res) => {
+  let connection;
   try {
     const userId = req.session.userId;  
     const { rp_id } = req.query;       
@@ -199,8 +211,20 @@ const deleteHouseHoldData = async (req, res) => {
       return res.status(400).json({ message: "Record ID (rp_id) and user ID must be provided" });
     }
 
+    connection = await pool.getConnection();
+    await connection.beginTransaction();  // 거래 삭제와 월 집계 갱신을 함께 반영
+
+    // 월 집계를 다시 계산할 수 있도록 삭제할 거래의 월/구분/내역을 먼저 조회
+    const [record] = await connection.query(`
+      SELECT rp_date, rp_detail, rp_hold, rp_part
+      FROM tb_received_paid
+      WHERE user_id = ? 
+      AND rp_id = ?
+      FOR UPDATE;
+    `, [userId, rp_id]);
+
     // 데이터베이스에서 해당 user_id와 rp_id에 맞는 데이터를 삭제
-    const result = await pool.query(`
+    const result = await connection.query(`
       DELETE 
       FROM tb_received_paid
       WHERE user_id = ? 
@@ -209,14 +233,22 @@ const deleteHouseHoldData = async (req, res) => {
 
     // affectedRows로 삭제된 행이 있는지 확인
     if (result.affectedRows === 0) {
+      await connection.rollback();
       return res.status(404).json({ error: 'Record not found or unauthorized' });
     }
 
+    await refreshMonthlyRollup(connection, { userId, date: record.rp_date, detail: record.rp_detail, hold: record.rp_hold, part: record.rp_part });
+    await connection.commit();
+    invalidateFinanceCache(userId);  // 챗봇이 보관 중인 거래 갱신
+
     // 성공적으로 삭제된 경우
     res.json({ message: 'Record deleted successfully' });
   } catch (error) {
+    if (connection) await connection.rollback();
     console.error('Error deleting record:', error);
     res.status(500).json({ error: 'Internal server error' });
+  } finally {
+    if (connection) connection.release();
   }
 };
 
@@ -1,17 +1,255 @@
 const path = require('path');  // 경로 조작을 위한 모듈
 const pool = require('../config/database'); // 데이터베이스 연결 모듈 가져오기
+const { isMonthlyRollupReady } = require('../config/monthlyRollup');
 const { spawn } = require('child_process');
+const net = require('net');
 
 let pythonProcess = null; // 파이썬 프로세스를 글로벌 변수로 설정하여 계속 실행 상태 유지
+let pythonWriter = null; // 파이썬으로 메시지를 보낼 스트림 (프로세스 stdin 또는 데몬 소켓)
+let pythonDaemonConnecting = false;
+// 공유 추론 데몬 소켓 경로 (설정 시 파이썬 프로세스를 직접 띄우지 않고 데몬에 접속)
+const PYTHON_SOCKET_PATH = process.env.CHATBOT_SOCKET;
+const pendingPythonRequests = new Map(); // request_id -> { resolve, reject, timer }
+let pythonRequestSequence = 0;
+let pythonReady = false; // 파이썬이 READY 메시지를 보내기 전까지는 요청을 보내지 않고 대기열에 보관
+let pythonStartupQueue = []; // READY 전에 들어온 요청 ({ requestId, message }) 및 거래 변경 알림 ({ requestId, message, invalidateUserId })
+const PYTHON_REQUEST_TIMEOUT = 60000; // 파이썬 응답 대기 시간 (ms)
+// 파이썬이 보관용 데이터를 받으려고 1단계 쿼리에 추가하는 조회의 키 접두어
+// (unified_script.py의 TRANSACTION_STORE_KEY: 사용자 전체 거래, HOLDINGS_INDEX_KEY: 사용자 주식 수량 거래, STOCK_INDEX_KEY: tb_stock 갱신분)
+const PYTHON_LOAD_KEY_PREFIX = '__';
+
+// 메시지 경계 방식 (unified_script.py --protocol과 같아야 함)
+// - line: JSON 한 줄 = 메시지 한 건
+// - frame: [본문 길이 4바이트 big-endian][메시지 종류 1바이트][UTF-8 JSON 본문]
+// 직접 띄우는 파이썬 프로세스는 frame을 기본으로 쓰고, 데몬은 데몬의 CHATBOT_PROTOCOL 설정(기본 line)을 따름
+const PYTHON_PROTOCOL = process.env.CHATBOT_PROTOCOL || (PYTHON_SOCKET_PATH ? 'line' : 'frame');
+const FRAME_HEADER_SIZE = 5;
+const FRAME_TYPES = { ready: 1, request: 2, response: 3, error: 4 };
+const FRAME_MAX_SIZE = 64 * 1024 * 1024; // 메시지 한 건의 최대 크기
+let pythonDecoder = null; // 파이썬 출력 조각을 메시지 단위로 복원하는 함수 (연결/프로세스마다 새로 생성)
+
+// 줄 단위 디코더: 줄바꿈까지의 바이트를 모아 한 줄씩 반환 (멀티바이트 문자가 조각 경계에서 잘려도 안전)
+function createLineDecoder() {
+  let chunks = [];
+  return (chunk) => {
+    const messages = [];
+    let start = 0;
+    let newlineIndex;
+    while ((newlineIndex = chunk.indexOf(0x0a, start)) !== -1) {
+      chunks.push(chunk.subarray(start, newlineIndex));
+      const line = Buffer.concat(chunks).toString('utf8').trim();
+      chunks = [];
+      start = newlineIndex + 1;
+      if (line) messages.push({ type: null, body: line });
+    }
+    if (start < chunk.length) chunks.push(chunk.subarray(start));
+    return messages;
+  };
+}
+
+// 프레임 디코더: 헤더의 길이만큼 본문이 모일 때까지 기다렸다가 한 번에 복원
+function createFrameDecoder() {
+  let chunks = [];
+  let length = 0;
+  let header = null; // { size, type }
+
+  const take = (size) => {
+    const all = chunks.length === 1 ? chunks[0] : Buffer.concat(chunks, length);
+    chunks = size < all.length ? [all.subarray(size)] : [];
+    length -= size;
+    return all.subarray(0, size);
+  };
+
+  return (chunk) => {
+    chunks.push(chunk);
+    length += chunk.length;
+    const messages = [];
+    for (;;) {
+      if (!header) {
+        if (length < FRAME_HEADER_SIZE) break;
+        const bytes = take(FRAME_HEADER_SIZE);
+        header = { size: bytes.readUInt32BE(0), type: bytes.readUInt8(4) };
+        if (header.size > FRAME_MAX_SIZE) {
+          throw new Error(`잘못된 프레임 헤더: ${bytes.toString('hex')}`);
+        }
+      }
+      if (length < header.size) break;
+      messages.push({ type: header.type, body: take(header.size).toString('utf8') });
+      header = null;
+    }
+    return messages;
+  };
+}
+
+// 파이썬에 보낼 메시지를 현재 방식으로 인코딩
+function encodePythonMessage(payload) {
+  const body = Buffer.from(JSON.stringify(payload), 'utf8');
+  if (PYTHON_PROTOCOL !== 'frame') return Buffer.concat([body, Buffer.from('\n')]);
+  const header = Buffer.alloc(FRAME_HEADER_SIZE);
+  header.writeUInt32BE(body.length, 0);
+  header.writeUInt8(FRAME_TYPES.request, 4);
+  return Buffer.concat([header, body]);
+}
+
+function resetPythonDecoder() {
+  pythonDecoder = PYTHON_PROTOCOL === 'frame' ? createFrameDecoder() : createLineDecoder();
+}
+
+// 파이썬 출력(메시지 한 건 = 응답 한 건)을 request_id 별 대기 중인 요청에 전달
+function handlePythonOutput(data) {
+  let messages;
+  try {
+    messages = pythonDecoder(data);
+  } catch (error) {
+    // 프레임 경계를 잃으면 이후 출력을 해석할 수 없으므로 데몬 연결을 끊거나 프로세스를 종료
+    // (대기 중인 요청은 실패 처리되고, close 이벤트에서 다시 접속/시작)
+    console.error('에러 코드: PY_004 - Python 프레임 오류:', error.message);
+    pythonDecoder = () => [];
+    rejectPendingPythonRequests('Python 출력 프레임 오류');
+    if (PYTHON_SOCKET_PATH) {
+      if (pythonWriter) pythonWriter.destroy();
+    } else if (pythonProcess) {
+      pythonProcess.kill();
+    }
+    return;
+  }
+
+  for (const { type, body } of messages) {
+    let reply;
+    try {
+      reply = JSON.parse(body);
+    } catch (error) {
+      console.error('에러 코드: PY_002 - Python 응답 파싱 실패:', body.slice(0, 200));
+      continue;
+    }
+
+    // 시작(모델 로드 및 워밍업) 완료 메시지: 대기열에 쌓인 요청을 전송
+    if (type === FRAME_TYPES.ready || reply.type === 'ready') {
+      console.log('Python ready:', JSON.stringify(reply.startup));
+      pythonReady = true;
+      const queued = pythonStartupQueue;
+      pythonStartupQueue = [];
+      queued.forEach(({ requestId, message, invalidateUserId }) => {
+        if (invalidateUserId !== undefined || pendingPythonRequests.has(requestId)) pythonWriter.write(message);
+      });
+      continue;
+    }
+
+    const pending = pendingPythonRequests.get(reply.request_id);
+    if (!pending) continue;
+    pendingPythonRequests.delete(reply.request_id);
+    clearTimeout(pending.timer);
+
+    if (type === FRAME_TYPES.error || reply.error) {
+      pending.reject(new Error(reply.error));
+    } else {
+      pending.resolve(reply);
+    }
+  }
+}
+
+// 이미 전송되어 응답을 기다리던 요청을 실패 처리 (파이썬 프로세스 종료, 데몬 연결 종료, 출력 프레임 오류 시)
+// 아직 전송하지 않은 대기열의 요청은 다음 READY 이후 전송
+function rejectPendingPythonRequests(reason) {
+  pythonReady = false;
+  const queuedIds = new Set(pythonStartupQueue.map(({ requestId }) => requestId));
+  for (const [requestId, pending] of pendingPythonRequests) {
+    if (queuedIds.has(requestId)) continue;
+    clearTimeout(pending.timer);
+    pending.reject(new Error(reason));
+    pendingPythonRequests.delete(requestId);
+  }
+}
+
+// request_id를 붙여 파이썬에 메시지를 보내고 해당 응답을 기다림
+function requestPython(payload) {
+  return new Promise((resolve, reject) => {
+    // 프로세스 재시작이나 데몬 재접속 중이면 READY 이후 전송되도록 대기열에 보관 (응답 시간 초과는 동일하게 적용)
+    const timer = setTimeout(() => {
+      pendingPythonRequests.delete(payload.request_id);
+      reject(new Error('Python 응답 시간 초과'));
+    }, PYTHON_REQUEST_TIMEOUT);
+
+    pendingPythonRequests.set(payload.request_id, { resolve, reject, timer });
+    // 응답을 기다리지 않고 바로 전송 (여러 요청이 연달아 전송되어도 응답은 request_id로 구분)
+    const message = encodePythonMessage(payload);
+    if (pythonReady && pythonWriter) {
+      pythonWriter.write(message);
+    } else {
+      pythonStartupQueue.push({ requestId: payload.request_id, message });
+    }
+  });
+}
+
+// 요청 처리가 끝난 대화 상태를 파이썬에서 정리 (응답 없음)
+function closePythonRequest(requestId) {
+  if (pythonWriter && pythonReady) {
+    pythonWriter.write(encodePythonMessage({ request_id: requestId, type: 'close' }));
+  }
+}
+
+// 사용자의 거래(가계부 거래, 주식 수량)가 추가/삭제되면 파이썬이 보관 중인 거래와 보유 수량을 버리도록 알림 (응답 없음)
+// 데몬은 Node와의 연결이 끊겨도 보관된 거래를 유지하므로, 준비되지 않은 동안의 알림은 대기열에 두었다가 READY 직후 전송
+function invalidateFinanceCache(userId) {
+  const requestId = `${process.pid}-${Date.now()}-${++pythonRequestSequence}`;
+  const message = encodePythonMessage({ request_id: requestId, type: 'invalidate', user_id: userId });
+  if (pythonWriter && pythonReady) {
+    pythonWriter.write(message);
+  } else if (!pythonStartupQueue.some(({ invalidateUserId }) => invalidateUserId === userId)) {
+    pythonStartupQueue.push({ requestId, message, invalidateUserId: userId });
+  }
+}
+
+// 쿼리 결과(행 객체 배열)를 열 단위({ columns, values })로 변환하여 파이썬에 전달
+// 열 이름을 행마다 반복하지 않고, 파이썬에서 날짜 열 전체를 한 번에 KST 날짜로 변환
+// 행이 없거나 예외/링크 문자열인 결과는 그대로 전달
+function toColumnar(rows) {
+  if (!Array.isArray(rows) || rows.length === 0 || rows[0] === null || typeof rows[0] !== 'object') return rows;
+  const columns = Object.keys(rows[0]);
+  return { columns, values: columns.map((column) => rows.map((row) => row[column])) };
+}
+
+// 공유 추론 데몬(unified_script.py --daemon)에 접속하는 함수, 연결이 끊기면 다시 접속
+function connectPythonDaemon() {
+  if (pythonDaemonConnecting) return;
+  pythonDaemonConnecting = true;
+
+  const socket = net.createConnection(PYTHON_SOCKET_PATH);
+  socket.on('connect', () => {
+    pythonWriter = socket;
+    pythonReady = false; // 데몬이 연결 직후 보내는 READY 메시지를 기다림
+    resetPythonDecoder();
+    console.log(`Python daemon connected: ${PYTHON_SOCKET_PATH}`);
+  });
+  socket.on('data', handlePythonOutput);
+  socket.on('error', (error) => {
+    console.error('에러 코드: PY_003 - Python 데몬 연결 오류:', error.message);
+  });
+  socket.on('close', () => {
+    pythonWriter = null;
+    pythonDaemonConnecting = false;
+    rejectPendingPythonRequests('Python 데몬 연결이 종료되었습니다.');
+    setTimeout(connectPythonDaemon, 1000);
+  });
+}
 
 // Python 프로세스를 시작하는 함수
 function startPythonProcess() {
+  if (PYTHON_SOCKET_PATH) {
+    connectPythonDaemon();
+    return;
+  }
   if (!pythonProcess) {
     const pythonScriptPath = path.join(__dirname, '../algorithm/script/unified_script.py');
-    pythonProcess = spawn('python', [pythonScriptPath]);
+    pythonProcess = spawn('python', [pythonScriptPath, '--protocol', PYTHON_PROTOCOL]);
+    pythonWriter = pythonProcess.stdin;
+    pythonReady = false;
+    resetPythonDecoder();
 
     let return_query_error = '';
 
+    pythonProcess.stdout.on('data', handlePythonOutput);
+
     // 파이썬 에러 로그 출력
     pythonProcess.stderr.on('data', (error) => {
       return_query_error += error.toString();
@@ -21,6 +259,9 @@ function startPythonProcess() {
     // 파이썬 프로세스가 종료되면 다시 시작
     pythonProcess.on('close', (code) => {
       console.log(`Python 프로세스가 종료되었습니다. 코드: ${code}`);
+      pythonProcess = null;
+      pythonWriter = null;
+      rejectPendingPythonRequests('Python 프로세스가 종료되었습니다.');
       startPythonProcess();
     });
     console.log('Python process start');
@@ -77,110 +318,109 @@ const postChatbotData = async (req, res) => {
     `, [user_id, message, null, 1]);
 
     if (message !== '!help') {
+      // 동시에 처리 중인 다른 대화와 구분하기 위한 요청 ID
+      const requestId = `${process.pid}-${Date.now()}-${++pythonRequestSequence}`;
 
-      // Python 프로세스에 message와 user_id를 JSON 형식으로 전달
-      const inputData_fir = JSON.stringify({ message, user_id });
-
-      // JSON 데이터를 파이썬 프로세스에 전달
-      pythonProcess.stdin.write(`${inputData_fir}\n`);
-      let return_query_data = '';
+      try {
+        let parsedData;
+        let localAnswer;
+        try {
+          // Python 프로세스에 message와 user_id를 전달하고 실행할 쿼리를 받음
+          // 보관된 거래/주가 색인으로 바로 계산할 수 있으면 answer도 함께 옴
+          // 월 집계 테이블이 준비되지 않았으면 monthly_rollup: false로 거래 테이블만 조회하도록 함
+          const firstReply = await requestPython({ request_id: requestId, message, user_id, monthly_rollup: isMonthlyRollupReady() });
+          parsedData = firstReply.query;
+          localAnswer = firstReply.answer;
+        } catch (error) {
+          console.error('에러 코드: PROC_002 - 챗봇 데이터 처리 중 에러:', error.message);
+          res.status(500).json({ error: '서버 내부 오류', code: 'PROC_002' });
+          return;
+        }
 
-      // Python stdout으로부터 데이터를 읽음
-      pythonProcess.stdout.once('data', async (data) => {
-        return_query_data += data.toString('utf8');
-        if (!return_query_data) {
+        if (!parsedData) {
           res.json({ data: '질문 의도를 파악하지 못했습니다. \n 다시 질문해주세요.' });
           return;
         }
-        
-        // <END>가 있는지 확인하여 끝에 도달했는지 확인
-        if (return_query_data.includes("<END>")) {
-          return_query_data = return_query_data.replace("<END>", "");  // <END> 구분자를 제거
-          
-          try {
-            const parsedData = JSON.parse(return_query_data);  // Python에서 전달받은 데이터를 JSON으로 파싱
-            
-            let return_message_data = '';  // 최종 결과 저장 변수
-            let executedQueries = [];  // 실행된 쿼리 목록을 저장할 배열
-            let queryResult = null;
-
-            // 파싱된 데이터를 key와 query로 분리하여 처리 // [변경사항]예외처리
-            for (const [key, query] of Object.entries(parsedData)) {
-              
-              if (key.includes("예외") || key.includes("링크") || key.toUpperCase().includes("FAQ") || key.toUpperCase().includes("증시")) {
-                queryResult = query;
-                executedQueries.push(query);  // 실행된 쿼리를 기록
-              } else {
-                // 각 쿼리 실행
-                queryResult = await pool.query(query);
-                executedQueries.push(query);  // 실행된 쿼리를 기록
-              }
-
-              if (!queryResult) {
-                res.json({ data: '질문 의도를 파악하지 못했습니다. \n다시 질문해주세요.' })
-              }
-
-              // Python에 전달할 데이터를 JSON으로 구성
-              const inputData_sec = JSON.stringify({ key, queryResult });
-
-              // Python 프로세스에 쿼리 결과 전달
-              pythonProcess.stdin.write(`${inputData_sec}\n`);
-
-              // 파이썬에서 최종 메시지를 수신
-              const finalMessage = await new Promise((resolve) => {
-                pythonProcess.stdout.once('data', (data) => {
-                  resolve(data.toString('utf8'));
-                });
-              });
-
-              // 각 결과를 누적하여 최종 메시지로 연결
-              return_message_data += finalMessage.trim() + '\n\n';
-            }
-
-            // 마지막에 누적된 메시지와 실행된 쿼리들을 DB에 저장
-            try {
-              await pool.query(`
-                INSERT INTO tb_chat_bot (user_id, cb_text, cb_query, cb_division)
-                VALUES (?, ?, ?, ?);
-              `, [user_id, JSON.parse(return_message_data.trim()), JSON.stringify(executedQueries), 0]);
-              } catch (error) {
-                await pool.query(`
-                  INSERT INTO tb_chat_bot (user_id, cb_text, cb_query, cb_division)
-                  VALUES (?, ?, ?, ?);
-                `, [user_id, return_message_data.trim(), JSON.stringify(executedQueries), 0]);
-              }
-            // 모든 쿼리 실행 후 최종 결과 반환
-            const newChatIdResult = await pool.query(`
-              SELECT cb_id
-              FROM tb_chat_bot
-              WHERE user_id = ?
-              ORDER BY cb_id DESC
-              LIMIT 1;
-            `, [user_id]);
-
-            const newChatId = newChatIdResult[0].cb_id;
-
-            // 최종 결과를 클라이언트에 전달
-            if (return_message_data.includes("\\u")) {
-              return_message_data = JSON.parse(return_message_data.trim());
-            }
-            res.json({ data: return_message_data.trim(), newChatId });
-
-            // --- 모든 변수 초기화 ---
-            return_message_data = '';
-            executedQueries = [];
-            queryResult = null;
-            return_query_data = '';
 
-          } catch (error) {
-            console.error('에러 코드: PROC_001 - 챗봇 데이터 처리 중 에러:', error);
-            res.status(500).json({ error: '서버 내부 오류', code: 'PROC_001' });
+        let return_message_data = '';  // 최종 결과 저장 변수
+        let executedQueries = [];  // 실행된 쿼리 목록을 저장할 배열
+        let queryResult = null;
+        const queryResults = {};  // 키별 쿼리 결과 (한 번에 Python으로 전달)
+
+        // 파싱된 데이터를 key와 query로 분리하여 처리 // [변경사항]예외처리
+        for (const [key, query] of Object.entries(localAnswer === undefined ? parsedData : {})) {
+
+          // 파이썬이 보관용으로 추가한 조회는 결과만 전달하고 대화 기록에는 남기지 않음
+          if (key.startsWith(PYTHON_LOAD_KEY_PREFIX)) {
+            queryResults[key] = toColumnar(await pool.execute(query.sql, query.params));
+            continue;
           }
+
+          if (key.includes("예외") || key.includes("링크") || key.toUpperCase().includes("FAQ") || key.toUpperCase().includes("증시")) {
+            queryResult = query;
+            executedQueries.push(query);  // 실행된 쿼리를 기록
+          } else if (query && typeof query === 'object') {
+            // 문장 + 바인딩 값({ sql, params })은 prepared statement로 실행 (같은 문장은 커넥션별 캐시 재사용)
+            queryResult = await pool.execute(query.sql, query.params);
+            executedQueries.push(query);  // 실행된 쿼리를 기록
+          } else {
+            // 각 쿼리 실행
+            queryResult = await pool.query(query);
+            executedQueries.push(query);  // 실행된 쿼리를 기록
+          }
+
+          if (!queryResult) {
+            res.json({ data: '질문 의도를 파악하지 못했습니다. \n다시 질문해주세요.' })
+          }
+
+          queryResults[key] = toColumnar(queryResult);
+        }
+
+        if (localAnswer !== undefined) {
+          // DB 조회와 두 번째 요청 없이 파이썬이 계산한 답변 사용 (대화 기록에는 계산한 쿼리를 남김)
+          executedQueries = Object.values(parsedData);
+          return_message_data = String(localAnswer);
         } else {
-          console.error('에러 코드: PROC_002 - 챗봇 데이터 처리 중 에러:', return_query_data);
-          res.status(500).json({ error: '서버 내부 오류', code: 'PROC_002' });
+          // 모든 키의 쿼리 결과를 한 번에 Python에 전달하고, 키 순서대로 조합된 최종 메시지를 수신
+          const { answer } = await requestPython({ request_id: requestId, user_id, results: queryResults });
+          return_message_data = String(answer);
         }
-      });
+
+        // 마지막에 누적된 메시지와 실행된 쿼리들을 DB에 저장
+        try {
+          await pool.query(`
+            INSERT INTO tb_chat_bot (user_id, cb_text, cb_query, cb_division)
+            VALUES (?, ?, ?, ?);
+          `, [user_id, JSON.parse(return_message_data.trim()), JSON.stringify(executedQueries), 0]);
+          } catch (error) {
+            await pool.query(`
+              INSERT INTO tb_chat_bot (user_id, cb_text, cb_query, cb_division)
+              VALUES (?, ?, ?, ?);
+            `, [user_id, return_message_data.trim(), JSON.stringify(executedQueries), 0]);
+          }
+        // 모든 쿼리 실행 후 최종 결과 반환
+        const newChatIdResult = await pool.query(`
+          SELECT cb_id
+          FROM tb_chat_bot
+          WHERE user_id = ?
+          ORDER BY cb_id DESC
+          LIMIT 1;
+        `, [user_id]);
+
+        const newChatId = newChatIdResult[0].cb_id;
+
+        // 최종 결과를 클라이언트에 전달
+        if (return_message_data.includes("\\u")) {
+          return_message_data = JSON.parse(return_message_data.trim());
+        }
+        res.json({ data: return_message_data.trim(), newChatId });
+
+      } catch (error) {
+        console.error('에러 코드: PROC_001 - 챗봇 데이터 처리 중 에러:', error);
+        res.status(500).json({ error: '서버 내부 오류', code: 'PROC_001' });
+      } finally {
+        closePythonRequest(requestId);
+      }
     } else {
       return_message_data = '안녕하세요. <br /><br />MAP beta ver 0.1 챗봇 서비스는 <br /><br />현재 재무현황과 주가 관련 정보만을 제공하고 있으며, <br /><br />한 문장에 한 가지 질문에 대해서만 답변이 가능합니다. <br /><br />이부분 유의하여 이용 부탁드립니다. <br /><br />감사합니다. ( _ _ )';
       executedQueries = '';
@@ -249,4 +489,5 @@ module.exports = {
   getChatList,
   getChatDetail,
   startPythonProcess,
+  invalidateFinanceCache,
 };
\ No newline at end of file
@@ -1,4 +1,6 @@
 const pool = require('../config/database');
+const { addToMonthlyRollup } = require('../config/monthlyRollup');
+const { invalidateFinanceCache } = require('./chatbotController');
 
 // 계좌 번호 확인 API
 const checkUserBankAccount = async (req, res) => {
@@ -858,8 +860,10 @@ const saveInvestments = async (req, res) => {
         INSERT INTO tb_received_paid (user_id, rp_date, rp_detail, rp_amount, rp_hold, rp_part)
         VALUES (?, ?, ?, ?, 1, ?)
       `, [userId, date, transactionDetail, totalAmount, action === 'buy' ? 1 : 0]);
+      await addToMonthlyRollup(connection, { userId, date, detail: transactionDetail, amount: totalAmount, hold: 1, part: action === 'buy' ? 1 : 0 });
     }
     await connection.commit(); // 트랜잭션 성공 시 커밋
+    invalidateFinanceCache(userId); // 챗봇이 보관 중인 거래와 보유 수량 갱신
     res.status(200).json({ message: "Investments saved successfully" });
 
   } catch (error) {